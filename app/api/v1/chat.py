@@ -1,18 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, func, insert, or_, select, true, tuple_, update
 from pydantic import BaseModel
+import json
 import uuid
-from typing import List, Optional
+import asyncio
+import logging
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Literal, Optional, Tuple
 
 # Imports do seu projeto
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_async_db, AsyncSessionLocal
+from app.core.metrics import REQUEST_STAGE_SECONDS
 from app.models.schemas import User, Conversation, Message, SenderType
 from app.services.backend.auth import get_current_user
 # Import do Agente de IA (certifique-se que o caminho está correto)
-from app.services.ai.agent import get_chat_response
+from app.services.ai.agent import aget_chat_response, astream_chat_response
+from app.services.ai.summary import aupdate_conversation_summary
 
 router = APIRouter(tags=["Chat Operations"])
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 200
 
 class CreateConversationRequest(BaseModel):
     title: str = "Nova Conversa"
@@ -24,6 +38,8 @@ class ConversationResponse(BaseModel):
 
 class MessageRequest(BaseModel):
     content: str
+    # "vector" ou "hybrid"; se omitido usa RETRIEVAL_MODE
+    retrieval_mode: Optional[Literal["vector", "hybrid"]] = None
 
 class MessageResponse(BaseModel):
     id: uuid.UUID
@@ -35,154 +51,360 @@ class MessageResponse(BaseModel):
         from_attributes = True
 
 
+def _encode_cursor(created_at: datetime, row_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def conversations_page_query(user_id: uuid.UUID, limit: int, before: Optional[Tuple[datetime, uuid.UUID]] = None):
+    """
+    Página de conversas (mais recentes primeiro) só com as colunas da resposta,
+    por keyset em (created_at, id): custo constante em qualquer página, usando
+    o índice (user_id, created_at, id).
+    """
+    query = (
+        select(
+            Conversation.id,
+            Conversation.title,
+            Conversation.created_at,
+            func.to_char(Conversation.created_at, "YYYY-MM-DD HH24:MI").label("created_at_display"),
+        )
+        .where(Conversation.user_id == user_id)
+        .order_by(desc(Conversation.created_at), desc(Conversation.id))
+        .limit(limit)
+    )
+    if before:
+        query = query.where(tuple_(Conversation.created_at, Conversation.id) < before)
+    return query
+
+
+def messages_page_query(conversation_id: uuid.UUID, limit: int, before: Optional[Tuple[datetime, uuid.UUID]] = None):
+    """
+    Página de mensagens (mais recentes primeiro) por keyset em (created_at, id),
+    usando o índice (conversation_id, created_at, id).
+    """
+    query = (
+        select(
+            Message.id,
+            Message.sender_type,
+            Message.content,
+            Message.created_at,
+            func.to_char(Message.created_at, "HH24:MI").label("created_at_display"),
+        )
+        .where(Message.conversation_id == conversation_id)
+        .order_by(desc(Message.created_at), desc(Message.id))
+        .limit(limit)
+    )
+    if before:
+        query = query.where(tuple_(Message.created_at, Message.id) < before)
+    return query
+
+
 @router.get("/conversations", response_model=List[ConversationResponse])
-def list_conversations(
-    db: Session = Depends(get_db),
+async def list_conversations(
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     user: User = Depends(get_current_user)
 ):
     """
-    Retorna a lista de todas as conversas do usuário atual.
+    Retorna as conversas do usuário atual, das mais recentes para as mais antigas.
+    Paginação por cursor: se houver mais páginas, o header `X-Next-Cursor`
+    traz o valor a passar em `cursor` na próxima chamada.
     """
-    conversations = (
-        db.query(Conversation)
-        .filter(Conversation.user_id == user.id)
-        .order_by(desc(Conversation.created_at))
-        .all()
-    )
-    
+    before = _decode_cursor(cursor) if cursor else None
+    rows = (await db.execute(conversations_page_query(user.id, limit + 1, before))).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
     return [
-        ConversationResponse(
-            id=c.id,
-            title=c.title,
-            created_at=c.created_at.strftime("%Y-%m-%d %H:%M")
-        ) for c in conversations
+        ConversationResponse(id=row.id, title=row.title, created_at=row.created_at_display)
+        for row in rows
     ]
 
 @router.post("/conversations", response_model=ConversationResponse)
-def create_conversation(
+async def create_conversation(
     request: CreateConversationRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: User = Depends(get_current_user),
 ):
     """
     Cria uma nova conversa para o usuário atual.
     """
     new_id = uuid.uuid4()
-    
+
     new_conv = Conversation(id=new_id, user_id=user.id, title=request.title)
     db.add(new_conv)
-    db.commit()
-    db.refresh(new_conv)
+    await db.commit()
+    await db.refresh(new_conv)
 
     return ConversationResponse(
-        id=new_conv.id, 
-        title=new_conv.title, 
+        id=new_conv.id,
+        title=new_conv.title,
         created_at=new_conv.created_at.strftime("%Y-%m-%d %H:%M")
     )
 
 @router.get("/conversations/{conversation_id}", response_model=List[MessageResponse])
-def get_conversation_history(
+async def get_conversation_history(
     conversation_id: str,
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     user: User = Depends(get_current_user)
 ):
     """
     Obtém o histórico de mensagens de uma conversa específica.
+    Devolve as `limit` mensagens mais recentes em ordem cronológica; o header
+    `X-Next-Cursor` (se presente) busca a página de mensagens anteriores.
     """
     try:
         conv_uuid = uuid.UUID(conversation_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    chat = db.query(Conversation).filter(Conversation.id == conv_uuid, Conversation.user_id == user.id).first()
-    if not chat:
+    owned = (
+        await db.execute(
+            select(Conversation.id).where(Conversation.id == conv_uuid, Conversation.user_id == user.id)
+        )
+    ).first()
+    if not owned:
         raise HTTPException(status_code=404, detail="Conversa não encontrada.")
 
-    messages = db.query(Message).filter(Message.conversation_id == conv_uuid).order_by(Message.created_at.asc()).all()
-    
+    before = _decode_cursor(cursor) if cursor else None
+    rows = (await db.execute(messages_page_query(conv_uuid, limit + 1, before))).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
     return [
         MessageResponse(
-            id=m.id,
-            sender=m.sender_type.value,
-            content=m.content,
-            created_at=m.created_at.strftime("%H:%M")
-        ) for m in messages
+            id=row.id,
+            sender=row.sender_type.value,
+            content=row.content,
+            created_at=row.created_at_display
+        ) for row in reversed(rows)
     ]
 
-@router.post("/conversations/{conversation_id}/messages", response_model=MessageResponse)
-async def send_message(
-    conversation_id: str,
-    request: MessageRequest,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
+@dataclass
+class _TurnContext:
+    conversation_id: uuid.UUID
+    summary: Optional[str]
+    received_at: datetime
+    chat_history: List[dict]
+
+
+async def _load_turn_context(conversation_id: str, user: User, content: str) -> _TurnContext:
     """
-    Envia uma nova mensagem para a conversa especificada.
+    Checa a posse da conversa e carrega todas as mensagens ainda não resumidas
+    (até HISTORY_MAX_MESSAGES) numa única query, com sessão própria: a conexão
+    volta ao pool antes da chamada ao LLM. O corte do que entra no prompt é
+    por tokens, em `pack_history`.
     """
     try:
         conv_uuid = uuid.UUID(conversation_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="ID de conversa inválido")
 
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conv_uuid, 
-        Conversation.user_id == user.id
-    ).first()
+    recent = (
+        select(Message.id, Message.sender_type, Message.content, Message.created_at)
+        .where(
+            Message.conversation_id == Conversation.id,
+            or_(Conversation.summarized_until.is_(None), Message.created_at > Conversation.summarized_until),
+        )
+        .order_by(desc(Message.created_at), desc(Message.id))
+        .limit(settings.HISTORY_MAX_MESSAGES)
+        .lateral()
+    )
+    query = (
+        select(
+            Conversation.summary,
+            # Relógio do banco: ordena a pergunta antes da resposta gravada depois
+            func.now().label("received_at"),
+            recent.c.sender_type,
+            recent.c.content,
+        )
+        .outerjoin(recent, true())
+        .where(Conversation.id == conv_uuid, Conversation.user_id == user.id)
+        .order_by(recent.c.created_at.asc(), recent.c.id.asc())
+    )
+    with REQUEST_STAGE_SECONDS.time("history_fetch"):
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
 
-    if not conversation:
+    if not rows:
         raise HTTPException(status_code=404, detail="Conversa não encontrada.")
 
-    user_msg = Message(
-        conversation_id=conversation.id,
-        sender_type=SenderType.USER,
-        content=request.content,
-    )
-    db.add(user_msg)
-    db.commit()
-
-    # Recuperar histórico para contexto (RAG)
-    # Pegamos as últimas 10, ordenamos por data desc para pegar as recentes,
-    # depois invertemos [::-1] para mandar cronologicamente para a IA
-    past_messages_objs = (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation.id)
-        .order_by(desc(Message.created_at))
-        .limit(10)
-        .all()
+    chat_history = [
+        {"role": "user" if row.sender_type == SenderType.USER else "assistant", "content": row.content}
+        for row in rows
+        if row.sender_type is not None
+    ]
+    # A pergunta atual só é gravada junto com a resposta, mas entra no histórico do prompt
+    chat_history.append({"role": "user", "content": content})
+    return _TurnContext(conv_uuid, rows[0].summary, rows[0].received_at, chat_history)
+
+
+async def _save_turn(turn: _TurnContext, user_content: str, answer: str) -> MessageResponse:
+    """
+    Grava pergunta, resposta e título da conversa numa única transação; os
+    dados da resposta vêm do RETURNING, sem `refresh`.
+    """
+    with REQUEST_STAGE_SECONDS.time("persistence"):
+        async with AsyncSessionLocal() as db:
+            saved = (
+                await db.execute(
+                    insert(Message)
+                    .values(
+                        [
+                            {
+                                "id": uuid.uuid4(),
+                                "conversation_id": turn.conversation_id,
+                                "sender_type": SenderType.USER,
+                                "content": user_content,
+                                "created_at": turn.received_at,
+                            },
+                            {
+                                "id": uuid.uuid4(),
+                                "conversation_id": turn.conversation_id,
+                                "sender_type": SenderType.ASSISTANT,
+                                "content": answer,
+                                # INSERT multi-linha exige o mesmo conjunto de colunas em todas
+                                "created_at": func.now(),
+                            },
+                        ]
+                    )
+                    .returning(
+                        Message.id,
+                        Message.sender_type,
+                        func.to_char(Message.created_at, "HH24:MI").label("created_at_display"),
+                    )
+                )
+            ).all()
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id == turn.conversation_id, Conversation.title == "Nova Conversa")
+                .values(title=user_content[:30] + "...")
+            )
+            await db.commit()
+
+    ai_row = next(row for row in saved if row.sender_type == SenderType.ASSISTANT)
+    return MessageResponse(
+        id=ai_row.id,
+        sender=ai_row.sender_type.value,
+        content=answer,
+        created_at=ai_row.created_at_display,
     )
-    past_messages_objs = past_messages_objs[::-1]
 
-    chat_history = []
-    for msg in past_messages_objs:
-        role = "user" if msg.sender_type == SenderType.USER else "assistant"
-        chat_history.append({"role": role, "content": msg.content})
+
+@router.post("/conversations/{conversation_id}/messages", response_model=MessageResponse)
+async def send_message(
+    conversation_id: str,
+    request: MessageRequest,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(get_current_user),
+):
+    """
+    Envia uma nova mensagem para a conversa especificada.
+
+    O banco é usado em dois momentos curtos (contexto antes do LLM, gravação
+    depois), sem segurar conexão durante a geração. Se a IA falhar nada é gravado.
+    """
+    turn = await _load_turn_context(conversation_id, user, request.content)
 
     try:
-        response_text = get_chat_response(
-            message=request.content, 
-            chat_history=chat_history, 
-            user_id=str(user.id)
+        response_text = await aget_chat_response(
+            message=request.content,
+            chat_history=turn.chat_history,
+            user_id=str(user.id),
+            retrieval_mode=request.retrieval_mode,
+            summary=turn.summary,
         )
     except Exception as e:
-        print(f"Erro na IA: {e}")
+        logger.exception("Erro na IA", extra={"conversation_id": str(turn.conversation_id), "error": str(e)})
         raise HTTPException(status_code=500, detail="Erro ao processar resposta da IA.")
 
-    ai_msg = Message(
-        conversation_id=conversation.id,
-        sender_type=SenderType.ASSISTANT,
-        content=response_text,
-    )
-    db.add(ai_msg)
-    db.commit()
-    db.refresh(ai_msg)
+    ai_msg = await _save_turn(turn, request.content, response_text)
 
-    if conversation.title == "Nova Conversa":
-        conversation.title = request.content[:30] + "..."
-        db.commit()
+    # Resumo incremental do histórico roda depois que a resposta foi enviada
+    background_tasks.add_task(aupdate_conversation_summary, turn.conversation_id)
 
-    return MessageResponse(
-        id=ai_msg.id,
-        sender=ai_msg.sender_type.value,
-        content=ai_msg.content,
-        created_at=ai_msg.created_at.strftime("%H:%M")
-    )
\ No newline at end of file
+    return ai_msg
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/conversations/{conversation_id}/messages/stream")
+async def send_message_stream(
+    conversation_id: str,
+    request: MessageRequest,
+    http_request: Request,
+    user: User = Depends(get_current_user),
+):
+    """
+    Envia uma nova mensagem e devolve a resposta via Server-Sent Events:
+    `sources` (trechos recuperados), vários `token` e, ao final, `done` com a
+    mensagem persistida. Se o cliente desconectar, a geração é interrompida e
+    o texto parcial é salvo; se a IA falhar no meio, nada é gravado.
+    """
+    turn = await _load_turn_context(conversation_id, user, request.content)
+    conv_id = turn.conversation_id
+    user_id = str(user.id)
+
+    async def event_stream():
+        events = astream_chat_response(
+            message=request.content,
+            chat_history=turn.chat_history,
+            user_id=user_id,
+            retrieval_mode=request.retrieval_mode,
+            summary=turn.summary,
+        )
+        answer_parts = []
+        # complete: o LLM terminou; disconnected: o cliente saiu (inclusive por
+        # cancelamento do generator pelo Starlette); failed: erro no meio do stream
+        outcome = "disconnected"
+        ai_msg = None
+        try:
+            async for event, data in events:
+                if await http_request.is_disconnected():
+                    logger.info("Cliente desconectou do stream", extra={"conversation_id": str(conv_id)})
+                    break
+                if event == "token":
+                    answer_parts.append(data)
+                yield _sse(event, data)
+            else:
+                outcome = "complete"
+        except Exception as e:
+            outcome = "failed"
+            logger.exception("Erro na IA", extra={"conversation_id": str(conv_id), "error": str(e)})
+            yield _sse("error", {"detail": "Erro ao processar resposta da IA."})
+        finally:
+            # Fecha o stream do LLM (interrompe a geração de tokens não lidos)
+            await events.aclose()
+            # Resposta completa ou parcial de quem desconectou é gravada; a truncada por
+            # erro não. Blindada: o cancelamento do generator não interrompe a gravação.
+            if outcome != "failed" and answer_parts:
+                ai_msg = await asyncio.shield(_save_turn(turn, request.content, "".join(answer_parts)))
+
+        if outcome == "complete" and ai_msg is not None:
+            yield _sse("done", ai_msg.model_dump())
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(aupdate_conversation_summary, conv_id),
+    )
@@ -1,22 +1,31 @@
 from typing import List, Optional
+import json
 import uuid
-import os
+import asyncio
+from datetime import datetime
 from pathlib import Path
 
-from fastapi.responses import FileResponse
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_db, AsyncSessionLocal
 from app.models.schemas import Document, User
-from app.services.backend.auth import RoleChecker, get_current_user
-from app.services.backend.storage import save_upload_file
-from app.services.ai.ingestion import process_document
-from app.services.ai.vector import delete_vectors_by_document_id
+from app.services.backend.auth import RoleChecker, get_current_user, get_current_user_introspected
+from app.services.backend.storage import StoredFile, save_upload_file
+from app.services.backend.jobs import enqueue_ingestion
+from app.services.backend.deletion import mark_documents_deleting
+from app.services.backend.progress import RUNNING_STAGES, estimate_progress, is_finished, progress_hub
 
 router = APIRouter(tags=["Documents"])
 allow_admin_only = RoleChecker(["admin"])
+# Deleções: o token é revalidado no Keycloak (revogação) na mesma dependência
+allow_admin_only_introspected = RoleChecker(["admin"], user_dependency=get_current_user_introspected)
 
 class DocumentResponse(BaseModel):
     id: uuid.UUID
@@ -29,6 +38,58 @@ class DocumentResponse(BaseModel):
         from_attributes = True
 
 
+class DocumentStatusResponse(BaseModel):
+    id: uuid.UUID
+    filename: str
+    status: str
+    stage: Optional[str] = None
+    pages_total: Optional[int] = None
+    pages_extracted: int = 0
+    chunks_embedded: int = 0
+    progress: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+# Só as colunas do status: leitura por chave primária, sem carregar o documento
+STATUS_COLUMNS = (
+    Document.id,
+    Document.filename,
+    Document.status,
+    Document.ingestion_stage,
+    Document.pages_total,
+    Document.pages_extracted,
+    Document.total_chunks,
+    Document.ingestion_error,
+    Document.progress_started_at,
+    Document.progress_updated_at,
+)
+
+
+def _document_status(row) -> DocumentStatusResponse:
+    progress, eta = estimate_progress(
+        row.pages_total, row.pages_extracted, row.progress_started_at, row.progress_updated_at
+    )
+    return DocumentStatusResponse(
+        id=row.id,
+        filename=row.filename,
+        status=row.status,
+        stage=row.ingestion_stage,
+        pages_total=row.pages_total,
+        pages_extracted=row.pages_extracted or 0,
+        chunks_embedded=row.total_chunks or 0,
+        progress=progress,
+        eta_seconds=eta if row.ingestion_stage in RUNNING_STAGES else None,
+        error=row.ingestion_error,
+        updated_at=row.progress_updated_at,
+    )
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
 @router.get("/documents", response_model=List[DocumentResponse], dependencies=[Depends(allow_admin_only)])
 def list_documents(db: Session = Depends(get_db)):
     """
@@ -48,57 +109,269 @@ def list_documents(db: Session = Depends(get_db)):
 
 @router.post("/documents", dependencies=[Depends(allow_admin_only)])
 async def create_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user)
 ):
     """
-    Faz upload de um novo documento.
+    Faz upload de um novo documento e enfileira a ingestão para o worker.
     """
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Apenas PDF.")
 
-    file_path = await save_upload_file(file)
+    stored = await save_upload_file(file)
+    # Sessão síncrona: as queries rodam numa thread, fora do event loop
+    return await run_in_threadpool(_register_upload, db, file.filename, stored, user.id)
+
+
+def _find_same_content(db: Session, sha256: str, user_id):
+    # O retrieval é filtrado pelo dono, então o documento de outro usuário não serve
+    return (
+        db.query(Document.id, Document.status)
+        .filter(
+            Document.content_hash == sha256,
+            Document.uploaded_by == user_id,
+            Document.status.notin_(["error", "deleting"]),
+        )
+        .first()
+    )
+
+
+def _register_upload(db: Session, filename: str, stored: StoredFile, user_id) -> dict:
+    # Re-upload idêntico do mesmo usuário: reaproveita o documento sem reprocessar
+    existing = _find_same_content(db, stored.sha256, user_id)
+    if existing:
+        return {"id": existing.id, "status": existing.status, "message": "Documento idêntico já enviado. Ingestão ignorada."}
 
+    doc_id = uuid.uuid4()
     new_doc = Document(
-        filename=file.filename,
-        status="processing", 
-        uploaded_by=user.id,
-        file_path=file_path
+        id=doc_id,
+        filename=filename,
+        status="pending",
+        uploaded_by=user_id,
+        file_path=stored.path,
+        content_hash=stored.sha256,
     )
-    
+
     db.add(new_doc)
+    # Documento e job na mesma transação: um restart nunca deixa documento órfão
+    enqueue_ingestion(db, new_doc)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Upload idêntico concorrente gravou antes (índice único por usuário e conteúdo)
+        db.rollback()
+        existing = _find_same_content(db, stored.sha256, user_id)
+        if existing is None:
+            raise
+        return {"id": existing.id, "status": existing.status, "message": "Documento idêntico já enviado. Ingestão ignorada."}
+
+    return {"id": doc_id, "status": "pending", "message": "Upload recebido. Ingestão enfileirada."}
+
+
+@router.put("/documents/{doc_id}/content", dependencies=[Depends(allow_admin_only)])
+async def replace_document_content(
+    doc_id: str,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+):
+    """
+    Substitui o conteúdo de um documento ativo por uma nova versão do arquivo.
+    O worker re-embeda só os chunks que mudaram; até lá o documento segue
+    servindo o conteúdo anterior.
+    """
+    try:
+        uuid_id = uuid.UUID(doc_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID inválido.")
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Apenas PDF.")
+
+    await run_in_threadpool(_replaceable_document, db, uuid_id)
+    stored = await save_upload_file(file)
+    return await run_in_threadpool(_enqueue_replacement, db, uuid_id, stored)
+
+
+def _check_replaceable(doc):
+    if not doc:
+        raise HTTPException(status_code=404, detail="Documento não encontrado.")
+    if doc.status != "active":
+        raise HTTPException(status_code=409, detail=f"Documento em `{doc.status}`; só documentos ativos podem ser atualizados.")
+
+
+def _replaceable_document(db: Session, doc_id: uuid.UUID):
+    # Valida antes de receber o arquivo, sem manter a transação aberta durante o upload
+    doc = db.query(Document.status).filter(Document.id == doc_id).first()
+    db.rollback()
+    _check_replaceable(doc)
+
+
+def _enqueue_replacement(db: Session, doc_id: uuid.UUID, stored: StoredFile) -> dict:
+    # Revalida com a linha travada: o documento pode ter mudado durante o upload
+    doc = db.query(Document).filter(Document.id == doc_id).with_for_update().first()
+    _check_replaceable(doc)
+    if stored.sha256 == doc.content_hash:
+        db.rollback()
+        return {"id": doc_id, "status": "active", "message": "Conteúdo idêntico ao atual. Nada a atualizar."}
+    other = _find_same_content(db, stored.sha256, doc.uploaded_by)
+    if other:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"O documento {other.id} já tem este conteúdo.")
+
+    enqueue_ingestion(db, doc, kind="replace", file_path=stored.path)
     db.commit()
-    db.refresh(new_doc)
 
-    background_tasks.add_task(process_document, new_doc.id, file_path)
+    return {"id": doc_id, "status": "active", "message": "Nova versão recebida. Atualização incremental enfileirada."}
 
-    return {"id": new_doc.id, "status": "processing", "message": "Upload iniciado."}
 
-@router.delete("/documents/{doc_id}", dependencies=[Depends(allow_admin_only)])
+@router.get("/documents/{doc_id}/status", response_model=DocumentStatusResponse, dependencies=[Depends(allow_admin_only)])
+def get_document_status(doc_id: str, db: Session = Depends(get_db)):
+    """
+    Status e progresso da ingestão de um documento (etapa, páginas, chunks,
+    ETA e erro). Para acompanhar sem polling, use `GET /documents/{id}/events`.
+    """
+    try:
+        uuid_id = uuid.UUID(doc_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID inválido.")
+
+    row = db.query(*STATUS_COLUMNS).filter(Document.id == uuid_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Documento não encontrado.")
+    return _document_status(row)
+
+
+@router.get("/documents/{doc_id}/events", dependencies=[Depends(allow_admin_only)])
+async def stream_document_status(doc_id: str, http_request: Request):
+    """
+    Acompanha a ingestão via Server-Sent Events: um `status` a cada mudança no
+    documento (empurrada por LISTEN/NOTIFY do Postgres) e o stream termina
+    quando a ingestão acaba (`done`/`failed`) ou o documento some (`deleted`).
+    """
+    try:
+        uuid_id = uuid.UUID(doc_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID inválido.")
+
+    async def read_status():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(*STATUS_COLUMNS).where(Document.id == uuid_id))).first()
+
+    if await read_status() is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado.")
+
+    async def event_stream():
+        # Assina antes de ler: nenhuma mudança entre a leitura e a espera se perde
+        async with progress_hub.subscribe(str(uuid_id)) as updates:
+            last = None
+            while True:
+                row = await read_status()
+                if row is None:
+                    yield _sse("deleted", {"id": str(uuid_id)})
+                    return
+                status = _document_status(row).model_dump(mode="json")
+                if status != last:
+                    yield _sse("status", status)
+                    last = status
+                if is_finished(row.status, row.ingestion_stage):
+                    return
+
+                try:
+                    await asyncio.wait_for(updates.get(), timeout=settings.PROGRESS_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await http_request.is_disconnected():
+                        return
+                    # Mantém proxies com a conexão aberta; a releitura cobre notificações perdidas
+                    yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class BulkDeleteRequest(BaseModel):
+    # Lista explícita de ids e/ou filtro; ao menos um critério é obrigatório
+    ids: Optional[List[uuid.UUID]] = None
+    uploaded_by: Optional[uuid.UUID] = None
+    status: Optional[str] = None
+    filename_contains: Optional[str] = None
+    uploaded_before: Optional[datetime] = None
+
+
+class DeletionProgressResponse(BaseModel):
+    id: uuid.UUID
+    filename: str
+    remaining_chunks: int
+
+
+@router.post("/documents/bulk-delete", dependencies=[Depends(allow_admin_only_introspected)])
+def bulk_delete_documents(request: BulkDeleteRequest, db: Session = Depends(get_db)):
+    """
+    Marca vários documentos para deleção. Eles somem do retrieval na hora; os
+    vetores, arquivos e registros são removidos em lotes pelo worker
+    (acompanhe em `GET /documents/deletions`).
+    """
+    conditions = []
+    if request.ids:
+        conditions.append(Document.id.in_(request.ids))
+    if request.uploaded_by:
+        conditions.append(Document.uploaded_by == request.uploaded_by)
+    if request.status:
+        conditions.append(Document.status == request.status)
+    if request.filename_contains:
+        conditions.append(Document.filename.ilike(f"%{request.filename_contains}%"))
+    if request.uploaded_before:
+        conditions.append(Document.upload_date < request.uploaded_before)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Informe ids ou ao menos um filtro.")
+
+    marked = mark_documents_deleting(db, conditions)
+    db.commit()
+
+    return {
+        "status": "deleting",
+        "documents": len(marked),
+        "chunks_to_purge": sum(row.total_chunks or 0 for row in marked),
+        "ids": [row.id for row in marked],
+    }
+
+
+@router.get("/documents/deletions", response_model=List[DeletionProgressResponse], dependencies=[Depends(allow_admin_only)])
+def list_pending_deletions(db: Session = Depends(get_db)):
+    """
+    Progresso das deleções: documentos ainda em `deleting` e quantos chunks
+    faltam purgar. Um documento some da lista quando termina.
+    """
+    rows = (
+        db.query(Document.id, Document.filename, Document.total_chunks)
+        .filter(Document.status == "deleting")
+        .order_by(Document.upload_date)
+        .all()
+    )
+    return [
+        DeletionProgressResponse(id=row.id, filename=row.filename, remaining_chunks=row.total_chunks or 0)
+        for row in rows
+    ]
+
+
+@router.delete("/documents/{doc_id}", dependencies=[Depends(allow_admin_only_introspected)])
 def delete_document(doc_id: str, db: Session = Depends(get_db)):
     """
-    Deleta um documento do banco e do disco.
+    Deleta um documento: some do retrieval imediatamente; vetores, arquivo e
+    registro são removidos em background pelo worker.
     """
     try:
         uuid_id = uuid.UUID(doc_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="ID inválido.")
 
-    doc = db.query(Document).filter(Document.id == uuid_id).first()
+    doc = db.query(Document.id, Document.status).filter(Document.id == uuid_id).first()
     
     if not doc:
         raise HTTPException(status_code=404, detail="Documento não encontrado.")
 
-    if doc.file_path and os.path.exists(doc.file_path):
-        try:
-            os.remove(doc.file_path)
-        except Exception as e:
-            print(f"Erro ao apagar arquivo: {e}")
-    
-    db.delete(doc)
+    mark_documents_deleting(db, [Document.id == uuid_id])
     db.commit()
 
-    return {"status": "success", "id": doc_id}
-
+    return {"status": "success", "id": doc_id, "document_status": "deleting"}
@@ -0,0 +1,301 @@
+"""
+Importação em massa de PDFs de um diretório (backfill de novos clientes), sem
+passar pela API: cada arquivo vira um `Document` processado por `process_document`.
+
+- Arquivos com conteúdo já ingerido (mesmo SHA-256) são pulados.
+- Extração de texto em intervalos de páginas num pool de processos, em
+  streaming (o PDF nunca é materializado inteiro); embeddings em lotes com
+  concorrência limitada (`--documents` x INGESTION_EMBED_CONCURRENCY).
+- O progresso fica em `app.import_files`: rodar de novo com o mesmo `--run`
+  retoma de onde parou.
+
+Uso:
+    uv run python -m app.bulk_import /dados/cliente-x --user admin@exemplo.com
+    uv run python -m app.bulk_import /dados/cliente-x --user admin@exemplo.com \\
+        --embeddings benchmarks.fakes:DeterministicFakeEmbeddings
+"""
+import os
+import time
+import logging
+import shutil
+import argparse
+import importlib
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.logging import configure_logging
+from app.models.schemas import Document, ImportFile, User
+from app.services.ai.ingestion import process_document
+from app.services.ai.tools import iter_pdf_pages
+from app.services.backend.storage import content_addressed_path, ensure_tmp_dir, file_sha256
+
+logger = logging.getLogger(__name__)
+
+SCAN_BATCH_SIZE = 1000
+REPORT_INTERVAL_SECONDS = 10
+
+
+def _iter_pdfs(root: Path) -> Iterator[Tuple[str, int]]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(dirpath, name)
+                yield os.path.abspath(path), os.path.getsize(path)
+
+
+def scan(run: str, root: Path) -> int:
+    """
+    Registra os PDFs do diretório como `pending`. Arquivos já registrados nesta
+    execução mantêm seu status (é isso que permite retomar).
+    """
+    found = 0
+    batch = []
+    with SessionLocal() as db:
+        for path, size in _iter_pdfs(root):
+            batch.append({"run": run, "path": path, "size": size, "status": "pending"})
+            found += 1
+            if len(batch) >= SCAN_BATCH_SIZE:
+                db.execute(insert(ImportFile).values(batch).on_conflict_do_nothing())
+                db.commit()
+                batch = []
+        if batch:
+            db.execute(insert(ImportFile).values(batch).on_conflict_do_nothing())
+            db.commit()
+    return found
+
+
+def _store(path: str, sha256: str) -> str:
+    # Mesmo layout endereçado por conteúdo dos uploads da API
+    final_path = content_addressed_path(sha256, ".pdf")
+    if not final_path.exists():
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = ensure_tmp_dir() / f"{sha256}.{os.getpid()}.{threading.get_ident()}.part"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, final_path)
+    return str(final_path.absolute())
+
+
+def _set_item(run: str, path: str, **values):
+    with SessionLocal() as db:
+        db.execute(update(ImportFile).where(ImportFile.run == run, ImportFile.path == path).values(**values))
+        db.commit()
+
+
+class _Progress:
+    def __init__(self, total: int, already_done: int):
+        self.total = total
+        self.done = already_done
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.chunks = 0
+        self.started = time.monotonic()
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, status: str, chunks: int = 0):
+        with self._lock:
+            self.done += 1
+            self.chunks += chunks
+            if status == "done":
+                self.processed += 1
+            elif status == "skipped":
+                self.skipped += 1
+            else:
+                self.failed += 1
+            now = time.monotonic()
+            if now - self._last_report >= REPORT_INTERVAL_SECONDS or self.done == self.total:
+                self._last_report = now
+                print(self.line())
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        handled = self.processed + self.skipped + self.failed
+        docs_per_min = handled / elapsed * 60
+        remaining = self.total - self.done
+        eta = remaining / (handled / elapsed) if handled else float("inf")
+        eta_str = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        return (
+            f"📊 Importação: {self.done}/{self.total} arquivos "
+            f"({self.processed} ingeridos, {self.skipped} pulados, {self.failed} com erro) | "
+            f"{docs_per_min:.1f} docs/min | {self.chunks / elapsed:.1f} chunks/s | ETA {eta_str}"
+        )
+
+
+class BulkImporter:
+    def __init__(self, run: str, user_id, extract_pool: ProcessPoolExecutor, embedder=None):
+        self.run = run
+        self.user_id = user_id
+        self.extract_pool = extract_pool
+        self.embedder = embedder
+
+    def _document_for(self, item: ImportFile, sha256: str) -> Optional[Document]:
+        """
+        Retorna o Document a processar, ou None se o conteúdo já foi ingerido
+        para `--user` (o retrieval é filtrado pelo dono do documento).
+        Um item interrompido no meio reaproveita o documento que já tinha criado.
+
+        O status `importing` (e não `processing`) evita que o worker da fila
+        trate o documento como preso e o reenfileire.
+        """
+        with SessionLocal() as db:
+            if item.document_id:
+                doc = db.query(Document).filter(Document.id == item.document_id).first()
+                if doc:
+                    return doc
+
+            existing = self._same_content(db, sha256)
+            if existing:
+                _set_item(self.run, item.path, status="skipped", content_hash=sha256, document_id=existing.id)
+                return None
+
+            doc = Document(
+                filename=os.path.basename(item.path),
+                status="importing",
+                uploaded_by=self.user_id,
+                file_path=_store(item.path, sha256),
+                content_hash=sha256,
+            )
+            db.add(doc)
+            db.flush()
+            # Documento e checkpoint na mesma transação
+            db.execute(
+                update(ImportFile)
+                .where(ImportFile.run == self.run, ImportFile.path == item.path)
+                .values(status="processing", content_hash=sha256, document_id=doc.id)
+            )
+            try:
+                db.commit()
+            except IntegrityError:
+                # Arquivo idêntico importado por outra thread ao mesmo tempo (índice único)
+                db.rollback()
+                existing = self._same_content(db, sha256)
+                if existing is None:
+                    raise
+                _set_item(self.run, item.path, status="skipped", content_hash=sha256, document_id=existing.id)
+                return None
+            db.refresh(doc)
+            return doc
+
+    def _same_content(self, db, sha256: str):
+        return (
+            db.query(Document.id)
+            .filter(
+                Document.content_hash == sha256,
+                Document.uploaded_by == self.user_id,
+                Document.status.notin_(["error", "deleting"]),
+            )
+            .first()
+        )
+
+    def _not_ingested(self, item: ImportFile, doc_id) -> Tuple[str, int]:
+        with SessionLocal() as db:
+            status = db.query(Document.status).filter(Document.id == doc_id).scalar()
+        if status is None or status == "deleting":
+            # Removido pela API durante a importação: não é falha do arquivo
+            _set_item(self.run, item.path, status="skipped", error="Documento removido durante a importação.")
+            return "skipped", 0
+        # Arquivo vazio ou ilegível: process_document já marcou o documento como `error`
+        _set_item(self.run, item.path, status="error", error="Arquivo vazio ou ilegível.")
+        return "error", 0
+
+    def import_file(self, item: ImportFile) -> Tuple[str, int]:
+        doc_id = None
+        try:
+            sha256 = file_sha256(item.path)
+            doc = self._document_for(item, sha256)
+            if doc is None:
+                return "skipped", 0
+            doc_id = doc.id
+
+            # Intervalos de páginas no pool do importador, no máximo dois em voo por documento
+            pages = iter_pdf_pages(doc.file_path, workers=1, pool=self.extract_pool)
+            chunks = process_document(doc.id, doc.file_path, raise_on_error=True, pages=pages, embedder=self.embedder)
+            if chunks == 0:
+                return self._not_ingested(item, doc.id)
+            _set_item(self.run, item.path, status="done", chunks=chunks, error=None)
+            return "done", chunks
+        except Exception as e:
+            logger.exception("Erro ao importar arquivo", extra={"run": self.run, "path": item.path, "error": str(e)})
+            _set_item(self.run, item.path, status="error", error=str(e))
+            if doc_id:
+                with SessionLocal() as db:
+                    db.query(Document).filter(Document.id == doc_id, Document.status != "deleting").update(
+                        {Document.status: "error"}, synchronize_session=False
+                    )
+                    db.commit()
+            return "error", 0
+
+
+def _load_embedder(spec: Optional[str]):
+    """`modulo:Classe` (ex.: benchmarks.fakes:DeterministicFakeEmbeddings) ou None para o modelo real."""
+    if not spec:
+        return None
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importação em massa (retomável) de PDFs de um diretório.")
+    parser.add_argument("root", type=Path)
+    parser.add_argument("--user", required=True, help="E-mail do usuário dono dos documentos.")
+    parser.add_argument("--run", help="Nome da execução (padrão: caminho do diretório). Reutilize para retomar.")
+    parser.add_argument("--documents", type=int, default=4, help="Documentos em processamento simultâneo.")
+    parser.add_argument("--extract-workers", type=int, default=settings.PDF_EXTRACT_WORKERS)
+    parser.add_argument("--retry-errors", action="store_true", help="Reprocessa arquivos que falharam antes.")
+    parser.add_argument("--embeddings", help="Classe de embeddings alternativa, no formato modulo:Classe.")
+    args = parser.parse_args()
+
+    configure_logging()
+    root = args.root.resolve()
+    run = args.run or str(root)
+
+    with SessionLocal() as db:
+        user = db.query(User.id).filter(User.email == args.user).first()
+    if not user:
+        raise SystemExit(f"Usuário {args.user} não encontrado (ele precisa ter feito login ao menos uma vez).")
+
+    found = scan(run, root)
+    statuses = ["pending", "processing"] + (["error"] if args.retry_errors else [])
+    with SessionLocal() as db:
+        items = (
+            db.query(ImportFile)
+            .filter(ImportFile.run == run, ImportFile.status.in_(statuses))
+            .order_by(ImportFile.path)
+            .all()
+        )
+        for item in items:
+            db.expunge(item)
+
+    already_done = found - len(items)
+    print(f"🚚 Importação '{run}': {found} PDFs encontrados, {already_done} já tratados, {len(items)} a processar.")
+    progress = _Progress(total=found, already_done=already_done)
+
+    with ProcessPoolExecutor(max_workers=max(args.extract_workers, 1)) as extract_pool:
+        importer = BulkImporter(run, user.id, extract_pool, _load_embedder(args.embeddings))
+        with ThreadPoolExecutor(max_workers=max(args.documents, 1)) as pool:
+            futures = [pool.submit(importer.import_file, item) for item in items]
+            try:
+                for future in as_completed(futures):
+                    status, chunks = future.result()
+                    progress.record(status, chunks)
+            except KeyboardInterrupt:
+                print("🛑 Importação interrompida; rode de novo com o mesmo --run para retomar.")
+                for future in futures:
+                    future.cancel()
+                raise
+
+    print(progress.line())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import json
+import logging
+from datetime import datetime, timezone
+
+from app.core.config import settings
+
+# Atributos padrão do LogRecord: todo o resto veio de `extra=` e vira campo do JSON
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED}
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legível, com os campos estruturados no fim como `chave=valor`."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{k}={v}" for k, v in _extra_fields(record).items())
+        return f"{line} {fields}" if fields else line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        payload.update(_extra_fields(record))
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    """
+    Configura o logger raiz (uma vez por processo). LOG_FORMAT=json emite uma
+    linha JSON por evento, com os campos passados em `extra=`.
+    """
+    root = logging.getLogger()
+    if getattr(root, "_docvault_configured", False):
+        return
+    handler = logging.StreamHandler()
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL)
+    root._docvault_configured = True
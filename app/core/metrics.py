@@ -0,0 +1,204 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from app.core.config import settings
+
+# Latências de ~1 ms (cache) a ~1 min (LLM/ingestão)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# Reutilizado quando as métricas estão desligadas: sem alocação por chamada
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: "Histogram", labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+
+class Histogram:
+    """
+    Histograma no formato de exposição do Prometheus (sem dependência do
+    prometheus_client). Por processo: com vários workers do uvicorn, cada um
+    expõe o seu e o Prometheus agrega.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ("stage",), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        if not settings.METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # [contagem por bucket (não cumulativa), soma, total]
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labelvalues: str):
+        """Context manager que observa a duração do bloco (no-op com métricas desligadas)."""
+        if not settings.METRICS_ENABLED:
+            return _NULL_TIMER
+        return _Timer(self, labelvalues)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labelvalues, counts, total_sum, count in snapshot:
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': repr(bound)})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total_sum}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class StageClock:
+    """
+    Soma o tempo gasto para produzir os itens de um iterador. Em pipelines em
+    streaming as etapas se intercalam (o split puxa páginas da extração), então
+    cada etapa é medida pelo tempo dentro do seu `next()`.
+    """
+
+    def __init__(self):
+        self.spent = 0.0
+
+    def wrap(self, iterable: Iterable) -> Iterable:
+        if not settings.METRICS_ENABLED:
+            return iterable
+        return self._timed(iter(iterable))
+
+    def _timed(self, iterator: Iterator) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.spent += time.perf_counter() - start
+                return
+            self.spent += time.perf_counter() - start
+            yield item
+
+
+# Coletor de gauges: devolve [(nome, ajuda, labels, valor)] na hora do scrape
+GaugeCollector = Callable[[], List[Tuple[str, str, Dict[str, str], float]]]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms: List[Histogram] = []
+        self._collectors: List[GaugeCollector] = []
+
+    def histogram(self, name: str, documentation: str, **kwargs) -> Histogram:
+        histogram = Histogram(name, documentation, **kwargs)
+        self._histograms.append(histogram)
+        return histogram
+
+    def register_collector(self, collector: GaugeCollector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+
+        gauges: Dict[str, Tuple[str, List[str]]] = {}
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:
+                continue
+            for name, documentation, labels, value in samples:
+                gauges.setdefault(name, (documentation, []))[1].append(f"{name}{_format_labels(labels)} {value}")
+        for name, (documentation, samples) in gauges.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def pool_gauges(engine_name: str, pool) -> List[Tuple[str, str, Dict[str, str], float]]:
+    """Gauges de um pool do SQLAlchemy (QueuePool)."""
+    labels = {"engine": engine_name}
+    return [
+        ("docvault_db_pool_size", "Tamanho configurado do pool de conexões.", labels, pool.size()),
+        ("docvault_db_pool_checked_out", "Conexões em uso.", labels, pool.checkedout()),
+        ("docvault_db_pool_checked_in", "Conexões ociosas no pool.", labels, pool.checkedin()),
+        ("docvault_db_pool_overflow", "Conexões além do tamanho do pool.", labels, pool.overflow()),
+    ]
+
+
+registry = MetricsRegistry()
+
+REQUEST_STAGE_SECONDS = registry.histogram(
+    "docvault_request_stage_seconds",
+    "Duração das etapas de um request (token, usuário, histórico, retrieval, LLM, persistência).",
+)
+INGESTION_STAGE_SECONDS = registry.histogram(
+    "docvault_ingestion_stage_seconds",
+    "Duração das etapas da ingestão (extract e split por documento; embed e insert por lote).",
+)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """
+    Expõe o registry num servidor HTTP mínimo (thread daemon), para processos
+    sem API como o worker de ingestão.
+    """
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,45 +1,212 @@
 import os
-from keycloak import KeycloakOpenID
+import json
+import time
+import hashlib
+import logging
+import threading
+import urllib.request
+from functools import lru_cache
 from fastapi import HTTPException, status
+from jose import jwt, JWTError
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from dotenv import load_dotenv
 
+from app.core.cache import TTLCache
+from app.core.config import settings
+
 load_dotenv()
 
-keycloak_openid = KeycloakOpenID(
-    server_url=os.getenv("KEYCLOAK_URL"),
-    client_id=os.getenv("KEYCLOAK_CLIENT_ID"),
-    realm_name=os.getenv("KEYCLOAK_REALM"),
-    client_secret_key=os.getenv("KEYCLOAK_CLIENT_SECRET")
-)
+logger = logging.getLogger(__name__)
+
+# Algoritmos aceitos na assinatura: nunca o que vier no header do token
+ALLOWED_ALGORITHMS = ("RS256",)
+
+
+@lru_cache(maxsize=1)
+def get_keycloak_openid():
+    """
+    Cliente do Keycloak (só usado na introspecção), criado no primeiro uso.
+    """
+    from keycloak import KeycloakOpenID
+
+    return KeycloakOpenID(
+        server_url=os.getenv("KEYCLOAK_URL"),
+        client_id=os.getenv("KEYCLOAK_CLIENT_ID"),
+        realm_name=os.getenv("KEYCLOAK_REALM"),
+        client_secret_key=os.getenv("KEYCLOAK_CLIENT_SECRET")
+    )
+
 
 class TokenUser(BaseModel):
     id: str
     username: str
     roles: List[str]
+    email: Optional[str] = None
+
+
+class JWKSCache:
+    """
+    Guarda as chaves públicas do realm (JWKS) em memória e as recarrega
+    periodicamente, ou quando aparece um `kid` desconhecido (rotação de chave).
+
+    Se o Keycloak estiver fora, as chaves em cache continuam valendo e novas
+    tentativas esperam um backoff exponencial (até `max_backoff_seconds`), em
+    vez de cada request refazer a chamada bloqueante.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        refresh_seconds: int,
+        min_refetch_seconds: int = 10,
+        timeout: float = 5,
+        max_backoff_seconds: float = 60,
+    ):
+        self.url = url
+        self.refresh_seconds = refresh_seconds
+        self.min_refetch_seconds = min_refetch_seconds
+        self.timeout = timeout
+        self.max_backoff_seconds = max_backoff_seconds
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as resp:
+            jwks = json.loads(resp.read().decode("utf-8"))
+        self._keys = {k["kid"]: k for k in jwks.get("keys", []) if "kid" in k}
+        self._fetched_at = time.monotonic()
+
+    def _refresh(self, now: float):
+        if now < self._retry_at:
+            return
+        try:
+            self._fetch()
+            self._failures = 0
+            self._retry_at = 0.0
+        except Exception as e:
+            self._failures += 1
+            backoff = min(self.min_refetch_seconds * 2 ** (self._failures - 1), self.max_backoff_seconds)
+            self._retry_at = now + backoff
+            logger.warning(
+                "Falha ao atualizar o JWKS; usando chaves em cache",
+                extra={"error": str(e), "cached_keys": len(self._keys), "retry_in_s": backoff},
+            )
+
+    def get_key(self, kid: str) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            age = now - self._fetched_at
+            if not self._keys or age > self.refresh_seconds:
+                self._refresh(now)
+            elif kid not in self._keys and age > self.min_refetch_seconds:
+                self._refresh(now)
+
+            key = self._keys.get(kid)
+            if key is None:
+                raise JWTError(f"Chave de assinatura desconhecida: {kid}")
+            return key
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = 0.0
+            self._failures = 0
+            self._retry_at = 0.0
+
+
+jwks_cache = JWKSCache(settings.KEYCLOAK_JWKS_URL, settings.JWKS_REFRESH_SECONDS)
+# Tokens já verificados, indexados pelo SHA-256 (o token em si nunca vira chave)
+token_cache = TTLCache(settings.TOKEN_CACHE_TTL_SECONDS, settings.TOKEN_CACHE_MAX_SIZE)
+
 
-def validate_token_with_keycloak(token: str) -> TokenUser:
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _token_user_from_claims(claims: dict) -> TokenUser:
+    realm_roles = claims.get("realm_access", {}).get("roles", [])
+    client_id = os.getenv("KEYCLOAK_CLIENT_ID")
+    client_roles = claims.get("resource_access", {}).get(client_id, {}).get("roles", [])
+
+    all_roles = list(set(realm_roles + client_roles))
+
+    return TokenUser(
+        id=claims.get("sub"),
+        username=claims.get("preferred_username"),
+        roles=all_roles,
+        email=claims.get("email"),
+    )
+
+
+def get_cached_token_user(token: str) -> Optional[TokenUser]:
+    """Token já verificado (sem I/O: pode rodar no event loop)."""
+    return token_cache.get(_token_cache_key(token))
+
+
+def verify_token_locally(token: str) -> TokenUser:
+    """
+    Valida assinatura, expiração e issuer do JWT contra o JWKS em cache,
+    sem ida ao Keycloak (exceto quando o JWKS precisa ser recarregado; por
+    isso deve rodar fora do event loop).
+    """
+    cache_key = _token_cache_key(token)
+    cached = token_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    header = jwt.get_unverified_header(token)
+    key = jwks_cache.get_key(header.get("kid"))
+    algorithm = key.get("alg", ALLOWED_ALGORITHMS[0])
+    if algorithm not in ALLOWED_ALGORITHMS:
+        raise JWTError(f"Algoritmo de assinatura não permitido: {algorithm}")
+
+    options = {"verify_aud": bool(settings.KEYCLOAK_AUDIENCE)}
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=settings.KEYCLOAK_AUDIENCE or None,
+        issuer=settings.KEYCLOAK_ISSUER or None,
+        options=options,
+    )
+
+    token_user = _token_user_from_claims(claims)
+    token_cache.set(cache_key, token_user, claims.get("exp"))
+    return token_user
+
+
+def introspect_token(token: str) -> TokenUser:
+    """
+    Consulta o endpoint de introspecção do Keycloak. Detecta tokens revogados,
+    mas custa uma requisição HTTP por chamada.
+    """
+    token_info = get_keycloak_openid().introspect(token)
+
+    if not token_info.get("active"):
+        raise HTTPException(status_code=401, detail="Token inválido ou expirado")
+
+    return _token_user_from_claims(token_info)
+
+
+def validate_token_with_keycloak(token: str, introspect: bool = False) -> TokenUser:
+    """
+    Valida o token. Por padrão usa verificação local (JWKS); `introspect=True`
+    (ou TOKEN_VERIFICATION_MODE=introspection) força a consulta ao Keycloak,
+    para rotas sensíveis a revogação.
+    """
     try:
-        token_info = keycloak_openid.introspect(token)
-        
-        if not token_info.get("active"):
-            raise HTTPException(status_code=401, detail="Token inválido ou expirado")
-
-        realm_roles = token_info.get("realm_access", {}).get("roles", [])
-        client_id = os.getenv("KEYCLOAK_CLIENT_ID")
-        client_roles = token_info.get("resource_access", {}).get(client_id, {}).get("roles", [])
-        
-        all_roles = list(set(realm_roles + client_roles))
-
-        return TokenUser(
-            id=token_info.get("sub"),
-            username=token_info.get("preferred_username"),
-            roles=all_roles
-        )
+        if introspect or settings.TOKEN_VERIFICATION_MODE == "introspection":
+            return introspect_token(token)
+        return verify_token_locally(token)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Erro na validação: {e}")
+        logger.warning("Erro na validação do token", extra={"error": str(e)})
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, 
+            status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Erro na validação de segurança"
         )
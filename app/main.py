@@ -1,13 +1,52 @@
-from fastapi import FastAPI, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.services.backend.auth import get_current_user, RoleChecker
 from app.models.schemas import User
 from app.api.v1 import documents, chat
-from app.core.database import engine, Base
+from app.core.config import settings
+from app.core.database import async_engine, engine, init_db
+from app.core.logging import configure_logging
+from app.core.metrics import CONTENT_TYPE, pool_gauges, registry
 from app.models import schemas
+from app.services.ai.vector import vector_stores, get_embeddings
+from app.services.ai.retrieval_cache import retrieval_cache
+from app.services.ai.answer_cache import answer_cache
+from app.services.backend.progress import progress_hub
 
-Base.metadata.create_all(bind=engine)
+configure_logging()
 
-app = FastAPI(title="DocVault API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nada de banco/clientes externos no import: clientes são criados no primeiro uso
+    if settings.AUTO_MIGRATE:
+        await run_in_threadpool(init_db)
+    yield
+    # Fecha a conexão LISTEN do progresso e os pools compartilhados (PGVector e engine assíncrona)
+    await progress_hub.stop()
+    await vector_stores.dispose()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="DocVault API", lifespan=lifespan)
+
+# Cabeçalhos e delimitadores do multipart além do arquivo em si
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+@app.middleware("http")
+async def reject_oversized_body(request: Request, call_next):
+    # O FastAPI lê o multipart inteiro (em spool no disco) antes de chamar a rota:
+    # sem isto, o limite de tamanho só seria checado depois do upload completo
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Arquivo excede o tamanho máximo de {settings.MAX_UPLOAD_BYTES // (1024 * 1024)} MB."},
+            )
+    return await call_next(request)
 
 app.include_router(documents.router, prefix="/v1")
 app.include_router(chat.router, prefix="/v1")
@@ -25,3 +64,31 @@ def get_me(user: User = Depends(get_current_user)):
         "status": "Synced with DB",
     }
 
+
+@app.get("/health/pools", dependencies=[Depends(RoleChecker(["admin"]))])
+def get_pool_stats():
+    return {"vector_store": vector_stores.pool_stats()}
+
+def _pool_gauges():
+    # Lidos na hora do scrape, sem custo por request
+    samples = pool_gauges("app", engine.pool) + pool_gauges("app_async", async_engine.sync_engine.pool)
+    for name, pool in vector_stores.pools().items():
+        samples += pool_gauges(f"vector_{name}", pool)
+    return samples
+
+
+registry.register_collector(_pool_gauges)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Métricas no formato de texto do Prometheus (histogramas por etapa e pools)."""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/caches", dependencies=[Depends(RoleChecker(["admin"]))])
+def get_cache_stats():
+    return {
+        "retrieval": retrieval_cache.stats(),
+        "answers": answer_cache.stats(),
+        "embeddings": get_embeddings().stats() if hasattr(get_embeddings(), "stats") else None,
+    }
@@ -0,0 +1,17 @@
+"""
+Cria as tabelas e aplica os upgrades de schema (`SCHEMA_UPGRADES`). Roda uma
+vez por deploy, antes de subir API e worker: eles não tocam no schema ao iniciar.
+
+Uso:
+    uv run python -m app.migrate
+"""
+from app.core.database import init_db
+
+
+def main():
+    init_db()
+    print("✅ Schema atualizado.")
+
+
+if __name__ == "__main__":
+    main()
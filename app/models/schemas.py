@@ -1,11 +1,16 @@
 import uuid
 import enum
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, Enum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey, Text, Enum, Index, text
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from pgvector.sqlalchemy import Vector
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from app.core.config import settings
 from app.core.database import Base
 
+# Documentos que contam para a deduplicação por conteúdo (falhos e em deleção não)
+DOCUMENT_DEDUP_WHERE = "status NOT IN ('error', 'deleting')"
+
 class SenderType(str, enum.Enum):
     USER = "user"
     ASSISTANT = "assistant"
@@ -18,13 +23,26 @@ class User(Base):
     email = Column(String, unique=True, nullable=False)
     full_name = Column(String, nullable=True)
     role = Column(String, default="viewer")
+    # Incrementada a cada ingestão/remoção de documento do usuário (invalida caches de retrieval)
+    corpus_version = Column(Integer, default=0, server_default="0", nullable=False)
     
     documents = relationship("Document", back_populates="uploader")
     conversations = relationship("Conversation", back_populates="user")
 
 class Document(Base):
     __tablename__ = "documents"
-    __table_args__ = {"schema": "app"}
+    __table_args__ = (
+        # Um conteúdo por usuário entre os documentos válidos: uploads idênticos
+        # concorrentes não geram dois documentos
+        Index(
+            "ux_documents_uploaded_by_content_hash",
+            "uploaded_by",
+            "content_hash",
+            unique=True,
+            postgresql_where=text(DOCUMENT_DEDUP_WHERE),
+        ),
+        {"schema": "app"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     filename = Column(String, nullable=False)
@@ -32,6 +50,17 @@ class Document(Base):
     # Status: pending (upload feito), processing (ia lendo), active (pronto), error
     status = Column(String, default="pending") 
     total_chunks = Column(Integer, default=0)
+    # SHA-256 do arquivo: re-upload idêntico não passa pela ingestão de novo
+    content_hash = Column(String(64), nullable=True, index=True)
+    # Progresso da ingestão (GET /documents/{id}/status e /events). Durante a
+    # ingestão, total_chunks conta os chunks já embedados e gravados.
+    # Etapa: queued, extracting, embedding, finalizing, done, failed
+    ingestion_stage = Column(String, nullable=True)
+    pages_total = Column(Integer, nullable=True)
+    pages_extracted = Column(Integer, default=0, server_default="0", nullable=False)
+    ingestion_error = Column(Text, nullable=True)
+    progress_started_at = Column(DateTime(timezone=True), nullable=True)
+    progress_updated_at = Column(DateTime(timezone=True), nullable=True)
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
     
     uploaded_by = Column(UUID(as_uuid=True), ForeignKey("app.users.id"))
@@ -40,19 +69,30 @@ class Document(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
-    __table_args__ = {"schema": "app"}
+    __table_args__ = (
+        # Listagem paginada por (created_at, id) das conversas do usuário
+        Index("ix_conversations_user_id_created_at", "user_id", "created_at", "id"),
+        {"schema": "app"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("app.users.id"))
     title = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Resumo das mensagens com created_at <= summarized_until (atualizado em background)
+    summary = Column(Text, nullable=True)
+    summarized_until = Column(DateTime(timezone=True), nullable=True)
 
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation")
 
 class Message(Base):
     __tablename__ = "messages"
-    __table_args__ = {"schema": "app"}
+    __table_args__ = (
+        # Histórico paginado e últimas N mensagens de uma conversa
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at", "id"),
+        {"schema": "app"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     conversation_id = Column(UUID(as_uuid=True), ForeignKey("app.conversations.id"))
@@ -60,4 +100,71 @@ class Message(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="messages")
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    __table_args__ = (
+        Index("ix_ingestion_jobs_status_run_after", "status", "run_after"),
+        {"schema": "app"},
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("app.documents.id", ondelete="CASCADE"), nullable=False)
+    file_path = Column(String, nullable=False)
+    # Tipo: ingest (ingestão completa) ou replace (troca incremental do conteúdo de um documento ativo)
+    kind = Column(String, default="ingest", server_default="ingest", nullable=False)
+    # Status: queued (aguardando worker), running (em processamento), done, failed
+    status = Column(String, default="queued", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Checkpoint da importação em massa (`python -m app.bulk_import`): um registro
+# por arquivo de cada execução, para retomar de onde parou
+class ImportFile(Base):
+    __tablename__ = "import_files"
+    __table_args__ = (
+        Index("ix_import_files_run_status", "run", "status"),
+        {"schema": "app"},
+    )
+
+    run = Column(String, primary_key=True)
+    path = Column(String, primary_key=True)
+    size = Column(BigInteger, nullable=True)
+    content_hash = Column(String(64), nullable=True)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("app.documents.id", ondelete="SET NULL"), nullable=True)
+    # Status: pending, processing, done, skipped (conteúdo já ingerido ou documento removido), error
+    status = Column(String, default="pending", nullable=False)
+    chunks = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    __table_args__ = {"schema": "app"}
+
+    # Chave: (modelo de embedding, SHA-256 do texto do chunk)
+    model = Column(String, primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    embedding = Column(Vector(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AnswerCache(Base):
+    __tablename__ = "answer_cache"
+    __table_args__ = {"schema": "app"}
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("app.users.id", ondelete="CASCADE"), nullable=False, index=True)
+    question = Column(Text, nullable=False)
+    question_embedding = Column(Vector(settings.EMBEDDING_DIMENSIONS), nullable=False)
+    # IDs (ordenados) dos chunks usados como contexto e dos documentos de origem
+    chunk_ids = Column(ARRAY(String), nullable=False)
+    document_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    answer = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,42 +1,37 @@
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
+import logging
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
 
 from app.core.config import settings
-from app.services.ai.vector import get_vector_store
-
-llm = ChatOpenAI(
-    model=settings.CHAT_MODEL, temperature=0.2, openai_api_key=settings.OPENAI_API_KEY
-)
+from app.core.metrics import REQUEST_STAGE_SECONDS
+from app.services.ai.retrieval_cache import retrieval_cache
+from app.services.ai.answer_cache import answer_cache, is_answer_cacheable
+from app.services.ai.context import pack_prompt
 
+logger = logging.getLogger(__name__)
 
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
 
-
-def get_chat_response(
-    message: str, chat_history: List[Dict[str, str]], user_id: str
-) -> str:
+@lru_cache(maxsize=1)
+def get_llm():
     """
-    Gera uma resposta usando RAG + Histórico com LCEL.
+    Modelo de chat compartilhado, criado no primeiro uso (o import do
+    langchain_openai/openai fica fora do caminho de inicialização).
     """
+    from langchain_openai import ChatOpenAI
 
-    # 1. Retriever com filtro
-    vector_store = get_vector_store()
-    retriever = vector_store.as_retriever(
-        search_kwargs={"k": 5, "filter": {"user_id": user_id}}
+    return ChatOpenAI(
+        model=settings.CHAT_MODEL,
+        temperature=0.2,
+        openai_api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
     )
 
-    # 2. Formatar histórico
-    history_str = ""
-    for msg in chat_history[-10:]:
-        role = "Usuário" if msg["role"] == "user" else "Assistente"
-        history_str += f"{role}: {msg['content']}\n"
 
-    # 3. Prompt
-    system_prompt = """
+SYSTEM_PROMPT = """
     Você é um assistente de IA especialista em análise jurídica e documentos.
     Use o contexto abaixo (recuperado de documentos PDF) para responder à pergunta do usuário.
     Se a resposta não estiver no contexto, diga que não encontrou a informação, mas tente ajudar.
@@ -49,29 +44,119 @@ def get_chat_response(
     {history}
     """
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("user", "{question}"),
-        ]
-    )
+prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", SYSTEM_PROMPT),
+        ("user", "{question}"),
+    ]
+)
 
-    # 4. Chain LCEL (RAG puro)
-    # input espera: {"question": "...", "history": "..."}
-    # context é preenchido pelo retriever pegando 'question'
 
-    rag_chain = (
+def get_cached_retriever(user_id: str, k: int = 5, mode: Optional[str] = None):
+    """
+    Retriever assíncrono que passa pelo cache de embeddings da pergunta e de resultados.
+    `mode` é "vector" ou "hybrid" (léxica + vetorial); padrão: RETRIEVAL_MODE.
+    """
+    mode = mode or settings.RETRIEVAL_MODE
+
+    async def _aretrieve(question: str):
+        return await retrieval_cache.aretrieve(question, user_id, k=k, mode=mode)
+
+    return RunnableLambda(_aretrieve)
+
+
+def format_sources(docs: List[Document]) -> List[Dict[str, Any]]:
+    return [
         {
-            "context": (lambda x: x["question"]) | retriever | format_docs,
-            "question": lambda x: x["question"],
-            "history": lambda x: x["history"],
+            "document_id": doc.metadata.get("document_id"),
+            "source": doc.metadata.get("source"),
+            "snippet": doc.page_content[:200],
         }
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
+        for doc in docs
+    ]
+
+
+def build_prompt_inputs(
+    message: str,
+    docs: List[Document],
+    chat_history: List[Dict[str, str]],
+    summary: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Monta as variáveis do prompt dentro do orçamento de tokens e registra
+    quantos tokens cada seção usou (para calibrar CONTEXT/HISTORY_TOKEN_BUDGET).
+    """
+    packed = pack_prompt(docs, chat_history, summary=summary)
+    logger.debug("Prompt montado", extra=packed.report())
+    return {"context": packed.context, "question": message, "history": packed.history}
+
+
+async def aget_chat_response(
+    message: str,
+    chat_history: List[Dict[str, str]],
+    user_id: str,
+    retrieval_mode: Optional[str] = None,
+    summary: Optional[str] = None,
+) -> str:
+    """
+    Gera uma resposta usando RAG + Histórico com LCEL: busca vetorial e chamada
+    ao LLM via `ainvoke`, sem bloquear o event loop. No primeiro turno de uma conversa
+    consulta o cache semântico de respostas (se habilitado).
+    """
+    with REQUEST_STAGE_SECONDS.time("retrieval"):
+        docs = await get_cached_retriever(user_id, mode=retrieval_mode).ainvoke(message)
+
+    cacheable = is_answer_cacheable(chat_history, summary)
+    if cacheable:
+        question_vector = await retrieval_cache.aembed_question(message)
+        cached_answer = await answer_cache.alookup(user_id, question_vector, docs)
+        if cached_answer is not None:
+            return cached_answer
 
-    # 5. Invoke
-    response_text = rag_chain.invoke({"question": message, "history": history_str})
+    answer_chain = prompt | get_llm() | StrOutputParser()
+    inputs = build_prompt_inputs(message, docs, chat_history, summary)
+    with REQUEST_STAGE_SECONDS.time("llm"):
+        response_text = await answer_chain.ainvoke(inputs)
 
+    if cacheable:
+        await answer_cache.astore(user_id, message, question_vector, docs, response_text)
     return response_text
+
+
+async def astream_chat_response(
+    message: str,
+    chat_history: List[Dict[str, str]],
+    user_id: str,
+    retrieval_mode: Optional[str] = None,
+    summary: Optional[str] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Versão em streaming de `aget_chat_response`. Gera eventos `(tipo, dados)`:
+    primeiro ("sources", [...]) com os trechos recuperados, depois um
+    ("token", "...") para cada pedaço de texto produzido pelo LLM.
+    """
+    with REQUEST_STAGE_SECONDS.time("retrieval"):
+        docs = await get_cached_retriever(user_id, mode=retrieval_mode).ainvoke(message)
+    yield "sources", format_sources(docs)
+
+    cacheable = is_answer_cacheable(chat_history, summary)
+    if cacheable:
+        question_vector = await retrieval_cache.aembed_question(message)
+        cached_answer = await answer_cache.alookup(user_id, question_vector, docs)
+        if cached_answer is not None:
+            yield "token", cached_answer
+            return
+
+    answer_chain = prompt | get_llm() | StrOutputParser()
+    answer_parts = []
+    inputs = build_prompt_inputs(message, docs, chat_history, summary)
+    # Inclui o tempo em que o consumidor processa cada token (o stream é puxado por ele)
+    with REQUEST_STAGE_SECONDS.time("llm"):
+        async for token in answer_chain.astream(inputs):
+            if token:
+                answer_parts.append(token)
+                yield "token", token
+
+    # Só chega aqui se o stream terminou (cliente não desconectou no meio)
+    if cacheable:
+        await answer_cache.astore(user_id, message, question_vector, docs, "".join(answer_parts))
@@ -0,0 +1,108 @@
+import uuid
+import threading
+from typing import Iterable, List, Optional
+from langchain_core.documents import Document as LCDocument
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.schemas import AnswerCache
+
+
+def chunk_ids_of(docs: List[LCDocument]) -> List[str]:
+    return sorted(str(doc.id) for doc in docs if doc.id)
+
+
+def document_ids_of(docs: List[LCDocument]) -> List[uuid.UUID]:
+    return sorted({uuid.UUID(doc.metadata["document_id"]) for doc in docs if doc.metadata.get("document_id")})
+
+
+class SemanticAnswerCache:
+    """
+    Cache semântico de respostas (opt-in via ANSWER_CACHE_ENABLED).
+
+    Uma resposta guardada é reutilizada quando a nova pergunta do mesmo usuário
+    está a uma similaridade de cosseno >= limiar de uma pergunta anterior E
+    recupera exatamente os mesmos chunks. Entradas são removidas quando qualquer
+    documento que contribuiu para elas é removido ou re-ingerido.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    async def alookup(self, user_id: str, question_vector: List[float], docs: List[LCDocument]) -> Optional[str]:
+        chunk_ids = chunk_ids_of(docs)
+        if not chunk_ids:
+            return None
+
+        distance = AnswerCache.question_embedding.cosine_distance(question_vector)
+        async with AsyncSessionLocal() as db:
+            row = (
+                await db.execute(
+                    select(AnswerCache.answer, AnswerCache.chunk_ids, distance.label("distance"))
+                    .where(AnswerCache.user_id == uuid.UUID(user_id))
+                    .order_by(distance)
+                    .limit(1)
+                )
+            ).first()
+
+        hit = row is not None and (1 - row.distance) >= self.threshold and list(row.chunk_ids) == chunk_ids
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row.answer if hit else None
+
+    async def astore(self, user_id: str, question: str, question_vector: List[float], docs: List[LCDocument], answer: str):
+        chunk_ids = chunk_ids_of(docs)
+        if not chunk_ids or not answer:
+            return
+        async with AsyncSessionLocal() as db:
+            db.add(
+                AnswerCache(
+                    user_id=uuid.UUID(user_id),
+                    question=question,
+                    question_embedding=question_vector,
+                    chunk_ids=chunk_ids,
+                    document_ids=document_ids_of(docs),
+                    answer=answer,
+                )
+            )
+            await db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": settings.ANSWER_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache(settings.ANSWER_CACHE_SIMILARITY_THRESHOLD)
+
+
+def is_answer_cacheable(chat_history: List[dict], summary: Optional[str] = None) -> bool:
+    # O histórico inclui a própria pergunta atual: só o primeiro turno não depende de contexto anterior
+    return settings.ANSWER_CACHE_ENABLED and len(chat_history) <= 1 and not summary
+
+
+def invalidate_answers_for_document(db: Session, doc_id) -> None:
+    """
+    Remove respostas que usaram o documento. Não faz commit: deve entrar na
+    mesma transação da remoção/re-ingestão.
+    """
+    invalidate_answers_for_documents(db, [doc_id])
+
+
+def invalidate_answers_for_documents(db: Session, doc_ids: Iterable) -> None:
+    """Versão em lote de `invalidate_answers_for_document` (mesmo índice GIN)."""
+    db.execute(
+        delete(AnswerCache).where(AnswerCache.document_ids.overlap([uuid.UUID(str(d)) for d in doc_ids]))
+    )
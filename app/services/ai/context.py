@@ -0,0 +1,207 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document as LCDocument
+
+from app.core.config import settings
+
+# Sobreposição mínima (em caracteres) para considerar que dois chunks se emendam
+MIN_OVERLAP_CHARS = 20
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return len(_encoding(model or settings.CHAT_MODEL).encode(text, disallowed_special=()))
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _overlap(left: str, right: str) -> int:
+    """Maior sufixo de `left` que também é prefixo de `right` (0 se menor que o mínimo)."""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+@dataclass
+class _Segment:
+    document_id: str
+    source: Optional[str]
+    text: str
+    rank: int
+    first_index: Optional[int]
+    last_index: Optional[int]
+    tokens: int = 0
+
+
+@dataclass
+class PackedPrompt:
+    context: str
+    history: str
+    context_tokens: int
+    history_tokens: int
+    chunks_retrieved: int
+    chunks_used: int
+    messages_used: int
+
+    def report(self) -> Dict[str, int]:
+        return {
+            "context_tokens": self.context_tokens,
+            "history_tokens": self.history_tokens,
+            "chunks_retrieved": self.chunks_retrieved,
+            "chunks_used": self.chunks_used,
+            "messages_used": self.messages_used,
+        }
+
+
+def _position_key(index: Optional[int], rank: int) -> Tuple[bool, int, int]:
+    return index is None, index or 0, rank
+
+
+def _dedupe(docs: List[LCDocument], threshold: float) -> List[Tuple[int, LCDocument]]:
+    kept, kept_shingles = [], []
+    for rank, doc in enumerate(docs):
+        shingles = _shingles(doc.page_content)
+        if any(_similarity(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append((rank, doc))
+        kept_shingles.append(shingles)
+    return kept
+
+
+def _merge_segments(ranked_docs: List[Tuple[int, LCDocument]]) -> List[_Segment]:
+    """
+    Agrupa os chunks por documento, ordena pela posição no documento
+    (`chunk_index` da ingestão) e emenda vizinhos (índices consecutivos)
+    removendo o texto repetido pelo `chunk_overlap` do splitter. Chunks não
+    vizinhos nunca são emendados, mesmo que compartilhem texto (ex.: rodapés).
+    """
+    by_document: Dict[str, List[Tuple[int, LCDocument]]] = {}
+    for rank, doc in ranked_docs:
+        by_document.setdefault(str(doc.metadata.get("document_id")), []).append((rank, doc))
+
+    segments = []
+    for document_id, items in by_document.items():
+        # Chunks antigos, sem chunk_index, mantêm a ordem de relevância
+        items.sort(key=lambda item: _position_key(item[1].metadata.get("chunk_index"), item[0]))
+        current = None
+        for rank, doc in items:
+            index = doc.metadata.get("chunk_index")
+            text = doc.page_content
+            if current is not None:
+                adjacent = index is not None and current.last_index is not None and index - current.last_index <= 1
+                if adjacent:
+                    overlap = _overlap(current.text, text)
+                    current.text = current.text + (text[overlap:] if overlap else "\n" + text)
+                    current.rank = min(current.rank, rank)
+                    current.last_index = index
+                    continue
+                segments.append(current)
+            current = _Segment(document_id, doc.metadata.get("source"), text, rank, index, index)
+        if current is not None:
+            segments.append(current)
+    return segments
+
+
+def pack_context(docs: List[LCDocument], budget: int) -> Tuple[str, int, int]:
+    """
+    Monta o bloco de contexto dentro de `budget` tokens: remove quase-duplicatas,
+    emenda chunks sobrepostos, escolhe os trechos por relevância até o orçamento
+    e os apresenta agrupados por documento, em ordem de posição.
+
+    Retorna (texto, tokens usados, chunks aproveitados).
+    """
+    ranked = _dedupe(docs, settings.CONTEXT_DEDUP_THRESHOLD)
+    segments = _merge_segments(ranked)
+
+    selected, used = [], 0
+    for segment in sorted(segments, key=lambda s: s.rank):
+        segment.tokens = count_tokens(segment.text)
+        if used + segment.tokens > budget:
+            continue
+        selected.append(segment)
+        used += segment.tokens
+
+    # Documentos na ordem do seu melhor trecho; dentro do documento, pela posição
+    document_rank = {}
+    for segment in selected:
+        document_rank[segment.document_id] = min(document_rank.get(segment.document_id, segment.rank), segment.rank)
+    selected.sort(key=lambda s: (document_rank[s.document_id], *_position_key(s.first_index, s.rank)))
+
+    blocks, previous_document = [], None
+    for segment in selected:
+        if segment.document_id != previous_document and segment.source:
+            blocks.append(f"[{segment.source}]")
+        blocks.append(segment.text)
+        previous_document = segment.document_id
+    context = "\n\n".join(blocks)
+
+    chunks_used = sum(1 for _, doc in ranked if any(doc.page_content in s.text for s in selected))
+    return context, count_tokens(context) if context else 0, chunks_used
+
+
+def pack_history(
+    chat_history: List[Dict[str, str]], budget: int, summary: Optional[str] = None
+) -> Tuple[str, int, int]:
+    """
+    Mantém o resumo da conversa (se houver) e as mensagens mais recentes que
+    cabem em `budget` tokens, em ordem cronológica.
+    Retorna (texto, tokens usados, mensagens aproveitadas).
+    """
+    header = f"Resumo da conversa até aqui: {summary}\n" if summary else ""
+    lines, used = [], count_tokens(header) if header else 0
+    for msg in reversed(chat_history):
+        role = "Usuário" if msg["role"] == "user" else "Assistente"
+        line = f"{role}: {msg['content']}\n"
+        tokens = count_tokens(line)
+        if used + tokens > budget:
+            break
+        lines.append(line)
+        used += tokens
+    return header + "".join(reversed(lines)), used, len(lines)
+
+
+def pack_prompt(
+    docs: List[LCDocument],
+    chat_history: List[Dict[str, str]],
+    summary: Optional[str] = None,
+    context_budget: Optional[int] = None,
+    history_budget: Optional[int] = None,
+) -> PackedPrompt:
+    context, context_tokens, chunks_used = pack_context(
+        docs, context_budget if context_budget is not None else settings.CONTEXT_TOKEN_BUDGET
+    )
+    history, history_tokens, messages_used = pack_history(
+        chat_history, history_budget if history_budget is not None else settings.HISTORY_TOKEN_BUDGET, summary
+    )
+    return PackedPrompt(
+        context=context,
+        history=history,
+        context_tokens=context_tokens,
+        history_tokens=history_tokens,
+        chunks_retrieved=len(docs),
+        chunks_used=chunks_used,
+        messages_used=messages_used,
+    )
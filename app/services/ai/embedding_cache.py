@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import threading
+from typing import Dict, List
+from langchain_core.embeddings import Embeddings
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.cache import TTLCache
+from app.core.database import SessionLocal
+from app.models.schemas import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+# LRU em memória sem expiração prática: embeddings de um texto nunca mudam
+_NO_EXPIRY_SECONDS = 10 * 365 * 24 * 3600
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envolve um objeto `Embeddings` com cache por (modelo, SHA-256 do texto):
+    LRU em memória na frente de uma tabela `app.embedding_cache` no Postgres.
+    Só os textos nunca vistos são enviados ao provedor.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, memory_size: int = 10000):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.memory = TTLCache(_NO_EXPIRY_SECONDS, memory_size)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _load_from_db(self, hashes: List[str]) -> Dict[str, List[float]]:
+        if not hashes:
+            return {}
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(EmbeddingCache.content_hash, EmbeddingCache.embedding)
+                .filter(
+                    EmbeddingCache.model == self.model_name,
+                    EmbeddingCache.content_hash.in_(hashes),
+                )
+                .all()
+            )
+            return {h: [float(x) for x in vector] for h, vector in rows}
+        except Exception as e:
+            logger.warning("Cache de embeddings: falha na leitura, seguindo sem cache", extra={"model": self.model_name, "error": str(e)})
+            db.rollback()
+            return {}
+        finally:
+            db.close()
+
+    def _store_in_db(self, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        db = SessionLocal()
+        try:
+            stmt = insert(EmbeddingCache).values(
+                [
+                    {"model": self.model_name, "content_hash": h, "embedding": v}
+                    for h, v in vectors.items()
+                ]
+            ).on_conflict_do_nothing(index_elements=["model", "content_hash"])
+            db.execute(stmt)
+            db.commit()
+        except Exception as e:
+            logger.warning("Cache de embeddings: falha na escrita", extra={"model": self.model_name, "error": str(e)})
+            db.rollback()
+        finally:
+            db.close()
+
+    def _embed(self, texts: List[str], embed_fn) -> List[List[float]]:
+        hashes = [content_hash(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+
+        for h in set(hashes):
+            vector = self.memory.get(h)
+            if vector is not None:
+                found[h] = vector
+        memory_hits = len(found)
+
+        from_db = self._load_from_db([h for h in set(hashes) if h not in found])
+        found.update(from_db)
+
+        missing: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = text
+
+        if missing:
+            new_vectors = embed_fn(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            self._store_in_db(computed)
+            found.update(computed)
+
+        for h, vector in found.items():
+            self.memory.set(h, vector)
+
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.db_hits += len(from_db)
+            self.misses += len(missing)
+
+        return [found[h] for h in hashes]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], lambda t: [self.underlying.embed_query(t[0])])[0]
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": ((self.memory_hits + self.db_hits) / lookups) if lookups else 0.0,
+            "memory_size": len(self.memory),
+        }
+
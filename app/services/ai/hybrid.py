@@ -0,0 +1,109 @@
+import time
+import logging
+from typing import List, Optional
+from langchain_core.documents import Document as LCDocument
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.ai.indexes import EMBEDDING_TABLE, FULLTEXT_COLUMN, FULLTEXT_CONFIG, has_fulltext_column
+from app.services.ai.vector import vector_stores
+
+logger = logging.getLogger(__name__)
+
+# Busca léxica (tsvector) e vetorial (HNSW) numa única query, fundidas com
+# Reciprocal Rank Fusion: score = soma de 1 / (rrf_k + posição) em cada lista.
+HYBRID_SEARCH_SQL = f"""
+WITH coll AS (
+    SELECT uuid FROM langchain_pg_collection WHERE name = :collection
+),
+vec AS (
+    SELECT id, row_number() OVER (ORDER BY distance) AS rank
+    FROM (
+        SELECT e.id, e.embedding <=> CAST(:embedding AS vector) AS distance
+        FROM {EMBEDDING_TABLE} e
+        WHERE e.collection_id = (SELECT uuid FROM coll)
+          AND e.cmetadata->>'user_id' = :user_id
+          AND NOT coalesce(e.cmetadata->>'document_id' = ANY(CAST(:hidden AS text[])), false)
+        ORDER BY distance
+        LIMIT :candidates
+    ) v
+),
+lex AS (
+    SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+    FROM (
+        SELECT e.id, ts_rank_cd(e.{FULLTEXT_COLUMN}, q) AS score
+        FROM {EMBEDDING_TABLE} e, websearch_to_tsquery('{FULLTEXT_CONFIG}', :query) q
+        WHERE e.collection_id = (SELECT uuid FROM coll)
+          AND e.cmetadata->>'user_id' = :user_id
+          AND NOT coalesce(e.cmetadata->>'document_id' = ANY(CAST(:hidden AS text[])), false)
+          AND e.{FULLTEXT_COLUMN} @@ q
+        ORDER BY score DESC
+        LIMIT :candidates
+    ) l
+),
+fused AS (
+    SELECT id, sum(1.0 / (:rrf_k + rank)) AS score
+    FROM (SELECT id, rank FROM vec UNION ALL SELECT id, rank FROM lex) ranked
+    GROUP BY id
+)
+SELECT e.id, e.document, e.cmetadata, f.score
+FROM fused f
+JOIN {EMBEDDING_TABLE} e ON e.id = f.id
+ORDER BY f.score DESC
+LIMIT :k
+"""
+
+# Uma vez presente, a coluna não some: só o True fica em cache para sempre.
+# O False é rechecado a cada FULLTEXT_RECHECK_SECONDS, para a busca híbrida
+# ligar sozinha depois de um `indexes create` sem reiniciar a API.
+FULLTEXT_RECHECK_SECONDS = 60
+
+_fulltext_ready = False
+_fulltext_checked_at = None
+
+
+async def ahybrid_available() -> bool:
+    """
+    A coluna tsvector é criada por `python -m app.services.ai.indexes create`;
+    sem ela a busca híbrida cai para a vetorial pura.
+    """
+    global _fulltext_ready, _fulltext_checked_at
+    now = time.monotonic()
+    if _fulltext_ready or (
+        _fulltext_checked_at is not None and now - _fulltext_checked_at < FULLTEXT_RECHECK_SECONDS
+    ):
+        return _fulltext_ready
+
+    async with vector_stores.async_engine.connect() as conn:
+        _fulltext_ready = await conn.run_sync(has_fulltext_column)
+    if not _fulltext_ready and _fulltext_checked_at is None:
+        logger.warning("Busca híbrida: coluna de texto ausente, usando apenas busca vetorial", extra={"column": FULLTEXT_COLUMN})
+    _fulltext_checked_at = now
+    return _fulltext_ready
+
+
+async def ahybrid_search(
+    question: str,
+    question_vector: List[float],
+    user_id: str,
+    k: int = 5,
+    collection_name: str = "documents",
+    hidden_document_ids: Optional[List[str]] = None,
+) -> List[LCDocument]:
+    params = {
+        "collection": collection_name,
+        "embedding": "[" + ",".join(repr(float(x)) for x in question_vector) + "]",
+        "query": question,
+        "user_id": user_id,
+        "hidden": list(hidden_document_ids or []),
+        "candidates": max(k * settings.HYBRID_CANDIDATE_MULTIPLIER, k),
+        "rrf_k": settings.HYBRID_RRF_K,
+        "k": k,
+    }
+    async with vector_stores.async_engine.connect() as conn:
+        rows = (await conn.execute(text(HYBRID_SEARCH_SQL), params)).all()
+
+    return [
+        LCDocument(id=str(row.id), page_content=row.document, metadata=row.cmetadata or {})
+        for row in rows
+    ]
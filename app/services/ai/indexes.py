@@ -0,0 +1,193 @@
+"""
+Gerenciamento dos índices da tabela `langchain_pg_embedding`.
+
+- HNSW sobre `embedding` (cosine, mesma estratégia de distância do PGVector).
+- Índices de expressão sobre `cmetadata->>'user_id'` e `cmetadata->>'document_id'`,
+  usados pela busca híbrida, pela deleção de vetores e pelo filtro de retrieval
+  do PGVector (desde que montado com `$in`, ver `retrieval_filter`).
+- Coluna `content_tsv` (tsvector, config `portuguese`) com índice GIN, usada
+  pela busca híbrida (léxica + vetorial).
+
+Uso:
+    uv run python -m app.services.ai.indexes create --m 16 --ef-construction 64
+    uv run python -m app.services.ai.indexes validate
+"""
+import argparse
+from typing import Dict, List, Optional
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+
+EMBEDDING_TABLE = "langchain_pg_embedding"
+HNSW_INDEX = "ix_langchain_pg_embedding_hnsw"
+METADATA_INDEXES = {
+    "ix_langchain_pg_embedding_user_id": "user_id",
+    "ix_langchain_pg_embedding_document_id": "document_id",
+}
+FULLTEXT_COLUMN = "content_tsv"
+FULLTEXT_INDEX = "ix_langchain_pg_embedding_content_tsv"
+FULLTEXT_CONFIG = "portuguese"
+
+
+def _autocommit(engine: Engine):
+    # CREATE INDEX CONCURRENTLY não pode rodar dentro de transação
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def ensure_embedding_dimension(engine: Engine, dimensions: int):
+    """
+    HNSW exige coluna com dimensão fixa. Tabelas criadas sem `embedding_length`
+    têm `embedding vector` sem typmod; aqui a coluna é convertida para `vector(n)`.
+    """
+    with _autocommit(engine) as conn:
+        typmod = conn.execute(
+            text("""
+                SELECT atttypmod FROM pg_attribute
+                WHERE attrelid = CAST(:table AS regclass) AND attname = 'embedding'
+            """),
+            {"table": EMBEDDING_TABLE},
+        ).scalar()
+        if typmod is not None and typmod > 0:
+            return
+        conn.execute(
+            text(f"ALTER TABLE {EMBEDDING_TABLE} ALTER COLUMN embedding TYPE vector({int(dimensions)})")
+        )
+
+
+def ensure_fulltext_column(engine: Engine):
+    """
+    Adiciona a coluna tsvector gerada a partir de `document` (preenchida pelo
+    próprio Postgres em cada INSERT da ingestão) e seu índice GIN.
+    """
+    with _autocommit(engine) as conn:
+        conn.execute(
+            text(f"""
+                ALTER TABLE {EMBEDDING_TABLE}
+                ADD COLUMN IF NOT EXISTS {FULLTEXT_COLUMN} tsvector
+                GENERATED ALWAYS AS (to_tsvector('{FULLTEXT_CONFIG}', coalesce(document, ''))) STORED
+            """)
+        )
+
+
+def has_fulltext_column(conn: Connection) -> bool:
+    return conn.execute(
+        text("""
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = CAST(:table AS regclass) AND attname = :column AND NOT attisdropped
+        """),
+        {"table": EMBEDDING_TABLE, "column": FULLTEXT_COLUMN},
+    ).first() is not None
+
+
+def create_indexes(
+    engine: Engine,
+    m: int = 16,
+    ef_construction: int = 64,
+    dimensions: Optional[int] = None,
+    concurrently: bool = False,
+):
+    """
+    Cria (se não existirem) o índice HNSW, os índices de metadados e o de texto.
+    """
+    ensure_embedding_dimension(engine, dimensions or settings.EMBEDDING_DIMENSIONS)
+    ensure_fulltext_column(engine)
+    mode = "CONCURRENTLY " if concurrently else ""
+
+    with _autocommit(engine) as conn:
+        conn.execute(
+            text(f"""
+                CREATE INDEX {mode}IF NOT EXISTS {HNSW_INDEX}
+                ON {EMBEDDING_TABLE} USING hnsw (embedding vector_cosine_ops)
+                WITH (m = {int(m)}, ef_construction = {int(ef_construction)})
+            """)
+        )
+        for index_name, key in METADATA_INDEXES.items():
+            conn.execute(
+                text(f"""
+                    CREATE INDEX {mode}IF NOT EXISTS {index_name}
+                    ON {EMBEDDING_TABLE} ((cmetadata->>'{key}'))
+                """)
+            )
+        conn.execute(
+            text(f"""
+                CREATE INDEX {mode}IF NOT EXISTS {FULLTEXT_INDEX}
+                ON {EMBEDDING_TABLE} USING gin ({FULLTEXT_COLUMN})
+            """)
+        )
+        conn.execute(text(f"ANALYZE {EMBEDDING_TABLE}"))
+
+
+def validate_indexes(engine: Engine) -> Dict[str, str]:
+    """
+    Retorna o estado de cada índice esperado: `ok`, `missing` ou `invalid`
+    (ex.: um CREATE INDEX CONCURRENTLY interrompido).
+    """
+    expected: List[str] = [HNSW_INDEX, *METADATA_INDEXES, FULLTEXT_INDEX]
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT c.relname, i.indisvalid
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = CAST(:table AS regclass)
+            """),
+            {"table": EMBEDDING_TABLE},
+        ).all()
+    found = {name: valid for name, valid in rows}
+    return {
+        name: ("missing" if name not in found else "ok" if found[name] else "invalid")
+        for name in expected
+    }
+
+
+def configure_search_settings(engine: Engine, ef_search: Optional[int] = None, iterative_scan: Optional[str] = None):
+    """
+    Ajusta `hnsw.ef_search` e `hnsw.iterative_scan` em cada conexão do pool.
+    Com filtro por usuário, o iterative scan (pgvector >= 0.8) continua varrendo
+    o grafo até achar k resultados que passem no filtro.
+    """
+    ef_search = ef_search or settings.HNSW_EF_SEARCH
+    iterative_scan = iterative_scan or settings.HNSW_ITERATIVE_SCAN
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_search_params(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"SET hnsw.ef_search = {int(ef_search)}")
+            if iterative_scan and iterative_scan != "off":
+                cursor.execute(f"SET hnsw.iterative_scan = {iterative_scan}")
+        finally:
+            cursor.close()
+        # Sem commit o reset do pool (rollback) desfaria os SETs
+        dbapi_connection.commit()
+
+
+def main():
+    from app.services.ai.vector import vector_stores
+
+    parser = argparse.ArgumentParser(description="Índices da tabela de embeddings.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="Cria os índices HNSW, de metadados e de texto.")
+    create.add_argument("--m", type=int, default=settings.HNSW_M)
+    create.add_argument("--ef-construction", type=int, default=settings.HNSW_EF_CONSTRUCTION)
+    create.add_argument("--concurrently", action="store_true", help="Não bloqueia escritas durante a criação.")
+
+    sub.add_parser("validate", help="Verifica se os índices existem e são válidos.")
+    args = parser.parse_args()
+
+    engine = vector_stores.engine
+    if args.command == "create":
+        create_indexes(engine, m=args.m, ef_construction=args.ef_construction, concurrently=args.concurrently)
+
+    report = validate_indexes(engine)
+    for name, state in report.items():
+        print(f"{'✅' if state == 'ok' else '❌'} {name}: {state}")
+    if any(state != "ok" for state in report.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
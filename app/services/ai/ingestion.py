@@ -1,77 +1,462 @@
+import os
+import time
 import uuid
+import hashlib
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Iterable, Iterator, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.core.config import settings
 from app.core.database import SessionLocal
+from app.core.metrics import INGESTION_STAGE_SECONDS, StageClock
 from app.models.schemas import Document
-from app.services.ai.tools import extract_text_from_pdf
-from app.services.ai.vector import get_vector_store
+from app.services.ai.tools import iter_pdf_pages, pdf_page_count
+from app.services.ai.vector import (
+    delete_vectors_by_document_id,
+    delete_vectors_by_ids,
+    get_embeddings,
+    get_vector_store,
+    insert_vectors,
+    load_chunk_hashes,
+    reindex_vectors,
+)
+from app.services.backend.storage import file_sha256
+from app.services.ai.retrieval_cache import bump_corpus_version
+from app.services.ai.answer_cache import invalidate_answers_for_document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+logger = logging.getLogger(__name__)
 
-def process_document(doc_id: uuid.UUID, file_path: str):
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, separators=["\n\n", "\n", " ", ""]
+    )
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], text_splitter: RecursiveCharacterTextSplitter) -> Iterator[str]:
+    """
+    Divide o texto em chunks à medida que as páginas chegam, uma página por vez.
+
+    Cada página é dividida de forma independente: o resultado é determinístico
+    e editar uma página só muda os chunks dela, o que permite a reingestão
+    incremental (`replace_document_content`) reaproveitar os demais. A memória
+    fica limitada a uma página.
+    """
+    for _, text in pages:
+        if text.strip():
+            yield from text_splitter.split_text(text)
+
+
+def iter_batches(items: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _embed_batch(embedder: Embeddings, texts: List[str]) -> List[List[float]]:
+    # Roda na thread do pool: mede só a chamada ao modelo, não a espera na fila
+    with INGESTION_STAGE_SECONDS.time("embed"):
+        return embedder.embed_documents(texts)
+
+
+class IngestionCancelled(Exception):
+    """O documento foi marcado para deleção (ou já removido) durante a ingestão."""
+
+
+def _lock_unless_deleting(db: Session, doc_id, exclusive: bool = False):
+    """
+    Trava a linha do documento até o próximo commit (FOR SHARE, ou FOR UPDATE
+    com `exclusive`) e interrompe a ingestão se ele estiver em `deleting` ou
+    não existir mais. Com a trava, a marcação para deleção e a purga esperam o
+    lote em andamento: todo vetor gravado antes dela entra na purga.
     """
-    Processa o documento PDF:
-    1. Extrai texto.
-    2. Divide em chunks.
-    3. Gera embeddings e salva no Vector DB.
-    4. Atualiza status no banco Transactional.
+    status = (
+        db.query(Document.status)
+        .filter(Document.id == doc_id)
+        .with_for_update(read=not exclusive)
+        .scalar()
+    )
+    if status is None or status == "deleting":
+        raise IngestionCancelled()
+
+
+def _record_progress(document: Document, stage: str, **fields):
+    # Gravado junto com o commit de quem chama; o trigger da tabela dispara o NOTIFY
+    document.ingestion_stage = stage
+    document.progress_updated_at = func.now()
+    for name, value in fields.items():
+        setattr(document, name, value)
+
+
+def process_document(
+    doc_id: uuid.UUID,
+    file_path: str,
+    raise_on_error: bool = False,
+    pages: Optional[Iterable[Tuple[int, str]]] = None,
+    embedder: Optional[Embeddings] = None,
+) -> int:
+    """
+    Processa o documento PDF em pipeline com memória limitada:
+    1. Extrai páginas (pool de processos, em ordem).
+    2. Divide em chunks incrementalmente.
+    3. Gera embeddings em lotes (threads, com limite de lotes em voo).
+    4. Insere cada lote no Vector DB e atualiza o progresso no banco Transactional
+       (etapa, páginas extraídas e chunks gravados, ver `GET /documents/{id}/status`).
+
+    Com `raise_on_error=True` (uso pelo worker da fila) a exceção é propagada
+    sem marcar o documento como `error`, para que o job possa ser re-tentado.
+    `pages` permite trocar a fonte das páginas (ex.: a importação em massa extrai
+    no seu próprio pool) e `embedder` substituir o modelo de embeddings.
+    Retorna o número de chunks.
     """
-    print(f"🤖 IA: Iniciando processamento do documento {doc_id}...")
+    log_fields = {"document_id": str(doc_id)}
+    logger.info("Ingestão iniciada", extra=log_fields)
+    started = time.perf_counter()
 
+    embedder = embedder or get_embeddings()
     db: Session = SessionLocal()
+    document = None
 
     try:
         document = db.query(Document).filter(Document.id == doc_id).first()
         if not document:
-            print("❌ IA: Documento não encontrado no banco.")
-            return
+            logger.warning("Documento não encontrado no banco", extra=log_fields)
+            return 0
+        _lock_unless_deleting(db, doc_id)
+        # Garante a coleção (e as tabelas do PGVector) antes de qualquer SQL nelas
+        vector_store = get_vector_store()
+
+        # Re-tentativas não podem duplicar vetores de uma execução anterior parcial
+        if delete_vectors_by_document_id(str(doc_id)):
+            bump_corpus_version(db, document.uploaded_by)
+        invalidate_answers_for_document(db, doc_id)
+        _record_progress(
+            document,
+            "extracting",
+            total_chunks=0,
+            pages_total=pdf_page_count(file_path),
+            pages_extracted=0,
+            ingestion_error=None,
+            progress_started_at=func.now(),
+        )
+        db.commit()
+
+        base_metadata = {
+            "document_id": str(doc_id),
+            "source": document.filename,
+            "user_id": str(document.uploaded_by),
+        }
+
+        logger.info("Lendo arquivo físico", extra={**log_fields, "file_path": file_path})
+        # Extração e split são intercalados: cada um é medido pelo tempo dentro do seu next()
+        extract_clock, split_clock = StageClock(), StageClock()
+        pages = extract_clock.wrap(iter_pdf_pages(file_path) if pages is None else pages)
+        pages_extracted = 0
+
+        def count_pages(pages):
+            nonlocal pages_extracted
+            for page in pages:
+                pages_extracted += 1
+                yield page
+
+        chunks = split_clock.wrap(iter_chunks(count_pages(pages), get_text_splitter()))
+        batches = iter_batches(chunks, settings.INGESTION_EMBED_BATCH_SIZE)
+
+        max_in_flight = settings.INGESTION_EMBED_CONCURRENCY
+        total_chunks = 0
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            in_flight = deque()
+
+            def flush_oldest():
+                nonlocal total_chunks
+                texts, future = in_flight.popleft()
+                vectors = future.result()
+                with INGESTION_STAGE_SECONDS.time("insert"):
+                    _lock_unless_deleting(db, doc_id)
+                    vector_store.add_embeddings(
+                        texts=texts,
+                        embeddings=vectors,
+                        # chunk_index permite reordenar/emendar trechos vizinhos no prompt
+                        metadatas=[{**base_metadata, "chunk_index": total_chunks + i} for i in range(len(texts))],
+                    )
+                    total_chunks += len(texts)
+                    _record_progress(document, "embedding", total_chunks=total_chunks, pages_extracted=pages_extracted)
+                    db.commit()
 
-        # 1. Extração
-        print(f"📖 IA: Lendo arquivo físico: {file_path}")
-        raw_text = extract_text_from_pdf(file_path)
+            for batch in batches:
+                # Backpressure: no máximo `max_in_flight` lotes aguardando embedding
+                if len(in_flight) >= max_in_flight:
+                    flush_oldest()
+                in_flight.append((batch, pool.submit(_embed_batch, embedder, batch)))
 
-        if not raw_text.strip():
-            print("⚠️ IA: Arquivo vazio ou ilegível.")
+            while in_flight:
+                flush_oldest()
+
+        if extract_clock.spent:
+            INGESTION_STAGE_SECONDS.observe(extract_clock.spent, "extract")
+        INGESTION_STAGE_SECONDS.observe(max(split_clock.spent - extract_clock.spent, 0.0), "split")
+
+        # O documento pode ter sido marcado para deleção depois do último lote
+        _lock_unless_deleting(db, doc_id, exclusive=True)
+
+        if total_chunks == 0:
+            logger.warning("Arquivo vazio ou ilegível", extra=log_fields)
             document.status = "error"
+            _record_progress(document, "failed", pages_extracted=pages_extracted, ingestion_error="Arquivo vazio ou ilegível.")
             db.commit()
-            return
+            return 0
+
+        document.status = "active"
+        _record_progress(document, "done", total_chunks=total_chunks, pages_extracted=pages_extracted)
+        bump_corpus_version(db, document.uploaded_by)
+        db.commit()
 
-        # 2. Chunking
-        print("✂️ IA: Dividindo texto em chunks...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", " ", ""]
+        logger.info(
+            "Ingestão concluída",
+            extra={**log_fields, "chunks": total_chunks, "duration_s": round(time.perf_counter() - started, 3)},
         )
-        chunks = text_splitter.split_text(raw_text)
-        print(f"🧩 Gerados {len(chunks)} chunks.")
+        return total_chunks
 
-        # 3. Vector DB (Embeddings)
-        print("🧠 IA: Gerando embeddings e salvando no PGVector...")
-        vector_store = get_vector_store()
+    except IngestionCancelled:
+        # Os vetores já gravados ficam para a purga do worker
+        logger.info("Documento marcado para deleção; ingestão interrompida", extra=log_fields)
+        db.rollback()
+        return 0
+    except Exception as e:
+        logger.exception("Erro ao processar documento", extra={**log_fields, "error": str(e)})
+        db.rollback()
+        if raise_on_error:
+            raise
+        if document:
+            document.status = "error"
+            _record_progress(document, "failed", ingestion_error=str(e))
+            db.commit()
+        return 0
+    finally:
+        db.close()
 
-        # Preparar metadados
-        metadatas = []
-        for _ in chunks:
-            metadatas.append(
-                {
-                    "document_id": str(doc_id),
-                    "source": document.filename,
-                    "user_id": str(document.uploaded_by),
-                }
-            )
 
-        vector_store.add_texts(texts=chunks, metadatas=metadatas)
+# Tentativas de aplicar a substituição quando os chunks mudam entre o embedding e o lock
+REPLACE_MAX_ROUNDS = 3
 
-        # 4. Atualizar DB Relacional
-        document.status = "active"
-        document.total_chunks = len(chunks)
+
+@dataclass
+class ChunkDiff:
+    new: List[int]               # posições (no arquivo novo) dos chunks a embedar
+    moved: List[Tuple[str, int]]  # (id do vetor, novo chunk_index) dos mantidos que mudaram de posição
+    vanished: List[str]          # ids dos vetores cujo texto não existe mais
+    kept: int
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def diff_chunks(chunks: List[str], existing: List[Tuple[str, str, Optional[int]]]) -> ChunkDiff:
+    """
+    Casa os chunks novos com os vetores existentes `(id, hash, chunk_index)`
+    pelo hash do texto. Chunks repetidos casam um a um, na ordem do documento.
+    """
+    by_hash = defaultdict(deque)
+    for row_id, row_hash, row_index in sorted(existing, key=lambda row: (row[2] is None, row[2] or 0)):
+        by_hash[row_hash].append((row_id, row_index))
+
+    new, moved, kept = [], [], 0
+    for index, text in enumerate(chunks):
+        matches = by_hash.get(chunk_hash(text))
+        if not matches:
+            new.append(index)
+            continue
+        row_id, row_index = matches.popleft()
+        kept += 1
+        if row_index != index:
+            moved.append((row_id, index))
+
+    vanished = [row_id for matches in by_hash.values() for row_id, _ in matches]
+    return ChunkDiff(new=new, moved=moved, vanished=vanished, kept=kept)
+
+
+def _embed_all(embedder: Embeddings, texts: List[str]) -> List[List[float]]:
+    batches = list(iter_batches(texts, settings.INGESTION_EMBED_BATCH_SIZE))
+    if not batches:
+        return []
+    with ThreadPoolExecutor(max_workers=settings.INGESTION_EMBED_CONCURRENCY) as pool:
+        return [vector for vectors in pool.map(partial(_embed_batch, embedder), batches) for vector in vectors]
+
+
+def _remove_unreferenced_file(db: Session, file_path: Optional[str]):
+    # Arquivos são endereçados por conteúdo: só apaga se nenhum documento usa mais
+    if not file_path or db.query(Document.id).filter(Document.file_path == file_path).first():
+        return
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("Erro ao apagar arquivo antigo", extra={"file_path": file_path, "error": str(e)})
+
+
+def replace_document_content(
+    doc_id: uuid.UUID,
+    file_path: str,
+    raise_on_error: bool = False,
+    embedder: Optional[Embeddings] = None,
+    collection_name: str = "documents",
+) -> int:
+    """
+    Substitui o conteúdo de um documento já ingerido reaproveitando os chunks
+    que não mudaram:
+    1. Extrai e divide o arquivo novo (mesmo chunking determinístico da ingestão).
+    2. Compara o SHA-256 de cada chunk com o dos vetores gravados do documento.
+    3. Gera embeddings só dos chunks novos.
+    4. Numa única transação (com a linha do documento travada e o diff refeito
+       sobre o estado atual): apaga os vetores que sumiram, renumera os
+       mantidos, insere os novos e atualiza o Document. Nenhuma chamada ao
+       modelo de embeddings acontece com a trava ou a transação abertas.
+
+    O custo de embedding é proporcional ao tamanho da edição, e o retrieval
+    nunca vê o documento pela metade: até o commit ele enxerga só o conteúdo
+    antigo. O documento continua `active` o tempo todo, inclusive se falhar
+    (com `raise_on_error=True`, uso pelo worker, a exceção é propagada para o
+    job ser re-tentado). Retorna o número de chunks da nova versão.
+    """
+    log_fields = {"document_id": str(doc_id)}
+    logger.info("Substituição de conteúdo iniciada", extra={**log_fields, "file_path": file_path})
+    started = time.perf_counter()
+
+    embedder = embedder or get_embeddings()
+    db: Session = SessionLocal()
+    document = None
+
+    try:
+        document = db.query(Document).filter(Document.id == doc_id).first()
+        if not document:
+            logger.warning("Documento não encontrado no banco", extra=log_fields)
+            return 0
+        pages_total = pdf_page_count(file_path)
+        _record_progress(
+            document,
+            "extracting",
+            pages_total=pages_total,
+            pages_extracted=0,
+            ingestion_error=None,
+            progress_started_at=func.now(),
+        )
+        db.commit()
+
+        extract_clock, split_clock = StageClock(), StageClock()
+        pages = extract_clock.wrap(iter_pdf_pages(file_path))
+        chunks = list(split_clock.wrap(iter_chunks(pages, get_text_splitter())))
+        INGESTION_STAGE_SECONDS.observe(extract_clock.spent, "extract")
+        INGESTION_STAGE_SECONDS.observe(max(split_clock.spent - extract_clock.spent, 0.0), "split")
+        if not chunks:
+            raise ValueError("Arquivo vazio ou ilegível.")
+        content_hash = file_sha256(file_path)
+        _record_progress(document, "embedding", pages_extracted=pages_total)
         db.commit()
 
-        print(f"✅ IA: Documento {doc_id} processado com sucesso! Status: active")
+        # Garante a coleção antes de inserir nela por SQL
+        get_vector_store(collection_name)
+
+        # Embeddings (chamadas de rede) saem de qualquer transação: o diff é
+        # calculado e embedado sem lock, e refeito sob o lock antes de aplicar.
+        # Se outra substituição mudou os chunks nesse meio tempo, embeda o que
+        # faltar fora do lock e tenta de novo.
+        vectors_by_hash = {}
+        for _ in range(REPLACE_MAX_ROUNDS):
+            diff = diff_chunks(chunks, load_chunk_hashes(db.connection(), str(doc_id), collection_name))
+            db.rollback()
+            missing = {}
+            for i in diff.new:
+                missing.setdefault(chunk_hash(chunks[i]), chunks[i])
+            for key in vectors_by_hash:
+                missing.pop(key, None)
+            if missing:
+                vectors_by_hash.update(zip(missing, _embed_all(embedder, list(missing.values()))))
+
+            # O lock na linha do documento serializa substituições concorrentes e a
+            # marcação para deleção
+            document = db.query(Document).filter(Document.id == doc_id).with_for_update().first()
+            if not document or document.status == "deleting":
+                logger.info("Documento inexistente ou em deleção; substituição descartada", extra=log_fields)
+                db.rollback()
+                return 0
+
+            conn = db.connection()
+            diff = diff_chunks(chunks, load_chunk_hashes(conn, str(doc_id), collection_name))
+            new_texts = [chunks[i] for i in diff.new]
+            if all(chunk_hash(text) in vectors_by_hash for text in new_texts):
+                break
+            db.rollback()
+        else:
+            raise RuntimeError("Os chunks do documento mudaram durante a substituição; tente novamente.")
+        vectors = [vectors_by_hash[chunk_hash(text)] for text in new_texts]
+
+        base_metadata = {
+            "document_id": str(doc_id),
+            "source": document.filename,
+            "user_id": str(document.uploaded_by),
+        }
+        with INGESTION_STAGE_SECONDS.time("insert"):
+            delete_vectors_by_ids(conn, diff.vanished)
+            reindex_vectors(conn, diff.moved)
+            insert_vectors(
+                conn,
+                new_texts,
+                vectors,
+                [{**base_metadata, "chunk_index": i} for i in diff.new],
+                collection_name,
+            )
+
+            old_file_path = document.file_path
+            document.file_path = file_path
+            document.content_hash = content_hash
+            document.status = "active"
+            _record_progress(document, "done", total_chunks=len(chunks))
+            if diff.new or diff.vanished:
+                bump_corpus_version(db, document.uploaded_by)
+                invalidate_answers_for_document(db, doc_id)
+            db.commit()
+
+        if old_file_path != file_path:
+            _remove_unreferenced_file(db, old_file_path)
+
+        logger.info(
+            "Substituição de conteúdo concluída",
+            extra={
+                **log_fields,
+                "chunks": len(chunks),
+                "embedded": len(vectors_by_hash),
+                "kept": diff.kept,
+                "deleted": len(diff.vanished),
+                "duration_s": round(time.perf_counter() - started, 3),
+            },
+        )
+        return len(chunks)
 
     except Exception as e:
-        print(f"🔥 IA: Erro ao processar: {e}")
+        logger.exception("Erro ao substituir conteúdo do documento", extra={**log_fields, "error": str(e)})
+        db.rollback()
+        if raise_on_error:
+            raise
         if document:
-            document.status = "error"
-            # Opcional: salvar mensagem de erro
+            _record_progress(document, "failed", ingestion_error=str(e))
             db.commit()
+        return 0
     finally:
         db.close()
@@ -0,0 +1,171 @@
+import time
+import uuid
+import hashlib
+import threading
+from array import array
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document as LCDocument
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.schemas import Document, User
+from app.services.ai.vector import get_async_vector_store, get_embeddings
+from app.services.ai.hybrid import ahybrid_available, ahybrid_search
+
+# Embeddings de uma pergunta não mudam: o LRU só limita por tamanho
+_NO_EXPIRY_SECONDS = 10 * 365 * 24 * 3600
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?!.;: ")
+
+
+def _vector_key(vector: List[float]) -> str:
+    return hashlib.sha1(array("d", vector).tobytes()).hexdigest()
+
+
+class _LevelStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+    def record_miss(self, seconds: float):
+        self.misses += 1
+        self.miss_seconds += seconds
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        avg_miss_ms = (self.miss_seconds / self.misses * 1000) if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "avg_miss_ms": avg_miss_ms,
+            # Estimativa: cada hit economiza o custo médio de um miss
+            "saved_ms": self.hits * avg_miss_ms,
+        }
+
+
+class RetrievalCache:
+    """
+    Cache de dois níveis para o retrieval do chat:
+    1. pergunta normalizada -> embedding da pergunta;
+    2. (user_id, vetor, k, versão do corpus do usuário, modo) -> chunks recuperados.
+
+    A versão do corpus (`app.users.corpus_version`) é incrementada a cada
+    ingestão/remoção de documento do usuário, então uma entrada antiga
+    simplesmente deixa de ser encontrada (invalidação exata, sem adivinhar TTL).
+    """
+
+    def __init__(self, embedding_size: int, result_size: int, result_ttl_seconds: int):
+        self.query_embeddings = TTLCache(_NO_EXPIRY_SECONDS, embedding_size)
+        self.results = TTLCache(result_ttl_seconds, result_size)
+        self.embedding_stats = _LevelStats()
+        self.result_stats = _LevelStats()
+        self._lock = threading.Lock()
+
+    async def aembed_question(self, question: str) -> List[float]:
+        key = normalize_question(question)
+        vector = self.query_embeddings.get(key)
+        if vector is not None:
+            with self._lock:
+                self.embedding_stats.hits += 1
+            return vector
+
+        start = time.perf_counter()
+        vector = await get_embeddings().aembed_query(question)
+        with self._lock:
+            self.embedding_stats.record_miss(time.perf_counter() - start)
+        self.query_embeddings.set(key, vector)
+        return vector
+
+    async def aretrieve(self, question: str, user_id: str, k: int = 5, mode: str = "vector") -> List[LCDocument]:
+        version, hidden_ids = await aget_corpus_state(user_id)
+        vector = await self.aembed_question(question)
+
+        if mode == "hybrid" and not await ahybrid_available():
+            mode = "vector"
+        # Na busca híbrida o texto também entra na query léxica
+        lexical_key = normalize_question(question) if mode == "hybrid" else None
+        key = (user_id, _vector_key(vector), k, version, mode, lexical_key)
+        docs = self.results.get(key)
+        if docs is not None:
+            with self._lock:
+                self.result_stats.hits += 1
+            return docs
+
+        start = time.perf_counter()
+        if mode == "hybrid":
+            docs = await ahybrid_search(question, vector, user_id, k=k, hidden_document_ids=hidden_ids)
+        else:
+            docs = await get_async_vector_store().asimilarity_search_by_vector(
+                vector, k=k, filter=retrieval_filter(user_id, hidden_ids)
+            )
+        with self._lock:
+            self.result_stats.record_miss(time.perf_counter() - start)
+        self.results.set(key, docs)
+        return docs
+
+    def stats(self) -> dict:
+        return {
+            "query_embeddings": {**self.embedding_stats.as_dict(), "size": len(self.query_embeddings)},
+            "results": {**self.result_stats.as_dict(), "size": len(self.results)},
+        }
+
+
+retrieval_cache = RetrievalCache(
+    embedding_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+    result_size=settings.RETRIEVAL_CACHE_SIZE,
+    result_ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+)
+
+
+def _corpus_state_query(user_id: str):
+    uid = uuid.UUID(str(user_id))
+    # Só documentos `active` aparecem no retrieval: os em ingestão (lotes já
+    # gravados de um documento parcial), com erro ou em deleção ficam ocultos
+    hidden = (
+        select(func.array_agg(cast(Document.id, String)))
+        .where(Document.uploaded_by == uid, Document.status != "active")
+        .scalar_subquery()
+    )
+    return select(User.corpus_version, hidden.label("hidden_ids")).where(User.id == uid)
+
+
+async def aget_corpus_state(user_id: str) -> Tuple[Optional[int], List[str]]:
+    """
+    Versão do corpus do usuário e ids dos documentos ocultos, numa única query.
+    Um documento só entra ou sai do conjunto `active` junto com um incremento da
+    versão (ingestão concluída, marcação para deleção), então os dois andam juntos.
+    """
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(_corpus_state_query(user_id))).first()
+    if row is None:
+        return None, []
+    return row.corpus_version, row.hidden_ids or []
+
+
+def retrieval_filter(user_id: str, hidden_ids: List[str]) -> dict:
+    """
+    Filtro de metadados do PGVector. `$in`/`$nin` viram `cmetadata->>'campo' IN (...)`,
+    que usa os índices de expressão; a igualdade simples (`{"user_id": id}`) vira
+    `jsonb_path_match`, que nenhum índice atende.
+    """
+    user_filter = {"user_id": {"$in": [user_id]}}
+    if not hidden_ids:
+        return user_filter
+    return {**user_filter, "document_id": {"$nin": hidden_ids}}
+
+
+def bump_corpus_version(db: Session, user_id) -> None:
+    """
+    Invalida o cache de retrieval do usuário. Não faz commit: deve entrar na
+    mesma transação da mudança de documentos.
+    """
+    db.query(User).filter(User.id == user_id).update(
+        {User.corpus_version: User.corpus_version + 1}, synchronize_session=False
+    )
@@ -0,0 +1,102 @@
+import uuid
+import logging
+from typing import List
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.schemas import Conversation, Message, SenderType
+from app.services.ai.agent import get_llm
+from app.services.ai.context import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """
+    Você mantém o resumo de uma conversa entre um usuário e um assistente jurídico.
+    Atualize o resumo existente incorporando as novas mensagens. Preserve fatos,
+    nomes, números de cláusulas, leis, valores e decisões; descarte cortesias.
+    Responda apenas com o novo resumo, em Português do Brasil, em no máximo 300 palavras.
+
+    Resumo atual:
+    {summary}
+    """,
+        ),
+        ("user", "Novas mensagens:\n{messages}"),
+    ]
+)
+
+def _format_messages(messages) -> List[str]:
+    return [
+        f"{'Usuário' if m.sender_type == SenderType.USER else 'Assistente'}: {m.content}\n"
+        for m in messages
+    ]
+
+
+async def aupdate_conversation_summary(conversation_id: uuid.UUID):
+    """
+    Incorpora ao resumo da conversa as mensagens antigas que ainda não foram
+    resumidas, mantendo de fora as SUMMARY_KEEP_MESSAGES mais recentes. Só roda
+    quando essas mensagens passam de SUMMARY_TRIGGER_TOKENS, ou quando as não
+    resumidas já não cabem em HISTORY_TOKEN_BUDGET (senão as mais antigas
+    ficariam fora do prompt e do resumo).
+
+    Executado em background depois da resposta; nenhuma conexão fica presa
+    durante a chamada ao LLM.
+    """
+    async with AsyncSessionLocal() as db:
+        conversation = (
+            await db.execute(
+                select(Conversation.summary, Conversation.summarized_until).where(Conversation.id == conversation_id)
+            )
+        ).first()
+        if conversation is None:
+            return
+
+        query = select(Message.sender_type, Message.content, Message.created_at).where(
+            Message.conversation_id == conversation_id
+        )
+        if conversation.summarized_until is not None:
+            query = query.where(Message.created_at > conversation.summarized_until)
+        messages = (await db.execute(query.order_by(Message.created_at.asc()))).all()
+
+    cut = max(len(messages) - settings.SUMMARY_KEEP_MESSAGES, 0)
+    # summarized_until é um timestamp: não separar mensagens com o mesmo created_at
+    while 0 < cut < len(messages) and messages[cut - 1].created_at == messages[cut].created_at:
+        cut -= 1
+    if cut <= 0:
+        return
+
+    all_lines = _format_messages(messages)
+    lines = all_lines[:cut]
+    if (
+        sum(count_tokens(line) for line in lines) < settings.SUMMARY_TRIGGER_TOKENS
+        and sum(count_tokens(line) for line in all_lines) <= settings.HISTORY_TOKEN_BUDGET
+    ):
+        return
+
+    try:
+        summary_chain = SUMMARY_PROMPT | get_llm() | StrOutputParser()
+        new_summary = await summary_chain.ainvoke(
+            {"summary": conversation.summary or "(vazio)", "messages": "".join(lines)}
+        )
+    except Exception as e:
+        logger.warning("Falha ao resumir a conversa", extra={"conversation_id": str(conversation_id), "error": str(e)})
+        return
+
+    async with AsyncSessionLocal() as db:
+        # Concorrência otimista: outro turno pode ter atualizado o resumo nesse meio tempo
+        await db.execute(
+            update(Conversation)
+            .where(
+                Conversation.id == conversation_id,
+                Conversation.summarized_until.is_not_distinct_from(conversation.summarized_until),
+            )
+            .values(summary=new_summary, summarized_until=messages[cut - 1].created_at)
+        )
+        await db.commit()
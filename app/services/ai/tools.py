@@ -1,34 +1,120 @@
+import logging
+import threading
 import fitz
 from pathlib import Path
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 
-def extract_text_from_pdf(file_path: str) -> str:
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
     """
-    Lê um arquivo PDF do disco e retorna todo o seu conteúdo como uma única string.
+    Pool de processos compartilhado (criado sob demanda) para extração de páginas.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.PDF_EXTRACT_WORKERS)
+        return _pool
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """
+    Executado no processo filho: cada worker abre o arquivo por conta própria.
     """
+    doc = fitz.open(file_path)
     try:
-        doc = fitz.open(file_path)
-        # print(f"📄 Extraindo texto do PDF: {file_path}, Total de páginas: {doc.page_count}")
+        return [doc[i].get_text() for i in range(start, end)]
+    finally:
+        doc.close()
+
+
+def pdf_page_count(file_path: str) -> int:
+    doc = fitz.open(file_path)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
 
-        with open("output.txt", "w", encoding="utf-8") as out:
-            # print("📄 Iniciando extração de texto...")
-            full_text = []
+def iter_pdf_pages(
+    file_path: str,
+    workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+    pool: Optional[Executor] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Gera `(numero_da_pagina, texto)` em ordem (páginas numeradas a partir de 1).
 
+    PDFs grandes têm seus intervalos de páginas distribuídos num pool de processos;
+    no máximo `2 * workers` intervalos ficam em voo, então o consumidor pode começar
+    a trabalhar antes da extração terminar sem que a memória cresça com o documento.
+    Com `pool` (ex.: o da importação em massa) a extração sempre roda nele, mesmo
+    para PDFs pequenos.
+    """
+    workers = workers or settings.PDF_EXTRACT_WORKERS
+    pages_per_task = pages_per_task or settings.PDF_PAGES_PER_TASK
+
+    doc = fitz.open(file_path)
+    try:
+        page_count = doc.page_count
+        if pool is None and (workers <= 1 or page_count < settings.PDF_PARALLEL_MIN_PAGES):
             for page in doc:
-                text = page.get_text() 
-                
-                # print(f"📄 Página {page.number + 1}: {len(text)} caracteres extraídos.")
-                
+                yield page.number + 1, page.get_text()
+            return
+    finally:
+        doc.close()
+
+    pool = pool or _get_pool()
+    ranges = deque(
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    )
+    in_flight = deque()
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < workers * 2:
+                start, end = ranges.popleft()
+                in_flight.append((start, pool.submit(_extract_page_range, file_path, start, end)))
+
+            start, future = in_flight.popleft()
+            for offset, text in enumerate(future.result()):
+                yield start + offset + 1, text
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+
+def extract_text_from_pdf(file_path: str, debug_dump_path: Optional[str] = None) -> str:
+    """
+    Lê um arquivo PDF do disco e retorna todo o seu conteúdo como uma única string.
+
+    O dump de depuração (texto com separador de página `\\f`) só é gravado quando
+    `debug_dump_path` (ou PDF_DEBUG_DUMP_PATH) é informado.
+    """
+    debug_dump_path = debug_dump_path or settings.PDF_DEBUG_DUMP_PATH
+    try:
+        full_text = []
+        out = open(debug_dump_path, "w", encoding="utf-8") if debug_dump_path else None
+        try:
+            for _, text in iter_pdf_pages(file_path):
                 full_text.append(text)
-                
-                out.write(text)
-                out.write("\n\f") 
+                if out:
+                    out.write(text)
+                    out.write("\n\f")
+        finally:
+            if out:
+                out.close()
+
+        return "\n".join(full_text)
 
-            out.close()
-            return "\n".join(full_text)
-        
     except Exception as e:
-        print(f"Erro ao ler PDF {file_path}: {e}")
+        logger.error("Erro ao ler PDF", extra={"file_path": file_path, "error": str(e)})
         raise e
-    finally:
-        if 'doc' in locals():
-            doc.close()
\ No newline at end of file
@@ -1,7 +1,19 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_postgres import PGVector
+import json
+import uuid
+import logging
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
 from app.core.config import settings
+from app.services.ai.embedding_cache import CachedEmbeddings
+from app.services.ai.indexes import configure_search_settings
+
+if TYPE_CHECKING:
+    from langchain_postgres import PGVector
+
+logger = logging.getLogger(__name__)
 
 # Define connection string. Ensure we use the correct driver if needed.
 # langchain-postgres recommends psycopg (v3) but works with drivers supported by SQLAlchemy if configured.
@@ -9,53 +21,307 @@ from app.core.config import settings
 CONNECTION_STRING = settings.DATABASE_URL.replace(
     "postgresql://", "postgresql+psycopg2://"
 )
-
-embeddings = OpenAIEmbeddings(
-    model=settings.EMBEDDING_MODEL, openai_api_key=settings.OPENAI_API_KEY
+# O modo assíncrono do langchain-postgres exige psycopg (v3)
+ASYNC_CONNECTION_STRING = settings.DATABASE_URL.replace(
+    "postgresql://", "postgresql+psycopg://"
 )
 
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """
+    Modelo de embeddings compartilhado, criado no primeiro uso: importar o
+    módulo não carrega o cliente da OpenAI.
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    model = OpenAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        openai_api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+    )
+    # Ingestão e consultas passam pelo cache de embeddings (memória + app.embedding_cache)
+    if settings.EMBEDDING_CACHE_ENABLED:
+        model = CachedEmbeddings(
+            model,
+            model_name=settings.EMBEDDING_MODEL,
+            memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+        )
+    return model
+
+
+class VectorStoreRegistry:
+    """
+    Mantém uma instância de PGVector por coleção (sync e async), criada sob demanda
+    sobre engines compartilhadas e com pool dimensionado. Evita reconstruir o
+    store (e re-checar a coleção) e abrir pools novos a cada request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine = None
+        self._async_engine = None
+        self._stores = {}
+        self._async_stores = {}
+
+    @property
+    def engine(self):
+        with self._lock:
+            if self._engine is None:
+                self._engine = create_engine(
+                    CONNECTION_STRING,
+                    pool_size=settings.VECTOR_POOL_SIZE,
+                    max_overflow=settings.VECTOR_MAX_OVERFLOW,
+                    pool_pre_ping=True,
+                    pool_recycle=settings.VECTOR_POOL_RECYCLE_SECONDS,
+                )
+                configure_search_settings(self._engine)
+            return self._engine
+
+    @property
+    def async_engine(self):
+        with self._lock:
+            if self._async_engine is None:
+                self._async_engine = create_async_engine(
+                    ASYNC_CONNECTION_STRING,
+                    pool_size=settings.VECTOR_POOL_SIZE,
+                    max_overflow=settings.VECTOR_MAX_OVERFLOW,
+                    pool_pre_ping=True,
+                    pool_recycle=settings.VECTOR_POOL_RECYCLE_SECONDS,
+                )
+                configure_search_settings(self._async_engine)
+            return self._async_engine
+
+    def get(self, collection_name: str) -> "PGVector":
+        store = self._stores.get(collection_name)
+        if store is None:
+            from langchain_postgres import PGVector
+
+            engine = self.engine
+            model = get_embeddings()
+            with self._lock:
+                store = self._stores.get(collection_name)
+                if store is None:
+                    store = PGVector(
+                        embeddings=model,
+                        collection_name=collection_name,
+                        connection=engine,
+                        embedding_length=settings.EMBEDDING_DIMENSIONS,
+                        use_jsonb=True,
+                    )
+                    self._stores[collection_name] = store
+        return store
+
+    def get_async(self, collection_name: str) -> "PGVector":
+        store = self._async_stores.get(collection_name)
+        if store is None:
+            from langchain_postgres import PGVector
+
+            engine = self.async_engine
+            model = get_embeddings()
+            with self._lock:
+                store = self._async_stores.get(collection_name)
+                if store is None:
+                    store = PGVector(
+                        embeddings=model,
+                        collection_name=collection_name,
+                        connection=engine,
+                        embedding_length=settings.EMBEDDING_DIMENSIONS,
+                        use_jsonb=True,
+                        async_mode=True,
+                    )
+                    self._async_stores[collection_name] = store
+        return store
+
+    def pools(self) -> dict:
+        """Pools já criados (engines são lazy), indexados por "sync"/"async"."""
+        pools = {}
+        if self._engine is not None:
+            pools["sync"] = self._engine.pool
+        if self._async_engine is not None:
+            pools["async"] = self._async_engine.sync_engine.pool
+        return pools
+
+    def pool_stats(self) -> dict:
+        stats = {}
+        for name, pool in self.pools().items():
+            stats[name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            }
+        return stats
+
+    async def dispose(self):
+        with self._lock:
+            engine, async_engine = self._engine, self._async_engine
+            self._engine = None
+            self._async_engine = None
+            self._stores.clear()
+            self._async_stores.clear()
+        if engine is not None:
+            engine.dispose()
+        if async_engine is not None:
+            await async_engine.dispose()
+
+
+vector_stores = VectorStoreRegistry()
+
 
 def get_vector_store(collection_name: str = "documents"):
     """
-    Retorna a instância do PGVector conectada ao banco.
+    Retorna a instância (compartilhada) do PGVector conectada ao banco.
+    """
+    return vector_stores.get(collection_name)
+
+
+def get_async_vector_store(collection_name: str = "documents"):
     """
-    return PGVector(
-        embeddings=embeddings,
-        collection_name=collection_name,
-        connection=CONNECTION_STRING,
-        use_jsonb=True,
+    Retorna a instância (compartilhada) do PGVector em modo assíncrono (para `ainvoke`/`astream`).
+    """
+    return vector_stores.get_async(collection_name)
+
+
+# Deleções em lotes curtos: nenhum DELETE segura locks de milhares de linhas por muito tempo
+DELETE_DOCUMENT_VECTORS_BATCH_SQL = text("""
+    DELETE FROM langchain_pg_embedding
+    WHERE id IN (
+        SELECT id FROM langchain_pg_embedding
+        WHERE cmetadata->>'document_id' = :doc_id
+        LIMIT :batch_size
     )
+""")
+
+DELETE_ORPHAN_VECTORS_BATCH_SQL = text("""
+    DELETE FROM langchain_pg_embedding
+    WHERE id IN (
+        SELECT e.id FROM langchain_pg_embedding e
+        JOIN langchain_pg_collection c ON c.uuid = e.collection_id
+        WHERE c.name = :collection
+          AND e.cmetadata->>'document_id' IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM app.documents d WHERE d.id::text = e.cmetadata->>'document_id'
+          )
+        LIMIT :batch_size
+    )
+""")
+
+
+def delete_vector_batch(conn, doc_id: str, batch_size: int) -> int:
+    """
+    Remove até `batch_size` vetores do documento. Retorna quantos foram
+    removidos; o commit fica com quem chama.
+    """
+    return conn.execute(DELETE_DOCUMENT_VECTORS_BATCH_SQL, {"doc_id": doc_id, "batch_size": batch_size}).rowcount
+
+
+def delete_orphan_vector_batch(conn, batch_size: int, collection_name: str = "documents") -> int:
+    """
+    Remove até `batch_size` vetores cujo `document_id` não existe mais em
+    `app.documents` (ex.: deleções antigas que não limpavam o PGVector).
+    O commit fica com quem chama.
+    """
+    return conn.execute(
+        DELETE_ORPHAN_VECTORS_BATCH_SQL, {"collection": collection_name, "batch_size": batch_size}
+    ).rowcount
 
 
-def delete_vectors_by_document_id(doc_id: str):
+def delete_vectors_by_document_id(doc_id: str, batch_size: Optional[int] = None) -> int:
     """
     Remove todos os vetores associados a um document_id específico.
     Isso é crucial para manter a consistência quando um documento é deletado.
     """
-    # PGVector armazena metadados em JSONB. Podemos filtrar onde cmetadata ->> 'document_id' == doc_id
-    # No entanto, a API do PGVector pode não expor delete_by_metadata de forma trivial em todas as versões.
-    # Vamos usar SQL direto para garantir a limpeza eficiente.
+    # PGVector armazena metadados em JSONB e a API de delete só aceita ids de vetores:
+    # SQL direto sobre cmetadata->>'document_id' (com índice de expressão), em lotes.
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    total = 0
+    with vector_stores.engine.connect() as conn:
+        while True:
+            deleted = delete_vector_batch(conn, doc_id, batch_size)
+            conn.commit()
+            total += deleted
+            if deleted < batch_size:
+                break
 
-    # Assumindo que a tabela padrão do langchain_postgres é `langchain_pg_embedding`
-    # E a coleção é ligada via uuid.
+    logger.info("Vetores do documento removidos", extra={"document_id": doc_id, "vectors": total})
+    return total
 
-    # Melhor abordagem usando o store se disponível:
-    store = get_vector_store()
 
-    # O método delete do PGVector aceita ids de vetores, não filtro de metadados diretamente na v0.0.1+ facilmente sem busca.
-    # Mas podemos fazer uma busca e deletar, ou SQL direto.
-    # SQL direto é mais garantido e performático para "delete cascade" manual.
+# Reingestão incremental (`replace_document_content`): linhas do PGVector manipuladas
+# direto, dentro da transação de quem chama
+DOCUMENT_CHUNK_HASHES_SQL = text("""
+    SELECT e.id,
+           encode(sha256(convert_to(e.document, 'UTF8')), 'hex') AS chunk_hash,
+           (e.cmetadata->>'chunk_index')::int AS chunk_index
+    FROM langchain_pg_embedding e
+    JOIN langchain_pg_collection c ON c.uuid = e.collection_id
+    WHERE c.name = :collection AND e.cmetadata->>'document_id' = :doc_id
+""")
 
-    engine = create_engine(CONNECTION_STRING)
-    with engine.connect() as conn:
-        # A tabela langchain_pg_embedding tem uma coluna 'cmetadata'.
-        # Precisamos apagar onde cmetadata->>'document_id' = doc_id
+DELETE_VECTORS_BY_IDS_SQL = text("""
+    DELETE FROM langchain_pg_embedding WHERE id = ANY(CAST(:ids AS varchar[]))
+""")
 
-        stmt = text("""
-            DELETE FROM langchain_pg_embedding 
-            WHERE cmetadata->>'document_id' = :doc_id
-        """)
-        conn.execute(stmt, {"doc_id": doc_id})
-        conn.commit()
+REINDEX_VECTORS_SQL = text("""
+    UPDATE langchain_pg_embedding e
+    SET cmetadata = jsonb_set(e.cmetadata, '{chunk_index}', to_jsonb(v.chunk_index))
+    FROM unnest(CAST(:ids AS varchar[]), CAST(:chunk_indexes AS int[])) AS v(id, chunk_index)
+    WHERE e.id = v.id
+""")
 
-    print(f"🗑️ Vetores do documento {doc_id} removidos.")
+INSERT_VECTOR_SQL = text("""
+    INSERT INTO langchain_pg_embedding (id, collection_id, embedding, document, cmetadata)
+    SELECT :id, c.uuid, CAST(:embedding AS vector), :document, CAST(:cmetadata AS jsonb)
+    FROM langchain_pg_collection c
+    WHERE c.name = :collection
+""")
+
+
+def load_chunk_hashes(conn, doc_id: str, collection_name: str = "documents") -> List[Tuple[str, str, Optional[int]]]:
+    """
+    (id, SHA-256 do texto, chunk_index) de cada vetor do documento. O hash é
+    calculado no banco: nenhum texto nem embedding trafega.
+    """
+    rows = conn.execute(DOCUMENT_CHUNK_HASHES_SQL, {"collection": collection_name, "doc_id": doc_id})
+    return [(row.id, row.chunk_hash, row.chunk_index) for row in rows]
+
+
+def delete_vectors_by_ids(conn, ids: List[str]) -> int:
+    if not ids:
+        return 0
+    return conn.execute(DELETE_VECTORS_BY_IDS_SQL, {"ids": ids}).rowcount
+
+
+def reindex_vectors(conn, moves: List[Tuple[str, int]]):
+    """Atualiza o `chunk_index` de vetores mantidos que mudaram de posição."""
+    if moves:
+        ids, chunk_indexes = zip(*moves)
+        conn.execute(REINDEX_VECTORS_SQL, {"ids": list(ids), "chunk_indexes": list(chunk_indexes)})
+
+
+def insert_vectors(
+    conn,
+    texts: List[str],
+    vectors: List[List[float]],
+    metadatas: List[dict],
+    collection_name: str = "documents",
+):
+    """
+    Insere vetores já embedados no mesmo formato do `PGVector.add_embeddings`,
+    mas na transação de `conn` (o PGVector sempre abre e commita a sua).
+    """
+    if not texts:
+        return
+    conn.execute(
+        INSERT_VECTOR_SQL,
+        [
+            {
+                "id": str(uuid.uuid4()),
+                "collection": collection_name,
+                "embedding": "[" + ",".join(map(str, vector)) + "]",
+                "document": content,
+                "cmetadata": json.dumps(metadata),
+            }
+            for content, vector, metadata in zip(texts, vectors, metadatas)
+        ],
+    )
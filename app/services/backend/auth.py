@@ -1,12 +1,19 @@
 import os
-from typing import List
+import inspect
+import logging
+from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
-from app.core.security import TokenUser, validate_token_with_keycloak
-from app.core.database import SessionLocal
+from app.core.security import TokenUser, get_cached_token_user, validate_token_with_keycloak
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import REQUEST_STAGE_SECONDS
+from app.core.database import SessionLocal, get_db
 from app.models.schemas import User as UserModel
 import uuid
 from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 
 KEYCLOAK_URL = os.getenv("KEYCLOAK_URL", "http://localhost:8080")
@@ -15,6 +22,12 @@ TOKEN_URL = f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/token"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=TOKEN_URL)
 
+logger = logging.getLogger(__name__)
+
+# Usuários já sincronizados, indexados pelo `sub` do Keycloak.
+# Guarda instâncias desanexadas da sessão (somente leitura nas rotas).
+user_cache = TTLCache(settings.USER_CACHE_TTL_SECONDS, settings.USER_CACHE_MAX_SIZE)
+
 
 def get_db_session():
     db = SessionLocal()
@@ -24,26 +37,52 @@ def get_db_session():
         db.close()
 
 
+def _determine_role(token_user: TokenUser) -> str:
+    return "admin" if "admin" in token_user.roles else "viewer"
+
+
+def _email_taken(db: Session, email: str, user_id) -> bool:
+    return db.query(UserModel.id).filter(UserModel.email == email, UserModel.id != user_id).first() is not None
+
+
 def sync_user_to_db(token_user: TokenUser, db: Session) -> UserModel:
     """
     Sincroniza o usuário do Token (Keycloak) com o Banco Local.
     """
     db_user = db.query(UserModel).filter(UserModel.id == token_user.id).first()
 
-    determined_role = "admin" if "admin" in token_user.roles else "viewer"
+    determined_role = _determine_role(token_user)
     
     if db_user:
-        if db_user.role != determined_role:
+        if db_user.role != determined_role or db_user.email != token_user.username:
             db_user.role = determined_role
-            db.commit()
+            if db_user.email != token_user.username and _email_taken(db, token_user.username, db_user.id):
+                # `email` é único: outro usuário local já usa o email novo do token.
+                # Mantém o email antigo e sincroniza só a role, sem derrubar o request.
+                logger.warning(
+                    "Email %s já pertence a outro usuário; mantendo %s para %s",
+                    token_user.username, db_user.email, db_user.id,
+                )
+            else:
+                db_user.email = token_user.username
+            try:
+                db.commit()
+            except IntegrityError:
+                # Corrida com outro request que gravou o mesmo email entre a checagem e o commit
+                db.rollback()
+                db_user = db.query(UserModel).filter(UserModel.id == token_user.id).first()
+                db_user.role = determined_role
+                db.commit()
             db.refresh(db_user)
         return db_user
 
     existing_user_by_email = db.query(UserModel).filter(UserModel.email == token_user.username).first()
 
     if existing_user_by_email:
-        print(f"⚠️ CONFLITO DETECTADO: Email {token_user.username} existe com ID antigo.")
-        print(f"♻️ Atualizando ID de {existing_user_by_email.id} para {token_user.id}")
+        logger.warning(
+            "Email já existe com outro id; atualizando o id do usuário local",
+            extra={"email": token_user.username, "old_id": str(existing_user_by_email.id), "new_id": token_user.id},
+        )
         
         existing_user_by_email.id = uuid.UUID(token_user.id)
         existing_user_by_email.role = determined_role
@@ -64,25 +103,97 @@ def sync_user_to_db(token_user: TokenUser, db: Session) -> UserModel:
     return new_user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserModel:
-    token_user_data = validate_token_with_keycloak(token)
+def get_cached_user(token_user: TokenUser) -> Optional[UserModel]:
+    # Compara com o email do token na última sincronização, não com o do banco:
+    # quando o email novo conflita, o banco mantém o antigo e o cache segue válido.
+    cached = user_cache.get(token_user.id)
+    if cached is None:
+        return None
+    synced_email, user = cached
+    if user.role == _determine_role(token_user) and synced_email == token_user.username:
+        return user
+    return None
+
+
+def resolve_user(token_user: TokenUser, db: Session) -> UserModel:
+    """
+    Retorna o usuário local a partir do cache; só consulta/escreve em
+    `app.users` quando o usuário é novo ou quando role/email do token mudaram.
+    """
+    cached = get_cached_user(token_user)
+    if cached is not None:
+        return cached
 
-    db = SessionLocal()
     try:
-        user_db = sync_user_to_db(token_user_data, db)
-        return user_db
+        user_db = sync_user_to_db(token_user, db)
+        # Desanexa da sessão do request para poder ser reutilizado por outros requests
+        db.expunge(user_db)
     finally:
-        db.close()
+        # Encerra a transação (aberta só para leitura quando nada mudou) e devolve a
+        # conexão ao pool: a sessão do request vive até o fim da resposta/stream
+        db.rollback()
+    user_cache.set(token_user.id, (token_user.username, user_db))
+    return user_db
+
+
+async def _resolve_user(token: str, db: Session, introspect: bool = False) -> UserModel:
+    with REQUEST_STAGE_SECONDS.time("token_validation"):
+        if introspect or settings.TOKEN_VERIFICATION_MODE == "introspection":
+            # Introspecção é uma chamada HTTP síncrona: não pode rodar no event loop
+            token_user_data = await run_in_threadpool(validate_token_with_keycloak, token, True)
+        else:
+            # Token já verificado sai do cache no loop; senão a verificação (que pode
+            # recarregar o JWKS por HTTP) roda numa thread
+            token_user_data = get_cached_token_user(token)
+            if token_user_data is None:
+                token_user_data = await run_in_threadpool(validate_token_with_keycloak, token)
+
+    with REQUEST_STAGE_SECONDS.time("user_sync"):
+        cached = get_cached_user(token_user_data)
+        if cached is not None:
+            return cached
+        # Cache miss: a sincronização usa a sessão síncrona, então sai do event loop
+        return await run_in_threadpool(resolve_user, token_user_data, db)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+) -> UserModel:
+    return await _resolve_user(token, db)
+
+
+async def get_current_user_introspected(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+) -> UserModel:
+    """
+    Variante para rotas sensíveis a revogação: sempre consulta o Keycloak.
+    """
+    return await _resolve_user(token, db, introspect=True)
 
 
 class RoleChecker:
-    def __init__(self, allowed_roles: List[str]):
+    """
+    Exige uma das `allowed_roles`. `user_dependency` define como o usuário é
+    resolvido (ex.: `get_current_user_introspected` nas rotas sensíveis a
+    revogação), assim o token é validado uma única vez por request.
+    """
+
+    def __init__(self, allowed_roles: List[str], user_dependency=get_current_user):
         self.allowed_roles = allowed_roles
+        # O FastAPI lê as dependências da assinatura do callable: troca o default de `user`
+        self.__signature__ = inspect.signature(type(self).__call__).replace(
+            parameters=[
+                inspect.Parameter(
+                    "user", inspect.Parameter.POSITIONAL_OR_KEYWORD, default=Depends(user_dependency), annotation=UserModel
+                )
+            ]
+        )
 
     def __call__(self, user: UserModel = Depends(get_current_user)):
         if user.role not in self.allowed_roles:
-            print(
-                f"DEBUG: Acesso negado. User Role: {user.role} | Allowed: {self.allowed_roles}"
+            logger.info(
+                "Acesso negado: role insuficiente",
+                extra={"user_id": str(user.id), "role": user.role, "allowed_roles": self.allowed_roles},
             )
             raise HTTPException(
                 status_code=403, detail="Acesso negado: Role insuficiente"
@@ -0,0 +1,175 @@
+"""
+Deleção de documentos em duas fases:
+
+1. `mark_documents_deleting` (na request): status `deleting`, caches de
+   retrieval/respostas invalidados e jobs de ingestão cancelados. A partir
+   daí o documento já não aparece no retrieval.
+2. `purge_next_deleting_document` (no worker): apaga os vetores em lotes de
+   DELETION_BATCH_SIZE, atualizando `total_chunks` com o que falta, e por fim
+   o arquivo e a linha do documento.
+
+Também expõe um varredor de vetores órfãos (documento já inexistente).
+
+Uso:
+    uv run python -m app.services.backend.deletion purge
+    uv run python -m app.services.backend.deletion sweep-orphans --batch-size 5000
+"""
+import os
+import logging
+import argparse
+from typing import List, Optional
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import configure_logging
+from app.models.schemas import Document, IngestionJob
+from app.services.ai.answer_cache import invalidate_answers_for_documents
+from app.services.ai.retrieval_cache import bump_corpus_version
+from app.services.ai.vector import delete_orphan_vector_batch, delete_vector_batch, vector_stores
+from app.services.backend.jobs import ACTIVE_JOB_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Quantos candidatos olhar por vez ao procurar um documento livre para purgar
+PURGE_CANDIDATES = 10
+
+
+def mark_documents_deleting(db: Session, conditions: list) -> List:
+    """
+    Marca como `deleting` os documentos que atendem `conditions` (expressões
+    SQLAlchemy sobre Document). Não faz commit: a marcação, a invalidação dos
+    caches e o cancelamento dos jobs entram na mesma transação.
+
+    Retorna as linhas (id, uploaded_by, total_chunks) marcadas.
+    """
+    marked = db.execute(
+        update(Document)
+        .where(*conditions, Document.status != "deleting")
+        .values(status="deleting")
+        .returning(Document.id, Document.uploaded_by, Document.total_chunks)
+    ).all()
+    if not marked:
+        return marked
+
+    doc_ids = [row.id for row in marked]
+    # Ingestão em fila/andamento não deve trazer o documento de volta a `active`
+    db.query(IngestionJob).filter(
+        IngestionJob.document_id.in_(doc_ids),
+        IngestionJob.status.in_(ACTIVE_JOB_STATUSES),
+    ).update({IngestionJob.status: "cancelled"}, synchronize_session=False)
+
+    for user_id in {row.uploaded_by for row in marked}:
+        bump_corpus_version(db, user_id)
+    invalidate_answers_for_documents(db, doc_ids)
+    return marked
+
+
+def _purge_document(conn, doc_id: str, batch_size: int) -> int:
+    total = 0
+    while True:
+        deleted = delete_vector_batch(conn, doc_id, batch_size)
+        conn.execute(
+            text("UPDATE app.documents SET total_chunks = GREATEST(COALESCE(total_chunks, 0) - :n, 0) WHERE id = :id"),
+            {"n": deleted, "id": doc_id},
+        )
+        conn.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+
+def _remove_file(conn, doc_id: str):
+    file_path = conn.execute(
+        text("SELECT file_path FROM app.documents WHERE id = :id"), {"id": doc_id}
+    ).scalar()
+    # Arquivos são endereçados por conteúdo: só apaga se nenhum outro documento usa o mesmo
+    shared = conn.execute(
+        text("SELECT 1 FROM app.documents WHERE file_path = :path AND id <> :id LIMIT 1"),
+        {"path": file_path, "id": doc_id},
+    ).first()
+    if file_path and not shared and os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except Exception as e:
+            logger.warning("Erro ao apagar arquivo", extra={"document_id": doc_id, "file_path": file_path, "error": str(e)})
+
+
+def purge_next_deleting_document(batch_size: Optional[int] = None) -> bool:
+    """
+    Purga um documento em `deleting`. Um advisory lock de sessão por documento
+    evita que dois workers purguem o mesmo, sem manter transação aberta entre
+    os lotes. Retorna False se não havia nada a fazer.
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    with vector_stores.engine.connect() as conn:
+        candidates = conn.execute(
+            text("SELECT id::text FROM app.documents WHERE status = 'deleting' ORDER BY upload_date LIMIT :n"),
+            {"n": PURGE_CANDIDATES},
+        ).scalars().all()
+        conn.commit()
+
+        for doc_id in candidates:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": doc_id}).scalar()
+            conn.commit()
+            if not locked:
+                continue
+            try:
+                removed = _purge_document(conn, doc_id, batch_size)
+                _remove_file(conn, doc_id)
+                conn.execute(
+                    text("DELETE FROM app.documents WHERE id = :id AND status = 'deleting'"), {"id": doc_id}
+                )
+                conn.commit()
+                logger.info("Documento purgado", extra={"document_id": doc_id, "vectors": removed})
+            finally:
+                conn.rollback()
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": doc_id})
+                conn.commit()
+            return True
+    return False
+
+
+def sweep_orphan_vectors(batch_size: Optional[int] = None, collection_name: str = "documents") -> int:
+    """
+    Remove, em lotes, vetores cujo documento não existe mais. Para rodar uma vez
+    após o deploy (deleções antigas não limpavam o PGVector) ou periodicamente.
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    total = 0
+    with vector_stores.engine.connect() as conn:
+        while True:
+            deleted = delete_orphan_vector_batch(conn, batch_size, collection_name)
+            conn.commit()
+            total += deleted
+            if deleted:
+                logger.info("Vetores órfãos removidos", extra={"collection": collection_name, "vectors": total})
+            if deleted < batch_size:
+                return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purga de documentos deletados e de vetores órfãos.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    purge = sub.add_parser("purge", help="Purga agora todos os documentos em `deleting`.")
+    purge.add_argument("--batch-size", type=int, default=settings.DELETION_BATCH_SIZE)
+
+    sweep = sub.add_parser("sweep-orphans", help="Remove vetores de documentos que não existem mais.")
+    sweep.add_argument("--batch-size", type=int, default=settings.DELETION_BATCH_SIZE)
+    sweep.add_argument("--collection", default="documents")
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.command == "purge":
+        purged = 0
+        while purge_next_deleting_document(args.batch_size):
+            purged += 1
+        logger.info("Purga concluída", extra={"documents": purged})
+    else:
+        removed = sweep_orphan_vectors(args.batch_size, args.collection)
+        logger.info("Varredura de órfãos concluída", extra={"collection": args.collection, "vectors": removed})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import uuid
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.schemas import Document, IngestionJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+@dataclass
+class ClaimedJob:
+    id: uuid.UUID
+    document_id: uuid.UUID
+    file_path: str
+    attempts: int
+    max_attempts: int
+    kind: str = "ingest"
+
+
+def enqueue_ingestion(
+    db: Session,
+    document: Document,
+    max_attempts: Optional[int] = None,
+    kind: str = "ingest",
+    file_path: Optional[str] = None,
+) -> IngestionJob:
+    """
+    Adiciona um job de ingestão à fila. Não faz commit: o job deve ser gravado
+    na mesma transação que o Document, para nunca existir documento sem job.
+
+    `kind="replace"` com `file_path` enfileira a troca incremental do conteúdo
+    de um documento já ativo (ver `replace_document_content`).
+    """
+    document.ingestion_stage = "queued"
+    document.progress_updated_at = func.now()
+    job = IngestionJob(
+        document_id=document.id,
+        file_path=file_path or document.file_path,
+        kind=kind,
+        max_attempts=max_attempts or settings.INGESTION_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    return job
+
+
+def claim_job(worker_id: str, visibility_timeout: Optional[int] = None) -> Optional[ClaimedJob]:
+    """
+    Reivindica o próximo job disponível com SELECT ... FOR UPDATE SKIP LOCKED.
+    Jobs `running` cujo lock expirou (worker morto) voltam a ser elegíveis.
+    """
+    timeout = visibility_timeout or settings.INGESTION_VISIBILITY_TIMEOUT_SECONDS
+    db = SessionLocal()
+    try:
+        while True:
+            job = (
+                db.query(IngestionJob)
+                .filter(
+                    or_(
+                        and_(IngestionJob.status == "queued", IngestionJob.run_after <= func.now()),
+                        and_(IngestionJob.status == "running", IngestionJob.locked_until < func.now()),
+                    )
+                )
+                .order_by(IngestionJob.run_after)
+                .with_for_update(skip_locked=True)
+                .limit(1)
+                .first()
+            )
+            if job is None:
+                db.rollback()
+                return None
+
+            if job.attempts >= job.max_attempts:
+                # Lock expirado na última tentativa: desiste em vez de reprocessar
+                _mark_failed(db, job, job.last_error or "Tempo de processamento excedido")
+                db.commit()
+                continue
+
+            job.status = "running"
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_until = func.now() + timedelta(seconds=timeout)
+            # Na substituição o documento segue `active` (com o conteúdo antigo) até o commit
+            if job.kind == "ingest":
+                db.query(Document).filter(Document.id == job.document_id).update(
+                    {Document.status: "processing"}, synchronize_session=False
+                )
+            claimed = ClaimedJob(
+                id=job.id,
+                document_id=job.document_id,
+                file_path=job.file_path,
+                attempts=job.attempts,
+                max_attempts=job.max_attempts,
+                kind=job.kind,
+            )
+            db.commit()
+            return claimed
+    finally:
+        db.close()
+
+
+def extend_lock(job_id: uuid.UUID, worker_id: str, visibility_timeout: Optional[int] = None) -> bool:
+    """
+    Renova o lock de um job em execução (heartbeat). Retorna False se o job
+    não pertence mais a este worker.
+    """
+    timeout = visibility_timeout or settings.INGESTION_VISIBILITY_TIMEOUT_SECONDS
+    db = SessionLocal()
+    try:
+        updated = (
+            db.query(IngestionJob)
+            .filter(
+                IngestionJob.id == job_id,
+                IngestionJob.locked_by == worker_id,
+                IngestionJob.status == "running",
+            )
+            .update(
+                {IngestionJob.locked_until: func.now() + timedelta(seconds=timeout)},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return updated > 0
+    finally:
+        db.close()
+
+
+def complete_job(job_id: uuid.UUID, worker_id: str):
+    db = SessionLocal()
+    try:
+        # Job cancelado (documento em deleção) continua `cancelled`
+        db.query(IngestionJob).filter(
+            IngestionJob.id == job_id,
+            IngestionJob.locked_by == worker_id,
+            IngestionJob.status == "running",
+        ).update(
+            {
+                IngestionJob.status: "done",
+                IngestionJob.locked_by: None,
+                IngestionJob.locked_until: None,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def fail_job(job_id: uuid.UUID, worker_id: str, error: str):
+    """
+    Registra a falha. Enquanto houver tentativas, o job volta para a fila com
+    backoff exponencial; depois disso o documento é marcado como `error`
+    (exceto em jobs `replace`: o documento segue ativo com o conteúdo antigo).
+    """
+    db = SessionLocal()
+    try:
+        job = (
+            db.query(IngestionJob)
+            .filter(
+                IngestionJob.id == job_id,
+                IngestionJob.locked_by == worker_id,
+                IngestionJob.status == "running",
+            )
+            .with_for_update()
+            .first()
+        )
+        if not job:
+            db.rollback()
+            return
+
+        if job.attempts < job.max_attempts:
+            delay = settings.INGESTION_RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+            job.status = "queued"
+            job.run_after = func.now() + timedelta(seconds=delay)
+            job.locked_by = None
+            job.locked_until = None
+            job.last_error = error
+            progress = {
+                Document.ingestion_stage: "queued",
+                Document.ingestion_error: error,
+                Document.progress_updated_at: func.now(),
+            }
+            if job.kind == "ingest":
+                progress[Document.status] = "pending"
+            db.query(Document).filter(Document.id == job.document_id).update(progress, synchronize_session=False)
+            logger.warning(
+                "Job falhou; nova tentativa agendada",
+                extra={"job_id": str(job_id), "attempt": job.attempts, "retry_in_s": delay, "error": error},
+            )
+        else:
+            _mark_failed(db, job, error)
+            logger.error(
+                "Job falhou definitivamente",
+                extra={"job_id": str(job_id), "attempts": job.attempts, "error": error},
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _mark_failed(db: Session, job: IngestionJob, error: str):
+    job.status = "failed"
+    job.locked_by = None
+    job.locked_until = None
+    job.last_error = error
+    progress = {
+        Document.ingestion_stage: "failed",
+        Document.ingestion_error: error,
+        Document.progress_updated_at: func.now(),
+    }
+    # Substituição que falhou não invalida o conteúdo antigo, que continua servindo
+    if job.kind == "ingest":
+        progress[Document.status] = "error"
+    db.query(Document).filter(Document.id == job.document_id).update(progress, synchronize_session=False)
+
+
+def recover_stuck_documents(db: Session) -> int:
+    """
+    Reenfileira documentos presos em `pending`/`processing` sem job ativo
+    (ex.: uploads da época do BackgroundTasks perdidos num restart).
+
+    Roda em todo worker: um advisory lock de transação garante que só um
+    por vez checa e reenfileira (senão dois hosts enfileirariam o mesmo
+    documento e o ingeririam em paralelo, duplicando vetores).
+    """
+    locked = db.execute(text("SELECT pg_try_advisory_xact_lock(hashtext('app.recover_stuck_documents'))")).scalar()
+    if not locked:
+        db.rollback()
+        return 0
+
+    has_active_job = (
+        db.query(IngestionJob.id)
+        .filter(
+            IngestionJob.document_id == Document.id,
+            IngestionJob.status.in_(ACTIVE_JOB_STATUSES),
+        )
+        .exists()
+    )
+    stuck_docs = (
+        db.query(Document)
+        .filter(
+            Document.status.in_(["pending", "processing"]),
+            Document.file_path.isnot(None),
+            ~has_active_job,
+        )
+        .all()
+    )
+    for doc in stuck_docs:
+        doc.status = "pending"
+        enqueue_ingestion(db, doc)
+    db.commit()
+    return len(stuck_docs)
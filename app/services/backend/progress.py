@@ -0,0 +1,121 @@
+"""
+Progresso de ingestão em tempo real.
+
+Um trigger em `app.documents` emite `NOTIFY document_progress, '<id>'` a cada
+mudança num documento (ver SCHEMA_UPGRADES); o worker grava o progresso a cada
+lote. Cada processo da API mantém uma única conexão em LISTEN, aberta no
+primeiro assinante, e acorda só os streams daquele documento: nada de polling
+na tabela inteira.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL = "document_progress"
+# Etapas que estão avançando (têm ETA)
+RUNNING_STAGES = ("extracting", "embedding")
+
+
+def estimate_progress(
+    pages_total: Optional[int],
+    pages_extracted: int,
+    started_at: Optional[datetime],
+    updated_at: Optional[datetime],
+    now: Optional[datetime] = None,
+) -> Tuple[Optional[float], Optional[float]]:
+    """
+    (fração concluída, segundos restantes) a partir das páginas já processadas.
+    O ETA extrapola o ritmo médio até a última atualização.
+    """
+    if not pages_total:
+        return None, None
+    progress = min((pages_extracted or 0) / pages_total, 1.0)
+    if not progress or started_at is None or updated_at is None:
+        return progress, None
+
+    elapsed = (updated_at - started_at).total_seconds()
+    since_update = ((now or datetime.now(timezone.utc)) - updated_at).total_seconds()
+    return progress, max(elapsed * (1 - progress) / progress - since_update, 0.0)
+
+
+def is_finished(status: str, stage: Optional[str]) -> bool:
+    """Nada mais vai mudar sem uma ação nova (upload, substituição ou deleção)."""
+    if status == "deleting":
+        return True
+    if stage is None:
+        # Documentos anteriores ao registro de progresso
+        return status in ("active", "error")
+    return stage in ("done", "failed")
+
+
+class DocumentProgressHub:
+    """
+    Repassa as notificações de `PROGRESS_CHANNEL` para filas por documento.
+    As filas têm tamanho 1: notificações seguidas viram um único "acorde e
+    releia o status".
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._subscribers = defaultdict(set)
+        self._task: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def subscribe(self, doc_id: str):
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers[doc_id].add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(doc_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[doc_id]
+
+    def _wake(self, queues):
+        for queue in queues:
+            if queue.empty():
+                queue.put_nowait(None)
+
+    async def _listen(self):
+        import psycopg
+
+        backoff = 1
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.dsn, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {PROGRESS_CHANNEL}")
+                    backoff = 1
+                    # Mudanças enquanto a conexão estava fora não foram notificadas
+                    for queues in list(self._subscribers.values()):
+                        self._wake(queues)
+                    async for notify in conn.notifies():
+                        self._wake(list(self._subscribers.get(notify.payload, ())))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Conexão LISTEN de progresso caiu; reconectando", extra={"error": str(e), "retry_s": backoff})
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+progress_hub = DocumentProgressHub(settings.DATABASE_URL)
@@ -1,24 +1,92 @@
-import shutil
+import os
+import uuid
+import hashlib
 from pathlib import Path
+from dataclasses import dataclass
+from typing import Optional
 from fastapi import UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
 
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Criado no primeiro upload (ver `ensure_tmp_dir`), não no import
+TMP_DIR = UPLOAD_DIR / "tmp"
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StoredFile:
+    path: str
+    sha256: str
+    size: int
+
+
+def content_addressed_path(sha256: str, suffix: str) -> Path:
+    # uploads/ab/cd/abcd...ef.pdf: evita diretórios com milhares de arquivos
+    return UPLOAD_DIR / sha256[:2] / sha256[2:4] / f"{sha256}{suffix}"
+
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
 
-async def save_upload_file(upload_file: UploadFile) -> str:
+def ensure_tmp_dir() -> Path:
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    return TMP_DIR
+
+
+def _finalize(tmp_path: Path, final_path: Path):
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, final_path)
+
+
+async def save_upload_file(upload_file: UploadFile, max_bytes: Optional[int] = None) -> StoredFile:
     """
-    Salva o arquivo recebido na pasta local e retorna o caminho absoluto.
+    Salva o arquivo recebido em streaming (fora do event loop), calculando o SHA-256
+    na mesma passada e respeitando o tamanho máximo. O arquivo é gravado num
+    temporário e renomeado atomicamente para um caminho endereçado pelo conteúdo.
     """
+    max_bytes = max_bytes or settings.MAX_UPLOAD_BYTES
+    suffix = Path(upload_file.filename or "").suffix.lower()
+    tmp_path = ensure_tmp_dir() / f"{uuid.uuid4()}.part"
+    hasher = hashlib.sha256()
+    size = 0
+
     try:
-        safe_filename = upload_file.filename.replace(" ", "_")
-        file_path = UPLOAD_DIR / safe_filename
-        
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
-            
-        return str(file_path.absolute())
-        
+        out = await run_in_threadpool(tmp_path.open, "wb")
+        try:
+            while True:
+                chunk = await upload_file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Arquivo excede o tamanho máximo de {max_bytes // (1024 * 1024)} MB.",
+                    )
+                hasher.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+        finally:
+            await run_in_threadpool(out.close)
+
+        sha256 = hasher.hexdigest()
+        final_path = content_addressed_path(sha256, suffix)
+        await run_in_threadpool(_finalize, tmp_path, final_path)
+
+        return StoredFile(path=str(final_path.absolute()), sha256=sha256, size=size)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar arquivo: {str(e)}")
     finally:
-        await upload_file.close()
\ No newline at end of file
+        if tmp_path.exists():
+            tmp_path.unlink()
+        await upload_file.close()
@@ -0,0 +1,192 @@
+"""
+Worker de ingestão: consome a fila `app.ingestion_jobs` fora do processo da API
+e, quando ela está vazia, purga os vetores de documentos em `deleting`.
+
+Uso:
+    uv run python -m app.worker --processes 2 --threads 2
+"""
+import os
+import signal
+import logging
+import socket
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.core.logging import configure_logging
+from app.core.metrics import pool_gauges, registry, start_metrics_server
+from app.services.ai.ingestion import process_document, replace_document_content
+from app.services.ai.vector import vector_stores
+from app.services.backend.deletion import purge_next_deleting_document
+from app.services.backend.jobs import (
+    claim_job,
+    complete_job,
+    extend_lock,
+    fail_job,
+    recover_stuck_documents,
+)
+
+logger = logging.getLogger(__name__)
+
+RECOVERY_INTERVAL_SECONDS = 60
+
+
+class _Heartbeat:
+    """
+    Renova o lock do job periodicamente enquanto ele estiver sendo processado,
+    para que jobs longos não sejam reivindicados por outro worker.
+    """
+
+    def __init__(self, job_id, worker_id: str, visibility_timeout: int):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.visibility_timeout = visibility_timeout
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = max(self.visibility_timeout / 3, 1)
+        while not self._done.wait(interval):
+            try:
+                if not extend_lock(self.job_id, self.worker_id, self.visibility_timeout):
+                    return
+            except Exception as e:
+                logger.warning("Falha ao renovar lock do job", extra={"job_id": str(self.job_id), "error": str(e)})
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+
+def _run_one(worker_id: str, visibility_timeout: int) -> bool:
+    job = claim_job(worker_id, visibility_timeout)
+    if job is None:
+        return False
+
+    logger.info(
+        "Job reivindicado",
+        extra={
+            "worker_id": worker_id,
+            "job_id": str(job.id),
+            "kind": job.kind,
+            "document_id": str(job.document_id),
+            "attempt": job.attempts,
+            "max_attempts": job.max_attempts,
+        },
+    )
+    handler = replace_document_content if job.kind == "replace" else process_document
+    try:
+        with _Heartbeat(job.id, worker_id, visibility_timeout):
+            handler(job.document_id, job.file_path, raise_on_error=True)
+    except Exception as e:
+        fail_job(job.id, worker_id, str(e))
+    else:
+        complete_job(job.id, worker_id)
+    return True
+
+
+def _thread_loop(worker_id: str, stop_event, poll_interval: float, visibility_timeout: int):
+    while not stop_event.is_set():
+        try:
+            # Ingestão tem prioridade; sem jobs, a thread purga documentos em `deleting`
+            if _run_one(worker_id, visibility_timeout) or purge_next_deleting_document():
+                continue
+        except Exception as e:
+            logger.exception("Erro no loop do worker", extra={"worker_id": worker_id, "error": str(e)})
+        stop_event.wait(poll_interval)
+
+
+def _worker_pool_gauges():
+    samples = pool_gauges("app", engine.pool)
+    for name, pool in vector_stores.pools().items():
+        samples += pool_gauges(f"vector_{name}", pool)
+    return samples
+
+
+def run_worker_process(
+    threads: int, stop_event, poll_interval: float, visibility_timeout: int, metrics_port: int = 0
+):
+    """
+    Um processo do pool: roda `threads` consumidores em paralelo. PDF parsing
+    escala pelos processos; embeddings (I/O de rede) escalam pelas threads.
+    Com `metrics_port`, expõe as métricas do processo nessa porta.
+    """
+    configure_logging()
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if metrics_port:
+        registry.register_collector(_worker_pool_gauges)
+        start_metrics_server(metrics_port)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for i in range(threads):
+            pool.submit(_thread_loop, f"{base_id}:{i}", stop_event, poll_interval, visibility_timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila de ingestão de documentos.")
+    parser.add_argument("--processes", type=int, default=settings.INGESTION_WORKER_PROCESSES)
+    parser.add_argument("--threads", type=int, default=settings.INGESTION_WORKER_THREADS)
+    parser.add_argument("--poll-interval", type=float, default=settings.INGESTION_POLL_INTERVAL_SECONDS)
+    parser.add_argument("--visibility-timeout", type=int, default=settings.INGESTION_VISIBILITY_TIMEOUT_SECONDS)
+    parser.add_argument(
+        "--metrics-port", type=int, default=0,
+        help="Expõe /metrics de cada processo em metrics-port + i (0 desativa).",
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+
+    def _stop(signum, frame):
+        logger.info("Worker encerrando após os jobs em andamento", extra={"signal": signum})
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    processes = [
+        ctx.Process(
+            target=run_worker_process,
+            args=(
+                args.threads,
+                stop_event,
+                args.poll_interval,
+                args.visibility_timeout,
+                args.metrics_port + i if args.metrics_port else 0,
+            ),
+        )
+        for i in range(max(args.processes, 1))
+    ]
+    for p in processes:
+        p.start()
+
+    logger.info("Worker iniciado", extra={"processes": len(processes), "threads": args.threads})
+
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            recovered = recover_stuck_documents(db)
+            if recovered:
+                logger.info("Documentos presos reenfileirados", extra={"documents": recovered})
+        except Exception as e:
+            logger.warning("Falha ao recuperar documentos presos", extra={"error": str(e)})
+        finally:
+            db.close()
+        stop_event.wait(RECOVERY_INTERVAL_SECONDS)
+
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Teste ponta a ponta da importação em massa (`app.bulk_import`) com embeddings
+falsos num Postgres local: gera PDFs sintéticos (alguns duplicados), roda o
+importador, opcionalmente o interrompe no meio e confere que a segunda rodada
+retoma e termina com todos os arquivos tratados.
+
+Os documentos ficam num usuário próprio (`bench-import@example.com`) e são
+purgados ao final, exceto com `--keep`.
+
+Uso:
+    uv run python -m benchmarks.bench_bulk_import --files 200 --pages 20 --interrupt-after 15
+"""
+import sys
+import time
+import uuid
+import signal
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import fitz
+from sqlalchemy import func, text
+
+from app.core.database import SessionLocal, engine, init_db
+from app.models.schemas import Document, ImportFile
+from app.services.backend.deletion import mark_documents_deleting, purge_next_deleting_document
+from benchmarks.bench_pdf_extraction import LOREM
+
+BENCH_USER_ID = uuid.UUID("00000000-0000-0000-0000-0000000b1b0a")
+BENCH_USER_EMAIL = "bench-import@example.com"
+
+
+def _ensure_user():
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO app.users (id, email, full_name, role, corpus_version) "
+                "VALUES (:id, :email, 'Benchmark', 'admin', 0) ON CONFLICT DO NOTHING"
+            ),
+            {"id": BENCH_USER_ID, "email": BENCH_USER_EMAIL},
+        )
+
+
+def build_pdf(path: Path, number: int, pages: int, lines_per_page: int = 40):
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        # O número do contrato no texto torna cada PDF único
+        text = "\n".join(LOREM.format(n=f"{number}.{n}.{i}") for i in range(lines_per_page))
+        page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=7)
+    doc.save(str(path))
+    doc.close()
+
+
+def _build_corpus(root: Path, files: int, pages: int, duplicates: int):
+    for i in range(files):
+        folder = root / f"lote-{i % 10:02d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        build_pdf(folder / f"contrato-{i:05d}.pdf", i, pages)
+    for i in range(duplicates):
+        source = root / f"lote-{i % 10:02d}" / f"contrato-{i:05d}.pdf"
+        (root / "duplicados").mkdir(exist_ok=True)
+        (root / "duplicados" / f"copia-{i:05d}.pdf").write_bytes(source.read_bytes())
+
+
+def _run_importer(root: Path, run: str, documents: int, interrupt_after: float = 0, resume: bool = False) -> float:
+    cmd = [
+        sys.executable, "-m", "app.bulk_import", str(root),
+        "--user", BENCH_USER_EMAIL,
+        "--run", run,
+        "--documents", str(documents),
+        "--embeddings", "benchmarks.fakes:DeterministicFakeEmbeddings",
+    ]
+    if resume:
+        # O SIGINT também atinge o pool de extração: arquivos em voo podem ter ficado em `error`
+        cmd.append("--retry-errors")
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd)
+    try:
+        proc.wait(timeout=interrupt_after or None)
+    except subprocess.TimeoutExpired:
+        print(f"⏸️ Interrompendo o importador após {interrupt_after:.0f}s...")
+        proc.send_signal(signal.SIGINT)
+        proc.wait()
+    return time.perf_counter() - start
+
+
+def _summary(run: str) -> dict:
+    with SessionLocal() as db:
+        rows = (
+            db.query(ImportFile.status, func.count(), func.sum(ImportFile.chunks))
+            .filter(ImportFile.run == run)
+            .group_by(ImportFile.status)
+            .all()
+        )
+    return {status: {"files": count, "chunks": chunks or 0} for status, count, chunks in rows}
+
+
+def _cleanup(run: str):
+    with SessionLocal() as db:
+        mark_documents_deleting(db, [Document.uploaded_by == BENCH_USER_ID])
+        db.query(ImportFile).filter(ImportFile.run == run).delete(synchronize_session=False)
+        db.commit()
+    while purge_next_deleting_document():
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--duplicates", type=int, default=10)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--interrupt-after", type=float, default=0, help="Segundos até interromper a 1a rodada.")
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    _ensure_user()
+    run = f"bench-{uuid.uuid4().hex[:8]}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        print(f"📄 Gerando {args.files} PDFs de {args.pages} páginas (+{args.duplicates} duplicados)...")
+        _build_corpus(root, args.files, args.pages, args.duplicates)
+
+        try:
+            elapsed = _run_importer(root, run, args.documents, args.interrupt_after)
+            print(f"1a rodada: {elapsed:.1f}s -> {_summary(run)}")
+            if args.interrupt_after:
+                elapsed = _run_importer(root, run, args.documents, resume=True)
+                print(f"2a rodada (retomada): {elapsed:.1f}s -> {_summary(run)}")
+
+            summary = _summary(run)
+            handled = sum(summary.get(s, {}).get("files", 0) for s in ("done", "skipped"))
+            expected = args.files + args.duplicates
+            print(f"{'✅' if handled == expected else '❌'} {handled}/{expected} arquivos tratados.")
+            if handled != expected:
+                raise SystemExit(1)
+        finally:
+            if not args.keep:
+                _cleanup(run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de recall@k e latência: busca vetorial pura vs. híbrida (tsvector +
+vetorial com Reciprocal Rank Fusion) sobre um fixture jurídico rotulado
+(`benchmarks/fixtures/hybrid_recall.json`) num pgvector local.
+
+Uso:
+    uv run python -m app.services.ai.indexes create
+    uv run python -m benchmarks.bench_hybrid --embeddings fake --k 3
+"""
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+from langchain_postgres import PGVector
+
+from app.core.config import settings
+from app.services.ai.hybrid import ahybrid_search
+from app.services.ai.indexes import ensure_fulltext_column
+from app.services.ai.retrieval_cache import retrieval_filter
+from app.services.ai.vector import vector_stores
+from benchmarks.fakes import DeterministicFakeEmbeddings
+
+COLLECTION = "bench_hybrid"
+USER_ID = "bench-user"
+FIXTURE = Path(__file__).parent / "fixtures" / "hybrid_recall.json"
+
+
+def _recall(found_labels, relevant):
+    return len(set(found_labels) & set(relevant)) / len(relevant)
+
+
+async def run(embedder, k: int):
+    fixture = json.loads(FIXTURE.read_text(encoding="utf-8"))
+    engine = vector_stores.engine
+    ensure_fulltext_column(engine)
+
+    store = PGVector(
+        embeddings=embedder,
+        collection_name=COLLECTION,
+        connection=engine,
+        embedding_length=settings.EMBEDDING_DIMENSIONS,
+        use_jsonb=True,
+        pre_delete_collection=True,
+    )
+    labels = list(fixture["chunks"])
+    store.add_texts(
+        texts=[fixture["chunks"][label] for label in labels],
+        metadatas=[{"user_id": USER_ID, "label": label} for label in labels],
+    )
+
+    results = {"vector": ([], []), "hybrid": ([], [])}
+    try:
+        for item in fixture["queries"]:
+            vector = embedder.embed_query(item["query"])
+
+            start = time.perf_counter()
+            docs = store.similarity_search_by_vector(vector, k=k, filter=retrieval_filter(USER_ID, []))
+            results["vector"][0].append((time.perf_counter() - start) * 1000)
+            results["vector"][1].append(_recall([d.metadata["label"] for d in docs], item["relevant"]))
+
+            start = time.perf_counter()
+            docs = await ahybrid_search(item["query"], vector, USER_ID, k=k, collection_name=COLLECTION)
+            results["hybrid"][0].append((time.perf_counter() - start) * 1000)
+            results["hybrid"][1].append(_recall([d.metadata["label"] for d in docs], item["relevant"]))
+    finally:
+        store.delete_collection()
+        await vector_stores.dispose()
+
+    print(f"{'modo':>8} {f'recall@{k}':>10} {'p50 (ms)':>10}")
+    for mode, (latencies, recalls) in results.items():
+        print(f"{mode:>8} {statistics.mean(recalls):>10.2f} {statistics.median(latencies):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--embeddings", choices=["fake", "openai"], default="fake")
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.embeddings == "openai":
+        from app.services.ai.vector import get_embeddings
+
+        embedder = get_embeddings()
+    else:
+        embedder = DeterministicFakeEmbeddings(settings.EMBEDDING_DIMENSIONS)
+
+    asyncio.run(run(embedder, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark das listagens de conversas e mensagens: carga completa via ORM
+(comportamento antigo) vs. páginas por keyset só com as colunas da resposta,
+com e sem os índices compostos, sobre uma tabela com ~1M de mensagens geradas
+em SQL (`generate_series`) num Postgres local.
+
+Os dados ficam num usuário próprio (`bench-listing@example.com`) e são
+removidos ao final, exceto com `--keep`. Os índices são derrubados/recriados:
+rode só em banco local.
+
+Uso:
+    uv run python -m benchmarks.bench_listing --messages 1000000 --conversations 500
+"""
+import time
+import uuid
+import argparse
+import statistics
+
+from sqlalchemy import desc, select, text
+
+from app.api.v1.chat import conversations_page_query, messages_page_query
+from app.core.database import SessionLocal, engine, init_db
+from app.models.schemas import Conversation, Message
+
+BENCH_USER_ID = uuid.UUID("00000000-0000-0000-0000-00000000b17c")
+PAGE_SIZE = 50
+INDEXES = {
+    "ix_conversations_user_id_created_at": "app.conversations (user_id, created_at, id)",
+    "ix_messages_conversation_id_created_at": "app.messages (conversation_id, created_at, id)",
+}
+
+
+def seed(conversations: int, messages: int):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO app.users (id, email, full_name, role, corpus_version) "
+                "VALUES (:id, 'bench-listing@example.com', 'Benchmark', 'viewer', 0) ON CONFLICT DO NOTHING"
+            ),
+            {"id": BENCH_USER_ID},
+        )
+        conn.execute(
+            text(
+                """
+                INSERT INTO app.conversations (id, user_id, title, created_at)
+                SELECT gen_random_uuid(), :id, 'Conversa ' || i, now() - make_interval(hours => i)
+                FROM generate_series(1, :n) AS i
+                """
+            ),
+            {"id": BENCH_USER_ID, "n": conversations},
+        )
+        conn.execute(
+            text(
+                """
+                WITH convs AS (
+                    SELECT id, row_number() OVER (ORDER BY created_at) - 1 AS pos
+                    FROM app.conversations WHERE user_id = :id
+                )
+                INSERT INTO app.messages (id, conversation_id, sender_type, content, created_at)
+                SELECT gen_random_uuid(), c.id,
+                       CASE WHEN i % 2 = 0 THEN 'USER' ELSE 'ASSISTANT' END::sendertype,
+                       repeat('conteúdo da mensagem ', 10 + i % 40),
+                       now() - make_interval(secs => :n - i)
+                FROM generate_series(1, :n) AS i
+                JOIN convs c ON c.pos = i % :conversations
+                """
+            ),
+            {"id": BENCH_USER_ID, "n": messages, "conversations": conversations},
+        )
+        conn.execute(text("ANALYZE app.conversations"))
+        conn.execute(text("ANALYZE app.messages"))
+
+
+def cleanup():
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "DELETE FROM app.messages WHERE conversation_id IN "
+                "(SELECT id FROM app.conversations WHERE user_id = :id)"
+            ),
+            {"id": BENCH_USER_ID},
+        )
+        conn.execute(text("DELETE FROM app.conversations WHERE user_id = :id"), {"id": BENCH_USER_ID})
+        conn.execute(text("DELETE FROM app.users WHERE id = :id"), {"id": BENCH_USER_ID})
+
+
+def probe_points(conversations: int, messages: int):
+    """
+    A conversa com mais mensagens e cursores (created_at, id) no meio das
+    listas, como se o usuário tivesse rolado até lá.
+    """
+    with engine.connect() as conn:
+        conversation_id = conn.execute(
+            text(
+                "SELECT conversation_id FROM app.messages m JOIN app.conversations c ON c.id = m.conversation_id "
+                "WHERE c.user_id = :id GROUP BY conversation_id ORDER BY count(*) DESC LIMIT 1"
+            ),
+            {"id": BENCH_USER_ID},
+        ).scalar()
+        deep_conversation = tuple(
+            conn.execute(
+                text(
+                    "SELECT created_at, id FROM app.conversations WHERE user_id = :id "
+                    "ORDER BY created_at DESC, id DESC OFFSET :n LIMIT 1"
+                ),
+                {"id": BENCH_USER_ID, "n": conversations // 2},
+            ).one()
+        )
+        deep_message = tuple(
+            conn.execute(
+                text(
+                    "SELECT created_at, id FROM app.messages WHERE conversation_id = :id "
+                    "ORDER BY created_at DESC, id DESC OFFSET :n LIMIT 1"
+                ),
+                {"id": conversation_id, "n": messages // conversations // 2},
+            ).one()
+        )
+    return conversation_id, deep_conversation, deep_message
+
+
+def _set_indexes(enabled: bool):
+    with engine.begin() as conn:
+        for name, definition in INDEXES.items():
+            if enabled:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}"))
+            else:
+                conn.execute(text(f"DROP INDEX IF EXISTS app.{name}"))
+        conn.execute(text("ANALYZE app.messages"))
+
+
+def _timed(fn, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+def _scenarios(conversation_id: uuid.UUID, deep_conversation, deep_message):
+    def legacy_conversations():
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(Conversation).where(Conversation.user_id == BENCH_USER_ID).order_by(desc(Conversation.created_at))
+            ).scalars().all()
+            [c.created_at.strftime("%Y-%m-%d %H:%M") for c in rows]
+
+    def legacy_history():
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at.asc())
+            ).scalars().all()
+            [m.created_at.strftime("%H:%M") for m in rows]
+
+    def page(query):
+        def run():
+            with SessionLocal() as db:
+                db.execute(query).all()
+        return run
+
+    return {
+        "conversas: tudo via ORM": legacy_conversations,
+        "conversas: 1a página": page(conversations_page_query(BENCH_USER_ID, PAGE_SIZE + 1)),
+        "conversas: página funda": page(conversations_page_query(BENCH_USER_ID, PAGE_SIZE + 1, deep_conversation)),
+        "mensagens: tudo via ORM": legacy_history,
+        "mensagens: 1a página": page(messages_page_query(conversation_id, PAGE_SIZE + 1)),
+        "mensagens: página funda": page(messages_page_query(conversation_id, PAGE_SIZE + 1, deep_message)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="não remove os dados gerados")
+    args = parser.parse_args()
+
+    init_db()
+    cleanup()
+    print(f"🌱 Gerando {args.conversations} conversas e {args.messages} mensagens...")
+    seed(args.conversations, args.messages)
+
+    try:
+        conversation_id, deep_conversation, deep_message = probe_points(args.conversations, args.messages)
+
+        scenarios = _scenarios(conversation_id, deep_conversation, deep_message)
+        print(f"{'cenário':<28} {'índices':>8} {'p50 (ms)':>10}")
+        for indexed in (False, True):
+            _set_indexes(indexed)
+            for name, fn in scenarios.items():
+                print(f"{name:<28} {'sim' if indexed else 'não':>8} {_timed(fn, args.repeat):>10.2f}")
+    finally:
+        _set_indexes(True)
+        if not args.keep:
+            cleanup()
+
+
+if __name__ == "__main__":
+    main()
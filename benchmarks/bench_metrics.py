@@ -0,0 +1,58 @@
+"""
+Custo da instrumentação por etapa: `Histogram.time` e `StageClock.wrap` com
+métricas ligadas e desligadas, comparados a um laço sem instrumentação.
+
+Uso:
+    uv run python -m benchmarks.bench_metrics --iterations 1000000
+"""
+import time
+import argparse
+
+from app.core.config import settings
+from app.core.metrics import Histogram, StageClock
+
+
+def _bench_timer(histogram: Histogram, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with histogram.time("bench"):
+            pass
+    return time.perf_counter() - start
+
+
+def _bench_clock(iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in StageClock().wrap(range(iterations)):
+        pass
+    return time.perf_counter() - start
+
+
+def _bench_baseline(iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    n = args.iterations
+    baseline = _bench_baseline(n)
+    print(f"Sem instrumentação: {baseline / n * 1e9:.0f} ns/iteração")
+    for enabled in (False, True):
+        settings.METRICS_ENABLED = enabled
+        histogram = Histogram("bench_seconds", "Benchmark.")
+        timer = _bench_timer(histogram, n)
+        clock = _bench_clock(n)
+        label = "ligadas" if enabled else "desligadas"
+        print(
+            f"Métricas {label}: Histogram.time {timer / n * 1e9:.0f} ns/chamada | "
+            f"StageClock {(clock - baseline) / n * 1e9:.0f} ns/item a mais"
+        )
+
+
+if __name__ == "__main__":
+    main()
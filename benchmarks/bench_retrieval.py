@@ -0,0 +1,107 @@
+"""
+Benchmark de latência de retrieval (p50/p99) por tamanho de corpus, com e sem
+os índices de `app.services.ai.indexes`, usando embeddings falsos determinísticos
+num pgvector local (ex.: `docker compose up -d db`).
+
+Usa uma coleção própria (`bench_retrieval`), removida ao final. Os índices são
+da tabela inteira e são derrubados/recriados a cada tamanho: rode só em banco local.
+
+Uso:
+    uv run python -m benchmarks.bench_retrieval --sizes 10000 50000 100000 --users 50
+"""
+import time
+import uuid
+import random
+import argparse
+
+from langchain_postgres import PGVector
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.ai.indexes import (
+    HNSW_INDEX,
+    METADATA_INDEXES,
+    create_indexes,
+)
+from app.services.ai.retrieval_cache import retrieval_filter
+from app.services.ai.vector import vector_stores
+from benchmarks.fakes import DeterministicFakeEmbeddings
+
+COLLECTION = "bench_retrieval"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+def _drop_indexes(engine):
+    with engine.begin() as conn:
+        for name in [HNSW_INDEX, *METADATA_INDEXES]:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def seed(store: PGVector, fake: DeterministicFakeEmbeddings, count: int, users: int, start: int):
+    batch = 1000
+    for offset in range(start, start + count, batch):
+        texts = [f"chunk {i}" for i in range(offset, min(offset + batch, start + count))]
+        store.add_embeddings(
+            texts=texts,
+            embeddings=fake.embed_documents(texts),
+            metadatas=[
+                {"user_id": f"user-{i % users}", "document_id": str(uuid.uuid4())}
+                for i in range(offset, offset + len(texts))
+            ],
+        )
+
+
+def measure(store: PGVector, users: int, queries: int, k: int):
+    latencies = []
+    for q in range(queries):
+        user = f"user-{random.randrange(users)}"
+        start = time.perf_counter()
+        store.similarity_search(f"pergunta {q}", k=k, filter=retrieval_filter(user, []))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    fake = DeterministicFakeEmbeddings(settings.EMBEDDING_DIMENSIONS)
+    engine = vector_stores.engine
+    store = PGVector(
+        embeddings=fake,
+        collection_name=COLLECTION,
+        connection=engine,
+        embedding_length=settings.EMBEDDING_DIMENSIONS,
+        use_jsonb=True,
+        pre_delete_collection=True,
+    )
+
+    print(f"{'vetores':>10} {'índices':>8} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    seeded = 0
+    try:
+        for size in sorted(args.sizes):
+            seed(store, fake, size - seeded, args.users, seeded)
+            seeded = size
+
+            _drop_indexes(engine)
+            p50, p99 = measure(store, args.users, args.queries, args.k)
+            print(f"{size:>10} {'não':>8} {p50:>10.2f} {p99:>10.2f}")
+
+            create_indexes(engine)
+            p50, p99 = measure(store, args.users, args.queries, args.k)
+            print(f"{size:>10} {'sim':>8} {p50:>10.2f} {p99:>10.2f}")
+    finally:
+        store.delete_collection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Dublês locais usados pelos benchmarks (sem rede, determinísticos).
+"""
+import hashlib
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class DeterministicFakeEmbeddings(Embeddings):
+    """
+    Vetores unitários pseudo-aleatórios derivados do SHA-256 do texto:
+    o mesmo texto sempre gera o mesmo vetor.
+    """
+
+    def __init__(self, size: int = 1536):
+        self.size = size
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.size)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
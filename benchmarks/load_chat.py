@@ -0,0 +1,74 @@
+"""
+Teste de carga do endpoint de chat: dispara N conversas simultâneas contra uma
+instância em execução e mede throughput e latência para cada nível de concorrência.
+
+Com o caminho assíncrono, um único worker uvicorn deve atender várias conversas
+em paralelo enquanto elas aguardam I/O (busca vetorial e LLM): o throughput cresce
+com a concorrência até saturar o LLM/banco, em vez de ficar preso em ~1 chat/worker.
+
+Uso:
+    uv run uvicorn app.main:app --workers 1 &
+    uv run python -m benchmarks.load_chat --url http://localhost:8000 \\
+        --token "$ACCESS_TOKEN" --concurrency 1 4 16 32 --requests 64
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+
+async def _one_chat(client: httpx.AsyncClient, question: str) -> float:
+    conv = await client.post("/v1/conversations", json={"title": "Load test"})
+    conv.raise_for_status()
+    conversation_id = conv.json()["id"]
+
+    start = time.perf_counter()
+    resp = await client.post(
+        f"/v1/conversations/{conversation_id}/messages", json={"content": question}
+    )
+    resp.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run_level(url: str, token: str, concurrency: int, total: int, question: str) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, headers=headers, timeout=120, limits=limits) as client:
+        async def bounded():
+            async with semaphore:
+                return await _one_chat(client, question)
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(bounded() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "throughput": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--question", default="Qual o prazo de vigência do contrato?")
+    args = parser.parse_args()
+
+    print(f"{'concorrência':>12} {'chats/s':>10} {'p50 (s)':>10} {'p95 (s)':>10}")
+    for level in args.concurrency:
+        r = asyncio.run(run_level(args.url, args.token, level, args.requests, args.question))
+        print(f"{r['concurrency']:>12} {r['throughput']:>10.2f} {r['p50']:>10.2f} {r['p95']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
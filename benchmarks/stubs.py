@@ -0,0 +1,215 @@
+"""
+Servidor HTTP local que substitui os serviços externos nos benchmarks:
+
+- API compatível com a OpenAI (`/v1/embeddings` e `/v1/chat/completions`, com
+  e sem streaming): embeddings determinísticos e um modelo de chat falso com
+  latência até o primeiro token e taxa de tokens configuráveis.
+- Keycloak (`/realms/<realm>/protocol/openid-connect/certs` e `.../token/introspect`):
+  uma chave RSA gerada na hora assina os tokens emitidos por `issue_token`.
+
+A aplicação aponta para ele via OPENAI_BASE_URL e KEYCLOAK_URL, sem mudar código.
+
+Uso isolado (imprime um token de admin para `benchmarks.load_chat`):
+    uv run python -m benchmarks.stubs --port 9400 --first-token-ms 300 --tokens-per-second 40
+"""
+import json
+import time
+import base64
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from jose import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from benchmarks.fakes import DeterministicFakeEmbeddings
+
+KEY_ID = "bench-key"
+
+
+def _b64url_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+class FakeChatModel:
+    """
+    Resposta fixa de `answer_tokens` palavras: espera `first_token_latency`
+    segundos e depois emite `tokens_per_second` tokens por segundo.
+    """
+
+    def __init__(self, first_token_latency: float = 0.3, tokens_per_second: float = 50, answer_tokens: int = 60):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+
+    def tokens(self):
+        time.sleep(self.first_token_latency)
+        interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for i in range(self.answer_tokens):
+            if i and interval:
+                time.sleep(interval)
+            yield f"palavra{i} "
+
+
+class IdentityProvider:
+    """Emite e valida JWTs RS256 no formato dos tokens do Keycloak."""
+
+    def __init__(self, issuer: str, client_id: str):
+        self.issuer = issuer
+        self.client_id = client_id
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._private_pem = self._key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        numbers = self._key.public_key().public_numbers()
+        self.jwk = {
+            "kid": KEY_ID, "kty": "RSA", "alg": "RS256", "use": "sig",
+            "n": _b64url_uint(numbers.n), "e": _b64url_uint(numbers.e),
+        }
+
+    def issue_token(self, sub: str, username: str, roles=("viewer",), ttl: int = 3600) -> str:
+        now = int(time.time())
+        claims = {
+            "sub": sub,
+            "preferred_username": username,
+            "email": username,
+            "iss": self.issuer,
+            "azp": self.client_id,
+            "iat": now,
+            "exp": now + ttl,
+            "realm_access": {"roles": list(roles)},
+        }
+        return jwt.encode(claims, self._private_pem, algorithm="RS256", headers={"kid": KEY_ID})
+
+    def introspect(self, token: str) -> dict:
+        try:
+            claims = jwt.decode(token, self.jwk, algorithms=["RS256"], issuer=self.issuer, options={"verify_aud": False})
+        except Exception:
+            return {"active": False}
+        return {**claims, "active": True}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.endswith("/protocol/openid-connect/certs"):
+            return self._json({"keys": [self.server.identity.jwk]})
+        self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(json.loads(self._body()))
+        if self.path.endswith("/chat/completions"):
+            return self._chat(json.loads(self._body()))
+        if self.path.endswith("/protocol/openid-connect/token/introspect"):
+            form = parse_qs(self._body().decode())
+            return self._json(self.server.identity.introspect(form.get("token", [""])[0]))
+        self._json({"error": "not found"}, 404)
+
+    def _embeddings(self, request: dict):
+        inputs = request["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        for i, item in enumerate(inputs):
+            # langchain envia listas de token ids; o hash do JSON mantém o vetor determinístico
+            text = item if isinstance(item, str) else json.dumps(item)
+            vector = self.server.embedder.embed_query(text)
+            if request.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        self._json({
+            "object": "list",
+            "data": data,
+            "model": request.get("model"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _chat(self, request: dict):
+        model = self.server.chat_model
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": request.get("model")}
+        usage = {"prompt_tokens": 0, "completion_tokens": model.answer_tokens, "total_tokens": model.answer_tokens}
+
+        if not request.get("stream"):
+            content = "".join(model.tokens())
+            return self._json({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send(chunk):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        chunk = {**base, "object": "chat.completion.chunk"}
+        for token in model.tokens():
+            send({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}]})
+        send({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send({**chunk, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, realm: str, client_id: str, chat_model: FakeChatModel, embedding_size: int):
+        super().__init__(("127.0.0.1", port), _StubHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.identity = IdentityProvider(f"{self.url}/realms/{realm}", client_id)
+        self.chat_model = chat_model
+        self.embedder = DeterministicFakeEmbeddings(embedding_size)
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9400)
+    parser.add_argument("--realm", default="DocVault")
+    parser.add_argument("--client-id", default="bench")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--embedding-size", type=int, default=1536)
+    args = parser.parse_args()
+
+    model = FakeChatModel(args.first_token_ms / 1000, args.tokens_per_second, args.answer_tokens)
+    server = StubServer(args.port, args.realm, args.client_id, model, args.embedding_size)
+    token = server.identity.issue_token("00000000-0000-0000-0000-0000000000ad", "bench-admin@example.com", ["admin"], ttl=86400)
+    print(f"🧪 Stubs em {server.url}")
+    print(f"   OPENAI_BASE_URL={server.url}/v1 KEYCLOAK_URL={server.url} KEYCLOAK_REALM={args.realm} KEYCLOAK_CLIENT_ID={args.client_id}")
+    print(f"   Token de admin: {token}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+"""
+Suíte de benchmarks ponta a ponta, reproduzível e sem serviços externos.
+
+Sobe a API (uvicorn) e o worker de ingestão como subprocessos contra o Postgres
+local (pgvector), com `benchmarks.stubs` no lugar da OpenAI (embeddings
+determinísticos e chat falso com latência/taxa de tokens configuráveis) e do
+Keycloak (JWKS e introspecção). Mede:
+
+- ingestion: latência upload -> `active` por tamanho de PDF (páginas)
+- chat: p50/p95/p99 e throughput com N usuários simultâneos
+- retrieval: latência da busca vetorial por tamanho de corpus
+- listing: listagens de conversas/mensagens com tabelas grandes
+- startup: import de `app.main` e cold start da API (`benchmarks.bench_startup`)
+
+Os resultados vão para um JSON (`--output`) e podem ser comparados com um
+baseline salvo (`--baseline`): o processo sai com código 1 se alguma métrica
+piorar além de `--tolerance`. Os dados gerados são removidos ao final.
+
+Uso:
+    uv run python -m benchmarks.suite run --output results.json
+    uv run python -m benchmarks.suite run --scenarios chat --concurrency 1 8 32 --baseline baseline.json
+    uv run python -m benchmarks.suite compare baseline.json results.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+from pathlib import Path
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.stubs import FakeChatModel, StubServer
+
+SCENARIOS = ("ingestion", "chat", "retrieval", "listing", "startup")
+REALM = "DocVault"
+CLIENT_ID = "bench"
+ADMIN_ID = uuid.UUID("00000000-0000-0000-0000-0000000000ad")
+ADMIN_EMAIL = "bench-admin@example.com"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentiles(values, unit_scale: float = 1.0) -> dict:
+    from benchmarks.bench_retrieval import percentile
+
+    return {
+        "p50": percentile(values, 0.5) * unit_scale,
+        "p95": percentile(values, 0.95) * unit_scale,
+        "p99": percentile(values, 0.99) * unit_scale,
+    }
+
+
+class Results:
+    """Métricas planas (`cenario.parametro.metrica`) com unidade e direção."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name: str, value: float, unit: str, better: str = "lower"):
+        self.metrics[name] = {"value": round(value, 6), "unit": unit, "better": better}
+        print(f"   {name:<48} {value:>12.3f} {unit}")
+
+    def to_json(self, params: dict) -> dict:
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except Exception:
+            commit = None
+        return {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_commit": commit,
+                "python": sys.version.split()[0],
+                "params": params,
+            },
+            "metrics": self.metrics,
+        }
+
+
+class Environment:
+    """Stubs + API + worker, apontados uns para os outros por variáveis de ambiente."""
+
+    def __init__(self, args):
+        self.args = args
+        model = FakeChatModel(args.first_token_ms / 1000, args.tokens_per_second, args.answer_tokens)
+        self.stubs = StubServer(0, REALM, CLIENT_ID, model, args.embedding_size).start()
+        self.api_url = f"http://127.0.0.1:{_free_port()}"
+        self.env = {
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": f"{self.stubs.url}/v1",
+            "KEYCLOAK_URL": self.stubs.url,
+            "KEYCLOAK_REALM": REALM,
+            "KEYCLOAK_CLIENT_ID": CLIENT_ID,
+            "KEYCLOAK_CLIENT_SECRET": "bench",
+            "KEYCLOAK_ISSUER": self.stubs.identity.issuer,
+            "KEYCLOAK_JWKS_URL": f"{self.stubs.identity.issuer}/protocol/openid-connect/certs",
+            "KEYCLOAK_AUDIENCE": "",
+            "TOKEN_VERIFICATION_MODE": "jwks",
+            "EMBEDDING_DIMENSIONS": str(args.embedding_size),
+            "ANSWER_CACHE_ENABLED": "false",
+        }
+        # Este processo também importa a aplicação (seeds e limpeza): mesmas variáveis
+        os.environ.update(self.env)
+        self.processes = []
+
+    def token(self, sub, username: str, roles=("viewer",)) -> str:
+        return self.stubs.identity.issue_token(str(sub), username, roles)
+
+    def start(self):
+        env = {**os.environ, **self.env}
+        port = self.api_url.rsplit(":", 1)[1]
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", port,
+             "--workers", str(self.args.api_workers), "--log-level", "warning"],
+            env=env,
+        ))
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "app.worker", "--processes", str(self.args.worker_processes),
+             "--threads", str(self.args.worker_threads), "--poll-interval", "0.2"],
+            env=env,
+        ))
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{self.api_url}/", timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError("A API não subiu em 120s.")
+
+    def stop(self):
+        for proc in self.processes:
+            proc.terminate()
+        for proc in self.processes:
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.stubs.shutdown()
+
+
+def _delete_users(user_ids):
+    from sqlalchemy import text
+    from app.core.database import engine
+
+    ids = [str(u) for u in user_ids]
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "DELETE FROM app.messages WHERE conversation_id IN "
+                "(SELECT id FROM app.conversations WHERE user_id = ANY(CAST(:ids AS uuid[])))"
+            ),
+            {"ids": ids},
+        )
+        conn.execute(text("DELETE FROM app.conversations WHERE user_id = ANY(CAST(:ids AS uuid[]))"), {"ids": ids})
+        conn.execute(
+            text(
+                "DELETE FROM app.users u WHERE id = ANY(CAST(:ids AS uuid[])) "
+                "AND NOT EXISTS (SELECT 1 FROM app.documents d WHERE d.uploaded_by = u.id)"
+            ),
+            {"ids": ids},
+        )
+
+
+# --- ingestion ---------------------------------------------------------------
+
+def bench_ingestion(env: Environment, results: Results):
+    from app.core.database import SessionLocal
+    from app.models.schemas import Document
+    from app.services.backend.deletion import mark_documents_deleting, purge_next_deleting_document
+    from benchmarks.bench_bulk_import import build_pdf
+
+    args = env.args
+    headers = {"Authorization": f"Bearer {env.token(ADMIN_ID, ADMIN_EMAIL, ['admin'])}"}
+    # Conteúdo único por execução: uploads idênticos seriam deduplicados pelo hash
+    nonce = int(time.time())
+
+    try:
+        with httpx.Client(base_url=env.api_url, headers=headers, timeout=120) as client, \
+                tempfile.TemporaryDirectory() as tmp:
+            for pages in args.pdf_pages:
+                latencies = []
+                for r in range(args.ingestion_repeat):
+                    path = Path(tmp) / f"bench-{pages}-{r}.pdf"
+                    build_pdf(path, nonce * 1000 + pages * 10 + r, pages)
+
+                    start = time.perf_counter()
+                    with open(path, "rb") as f:
+                        resp = client.post("/v1/documents", files={"file": (path.name, f, "application/pdf")})
+                    resp.raise_for_status()
+                    doc_id = str(resp.json()["id"])
+
+                    status = None
+                    deadline = time.monotonic() + args.ingestion_timeout
+                    while status not in ("active", "error") and time.monotonic() < deadline:
+                        time.sleep(0.1)
+                        status = client.get(f"/v1/documents/{doc_id}/status").json()["status"]
+                    if status != "active":
+                        raise RuntimeError(f"Documento de {pages} páginas terminou em {status!r}.")
+                    latencies.append(time.perf_counter() - start)
+
+                results.add(f"ingestion.pages_{pages}.upload_to_active_p50", statistics.median(latencies), "s")
+    finally:
+        with SessionLocal() as db:
+            mark_documents_deleting(db, [Document.uploaded_by == ADMIN_ID])
+            db.commit()
+        while purge_next_deleting_document():
+            pass
+        _delete_users([ADMIN_ID])
+
+
+# --- chat --------------------------------------------------------------------
+
+def _seed_chat_corpus(user_ids, chunks_per_user: int):
+    from app.core.config import settings
+    from app.services.ai.vector import get_vector_store
+    from benchmarks.bench_pdf_extraction import LOREM
+    from benchmarks.fakes import DeterministicFakeEmbeddings
+
+    store = get_vector_store()
+    fake = DeterministicFakeEmbeddings(settings.EMBEDDING_DIMENSIONS)
+    for user_id in user_ids:
+        texts = [f"{LOREM.format(n=i)} ({user_id})" for i in range(chunks_per_user)]
+        store.add_embeddings(
+            texts=texts,
+            embeddings=fake.embed_documents(texts),
+            metadatas=[
+                {"user_id": str(user_id), "source": "benchmark.pdf", "chunk_index": i} for i in range(len(texts))
+            ],
+        )
+
+
+def _delete_chat_corpus(user_ids):
+    from sqlalchemy import text
+    from app.services.ai.vector import vector_stores
+
+    with vector_stores.engine.begin() as conn:
+        conn.execute(
+            text("DELETE FROM langchain_pg_embedding WHERE cmetadata->>'user_id' = ANY(:ids)"),
+            {"ids": [str(u) for u in user_ids]},
+        )
+
+
+async def _chat_level(env: Environment, tokens, concurrency: int, total: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=env.api_url, timeout=300, limits=limits) as client:
+        async def one(i: int) -> float:
+            headers = {"Authorization": f"Bearer {tokens[i % concurrency]}"}
+            async with semaphore:
+                conv = await client.post("/v1/conversations", json={"title": "Benchmark"}, headers=headers)
+                conv.raise_for_status()
+                start = time.perf_counter()
+                resp = await client.post(
+                    f"/v1/conversations/{conv.json()['id']}/messages",
+                    # Perguntas distintas: sem acertos nos caches de retrieval/embeddings
+                    json={"content": f"{env.args.question} ({concurrency}.{i})"},
+                    headers=headers,
+                )
+                resp.raise_for_status()
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return {"throughput": total / elapsed, **_percentiles(latencies)}
+
+
+def bench_chat(env: Environment, results: Results):
+    args = env.args
+    users = [uuid.uuid5(uuid.NAMESPACE_URL, f"docvault-bench/chat/{i}") for i in range(max(args.concurrency))]
+    tokens = [env.token(u, f"bench-chat-{i}@example.com") for i, u in enumerate(users)]
+
+    _seed_chat_corpus(users, args.chat_corpus_chunks)
+    try:
+        # Aquecimento: sincroniza os usuários e carrega o JWKS antes de medir
+        for token in tokens:
+            httpx.get(f"{env.api_url}/me", headers={"Authorization": f"Bearer {token}"}, timeout=30).raise_for_status()
+
+        for level in args.concurrency:
+            r = asyncio.run(_chat_level(env, tokens, level, max(args.chat_requests, level)))
+            prefix = f"chat.users_{level}"
+            results.add(f"{prefix}.throughput", r["throughput"], "chats/s", better="higher")
+            for p in ("p50", "p95", "p99"):
+                results.add(f"{prefix}.latency_{p}", r[p], "s")
+    finally:
+        _delete_chat_corpus(users)
+        _delete_users(users)
+
+
+# --- retrieval ---------------------------------------------------------------
+
+def bench_retrieval(env: Environment, results: Results):
+    import random
+    from langchain_postgres import PGVector
+    from app.core.config import settings
+    from app.services.ai.vector import vector_stores
+    from benchmarks.bench_retrieval import COLLECTION, measure, seed
+    from benchmarks.fakes import DeterministicFakeEmbeddings
+
+    args = env.args
+    random.seed(42)
+    fake = DeterministicFakeEmbeddings(settings.EMBEDDING_DIMENSIONS)
+    store = PGVector(
+        embeddings=fake,
+        collection_name=COLLECTION,
+        connection=vector_stores.engine,
+        embedding_length=settings.EMBEDDING_DIMENSIONS,
+        use_jsonb=True,
+        pre_delete_collection=True,
+    )
+    seeded = 0
+    try:
+        for size in sorted(args.retrieval_sizes):
+            seed(store, fake, size - seeded, args.retrieval_users, seeded)
+            seeded = size
+            p50, p99 = measure(store, args.retrieval_users, args.retrieval_queries, k=5)
+            results.add(f"retrieval.vectors_{size}.latency_p50", p50, "ms")
+            results.add(f"retrieval.vectors_{size}.latency_p99", p99, "ms")
+    finally:
+        store.delete_collection()
+
+
+# --- listing -----------------------------------------------------------------
+
+def bench_listing(env: Environment, results: Results):
+    from app.api.v1.chat import _encode_cursor
+    from benchmarks import bench_listing as listing
+
+    args = env.args
+    listing.cleanup()
+    listing.seed(args.listing_conversations, args.listing_messages)
+    try:
+        conversation_id, deep_conversation, deep_message = listing.probe_points(
+            args.listing_conversations, args.listing_messages
+        )
+        token = env.token(listing.BENCH_USER_ID, "bench-listing@example.com")
+        pages = {
+            "conversations_first_page": ("/v1/conversations", {}),
+            "conversations_deep_page": ("/v1/conversations", {"cursor": _encode_cursor(*deep_conversation)}),
+            "messages_first_page": (f"/v1/conversations/{conversation_id}", {}),
+            "messages_deep_page": (f"/v1/conversations/{conversation_id}", {"cursor": _encode_cursor(*deep_message)}),
+        }
+        with httpx.Client(base_url=env.api_url, headers={"Authorization": f"Bearer {token}"}, timeout=60) as client:
+            for name, (path, params) in pages.items():
+                client.get(path, params=params).raise_for_status()
+                latencies = []
+                for _ in range(args.listing_repeat):
+                    start = time.perf_counter()
+                    client.get(path, params=params).raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                stats = _percentiles(latencies, unit_scale=1000)
+                results.add(f"listing.{name}.latency_p50", stats["p50"], "ms")
+                results.add(f"listing.{name}.latency_p95", stats["p95"], "ms")
+    finally:
+        listing.cleanup()
+
+
+# --- startup -----------------------------------------------------------------
+
+def bench_startup(env: Environment, results: Results):
+    from benchmarks.bench_startup import measure_cold_start, measure_import
+
+    runs = env.args.startup_runs
+    # Sem banco alcançável (OFFLINE_ENV): subir não pode depender dele
+    results.add("startup.import_app_main", statistics.median(measure_import()["import_ms"] for _ in range(runs)), "ms")
+    results.add("startup.cold_start", statistics.median(measure_cold_start() for _ in range(runs)), "s")
+
+
+# --- comparação --------------------------------------------------------------
+
+def compare(baseline: dict, current: dict, tolerance: float) -> bool:
+    """Imprime a variação de cada métrica em comum; retorna True se houve regressão."""
+    regressed = False
+    print(f"{'métrica':<50} {'baseline':>12} {'atual':>12} {'variação':>10}")
+    for name, metric in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = (metric["value"] - base["value"]) / base["value"]
+        worse = change > tolerance if metric["better"] == "lower" else change < -tolerance
+        regressed |= worse
+        flag = " ❌" if worse else ""
+        print(f"{name:<50} {base['value']:>12.3f} {metric['value']:>12.3f} {change:>+9.1%}{flag}")
+    return regressed
+
+
+def run(args) -> int:
+    env = Environment(args)
+    from app.core.database import init_db
+
+    init_db()
+    results = Results()
+    runners = {
+        "ingestion": bench_ingestion,
+        "chat": bench_chat,
+        "retrieval": bench_retrieval,
+        "listing": bench_listing,
+        "startup": bench_startup,
+    }
+    env.start()
+    try:
+        for name in args.scenarios:
+            print(f"⏱️ {name}")
+            runners[name](env, results)
+    finally:
+        env.stop()
+
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    payload = results.to_json(params)
+    Path(args.output).write_text(json.dumps(payload, indent=2, ensure_ascii=False))
+    print(f"💾 Resultados em {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if compare(baseline, payload, args.tolerance):
+            print(f"❌ Regressão acima de {args.tolerance:.0%} em relação a {args.baseline}.")
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks ponta a ponta com stubs locais.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.add_argument("--baseline", help="JSON de uma execução anterior para comparar.")
+    run_parser.add_argument("--tolerance", type=float, default=0.15, help="Piora relativa tolerada (0.15 = 15%%).")
+    # Processos
+    run_parser.add_argument("--api-workers", type=int, default=1)
+    run_parser.add_argument("--worker-processes", type=int, default=1)
+    run_parser.add_argument("--worker-threads", type=int, default=2)
+    # Modelos falsos
+    run_parser.add_argument("--first-token-ms", type=float, default=300)
+    run_parser.add_argument("--tokens-per-second", type=float, default=50)
+    run_parser.add_argument("--answer-tokens", type=int, default=60)
+    run_parser.add_argument("--embedding-size", type=int, default=1536)
+    # Cenários
+    run_parser.add_argument("--pdf-pages", type=int, nargs="+", default=[10, 100, 500])
+    run_parser.add_argument("--ingestion-repeat", type=int, default=3)
+    run_parser.add_argument("--ingestion-timeout", type=float, default=600)
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    run_parser.add_argument("--chat-requests", type=int, default=64)
+    run_parser.add_argument("--chat-corpus-chunks", type=int, default=200)
+    run_parser.add_argument("--question", default="Qual o prazo de vigência do contrato?")
+    run_parser.add_argument("--retrieval-sizes", type=int, nargs="+", default=[10000, 50000])
+    run_parser.add_argument("--retrieval-users", type=int, default=50)
+    run_parser.add_argument("--retrieval-queries", type=int, default=200)
+    run_parser.add_argument("--listing-conversations", type=int, default=500)
+    run_parser.add_argument("--listing-messages", type=int, default=200_000)
+    run_parser.add_argument("--listing-repeat", type=int, default=50)
+    run_parser.add_argument("--startup-runs", type=int, default=5)
+
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        raise SystemExit(run(args))
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    raise SystemExit(1 if compare(baseline, current, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Cache semântico de respostas no banco, com embeddings e LLM falsos: limiar de
+similaridade, exigência dos mesmos chunks e invalidação por documento.
+"""
+import uuid
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document as LCDocument
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.models.schemas import AnswerCache, User
+from app.services.ai import agent, context
+from app.services.ai.answer_cache import (
+    SemanticAnswerCache,
+    invalidate_answers_for_document,
+    is_answer_cacheable,
+)
+
+THRESHOLD = 0.95
+
+
+def _run(coro):
+    async def run():
+        try:
+            return await coro
+        finally:
+            # O pool assíncrono fica preso ao loop que o criou
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def _unit(v):
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def _near(vector, cosine: float):
+    """Vetor unitário com a similaridade de cosseno pedida em relação a `vector`."""
+    v = np.array(vector)
+    orthogonal = np.random.default_rng(7).standard_normal(len(v))
+    orthogonal -= orthogonal.dot(v) * v
+    orthogonal /= np.linalg.norm(orthogonal)
+    return _unit(cosine * v + np.sqrt(1 - cosine**2) * orthogonal)
+
+
+def _chunks(document_id, *names):
+    return [
+        LCDocument(id=f"{document_id}:{name}", page_content=f"trecho {name}", metadata={"document_id": str(document_id)})
+        for name in names
+    ]
+
+
+@pytest.fixture
+def question_vector(fake_embeddings):
+    return fake_embeddings.embed_query("Qual o prazo de entrega?")
+
+
+@pytest.fixture
+def cache(database):
+    return SemanticAnswerCache(THRESHOLD)
+
+
+def test_similar_question_with_same_chunks_hits(user, cache, question_vector):
+    doc_id = uuid.uuid4()
+    chunks = _chunks(doc_id, "a", "b")
+    _run(cache.astore(str(user.id), "Qual o prazo de entrega?", question_vector, chunks, "30 dias."))
+
+    # Mesmos chunks em outra ordem: o cache compara o conjunto ordenado
+    answer = _run(cache.alookup(str(user.id), _near(question_vector, 0.99), list(reversed(chunks))))
+
+    assert answer == "30 dias."
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_question_below_threshold_misses(user, cache, question_vector):
+    chunks = _chunks(uuid.uuid4(), "a")
+    _run(cache.astore(str(user.id), "Qual o prazo?", question_vector, chunks, "30 dias."))
+
+    assert _run(cache.alookup(str(user.id), _near(question_vector, 0.90), chunks)) is None
+    assert cache.misses == 1
+
+
+def test_different_chunks_miss_even_for_the_same_question(user, cache, question_vector):
+    doc_id = uuid.uuid4()
+    _run(cache.astore(str(user.id), "Qual o prazo?", question_vector, _chunks(doc_id, "a", "b"), "30 dias."))
+
+    assert _run(cache.alookup(str(user.id), question_vector, _chunks(doc_id, "a"))) is None
+    assert _run(cache.alookup(str(user.id), question_vector, _chunks(doc_id, "a", "b", "c"))) is None
+
+
+def test_answers_are_per_user(db, user, cache, question_vector):
+    other = User(id=uuid.uuid4(), email=f"{uuid.uuid4()}@teste.local", role="admin")
+    db.add(other)
+    db.commit()
+    chunks = _chunks(uuid.uuid4(), "a")
+    _run(cache.astore(str(user.id), "Qual o prazo?", question_vector, chunks, "30 dias."))
+
+    assert _run(cache.alookup(str(other.id), question_vector, chunks)) is None
+
+
+def test_invalidation_removes_only_answers_that_used_the_document(db, user, cache, question_vector):
+    removed, kept = uuid.uuid4(), uuid.uuid4()
+    _run(cache.astore(str(user.id), "p1", question_vector, _chunks(removed, "a") + _chunks(kept, "b"), "r1"))
+    _run(cache.astore(str(user.id), "p2", _near(question_vector, 0.5), _chunks(kept, "c"), "r2"))
+
+    invalidate_answers_for_document(db, removed)
+    db.commit()
+
+    answers = {row.answer for row in db.query(AnswerCache.answer).filter(AnswerCache.user_id == user.id)}
+    assert answers == {"r2"}
+
+
+def test_only_first_turns_without_summary_are_cacheable(monkeypatch):
+    monkeypatch.setattr(settings, "ANSWER_CACHE_ENABLED", True)
+    question = [{"role": "user", "content": "Qual o prazo?"}]
+
+    assert is_answer_cacheable(question)
+    assert not is_answer_cacheable(question, summary="conversa anterior")
+    assert not is_answer_cacheable([{"role": "assistant", "content": "Olá"}, *question])
+
+    monkeypatch.setattr(settings, "ANSWER_CACHE_ENABLED", False)
+    assert not is_answer_cacheable(question)
+
+
+def test_repeated_question_is_answered_from_cache_without_the_llm(monkeypatch, user, fake_embeddings):
+    chunks = _chunks(uuid.uuid4(), "a", "b")
+
+    async def aretrieve(question, user_id, k=5, mode=None):
+        return chunks
+
+    async def aembed_question(question):
+        return fake_embeddings.embed_query(question)
+
+    monkeypatch.setattr(settings, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(agent.retrieval_cache, "aretrieve", aretrieve)
+    monkeypatch.setattr(agent.retrieval_cache, "aembed_question", aembed_question)
+    monkeypatch.setattr(agent, "answer_cache", SemanticAnswerCache(THRESHOLD))
+    monkeypatch.setattr(context, "count_tokens", lambda text, model=None: len(text.split()))
+    # Uma única resposta: uma segunda chamada ao modelo falharia
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="30 dias.")]))
+    monkeypatch.setattr(agent, "get_llm", lambda: llm)
+
+    history = [{"role": "user", "content": "Qual o prazo?"}]
+    first = _run(agent.aget_chat_response("Qual o prazo?", history, str(user.id)))
+    second = _run(agent.aget_chat_response("Qual o prazo?", history, str(user.id)))
+
+    assert first == second == "30 dias."
+    assert agent.answer_cache.hits == 1
@@ -0,0 +1,43 @@
+"""
+`RoleChecker` com uma dependência de usuário própria, numa app FastAPI mínima
+(sem Keycloak nem banco).
+"""
+import uuid
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.schemas import User
+from app.services.backend.auth import RoleChecker
+
+
+def _client(role: str):
+    validations = []
+
+    async def introspected_user():
+        validations.append(role)
+        return User(id=uuid.uuid4(), email="admin@teste.local", role=role)
+
+    app = FastAPI()
+
+    @app.delete("/documents/{doc_id}", dependencies=[Depends(RoleChecker(["admin"], user_dependency=introspected_user))])
+    def delete_document(doc_id: str):
+        return {"id": doc_id}
+
+    return TestClient(app), validations
+
+
+def test_role_checker_validates_the_token_once_with_the_given_dependency():
+    client, validations = _client("admin")
+
+    assert client.delete("/documents/abc").json() == {"id": "abc"}
+    assert validations == ["admin"]
+
+
+def test_role_checker_rejects_other_roles():
+    client, validations = _client("user")
+
+    response = client.delete("/documents/abc")
+
+    assert response.status_code == 403
+    assert validations == ["user"]
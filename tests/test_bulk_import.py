@@ -0,0 +1,104 @@
+"""
+Importação em massa de ponta a ponta no banco, com embeddings falsos: arquivos
+ingeridos, conteúdo repetido pulado, documento removido durante a importação
+e a retomada de uma execução.
+"""
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from sqlalchemy import update
+
+from app.bulk_import import BulkImporter, scan
+from app.core.database import SessionLocal
+from app.models.schemas import Document, ImportFile
+from app.services.ai.tools import iter_pdf_pages
+
+RUN = "teste-importacao"
+
+
+def _page(label: str) -> str:
+    return " ".join(f"{label} cláusula {i} do contrato." for i in range(25))
+
+
+@pytest.fixture
+def extract_pool():
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        yield pool
+
+
+@pytest.fixture
+def source_dir(tmp_path, monkeypatch, make_pdf):
+    # Os arquivos importados são copiados para uploads/ relativo ao diretório atual
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "lote" / "sub").mkdir(parents=True)
+    make_pdf("lote/a.pdf", [_page("alfa"), _page("beta")])
+    make_pdf("lote/sub/b.pdf", [_page("gama")])
+    shutil.copyfile(tmp_path / "lote" / "a.pdf", tmp_path / "lote" / "sub" / "c.pdf")
+    return tmp_path / "lote"
+
+
+def _import(db, run, root, importer):
+    scan(run, root)
+    items = db.query(ImportFile).filter(ImportFile.run == run, ImportFile.status == "pending").order_by(ImportFile.path).all()
+    db.expunge_all()
+    return {item.path.removeprefix(str(root) + "/"): importer.import_file(item) for item in items}
+
+
+def _items(db, run):
+    rows = db.query(ImportFile).filter(ImportFile.run == run).all()
+    db.rollback()
+    return {row.path.rsplit("/lote/", 1)[1]: row for row in rows}
+
+
+def test_pages_stream_through_the_given_pool_in_order(extract_pool, make_pdf):
+    path = make_pdf("longo.pdf", [f"página {i}" for i in range(1, 6)])
+
+    pages = list(iter_pdf_pages(path, workers=1, pages_per_task=2, pool=extract_pool))
+
+    assert [number for number, _ in pages] == [1, 2, 3, 4, 5]
+    assert all(f"página {number}" in text for number, text in pages)
+
+
+def test_import_ingests_files_and_skips_repeated_content(db, user, fake_embeddings, extract_pool, source_dir):
+    run = f"{RUN}-{user.id}"
+    importer = BulkImporter(run, user.id, extract_pool, fake_embeddings)
+
+    results = _import(db, run, source_dir, importer)
+
+    assert results["a.pdf"][0] == "done" and results["a.pdf"][1] > 0
+    assert results["sub/b.pdf"][0] == "done"
+    # Cópia de a.pdf: mesmo conteúdo, mesmo dono
+    assert results["sub/c.pdf"] == ("skipped", 0)
+
+    items = _items(db, run)
+    assert items["sub/c.pdf"].document_id == items["a.pdf"].document_id
+    docs = db.query(Document).filter(Document.uploaded_by == user.id).all()
+    assert sorted(d.filename for d in docs) == ["a.pdf", "b.pdf"]
+    assert {d.status for d in docs} == {"active"}
+    assert {d.total_chunks for d in docs} == {items["a.pdf"].chunks, items["sub/b.pdf"].chunks}
+
+    # Rodar de novo com o mesmo --run não reprocessa nada
+    assert _import(db, run, source_dir, importer) == {}
+
+
+def test_document_removed_during_import_is_skipped_not_failed(db, user, fake_embeddings, extract_pool, source_dir):
+    run = f"{RUN}-{user.id}"
+
+    class DeletingEmbeddings:
+        """Simula o DELETE da API chegando enquanto o primeiro lote é embedado."""
+
+        def embed_documents(self, texts):
+            with SessionLocal() as other:
+                other.execute(update(Document).where(Document.uploaded_by == user.id).values(status="deleting"))
+                other.commit()
+            return fake_embeddings.embed_documents(texts)
+
+    shutil.rmtree(source_dir / "sub")
+    results = _import(db, run, source_dir, BulkImporter(run, user.id, extract_pool, DeletingEmbeddings()))
+
+    assert results == {"a.pdf": ("skipped", 0)}
+    item = _items(db, run)["a.pdf"]
+    assert item.status == "skipped"
+    assert item.error == "Documento removido durante a importação."
+    assert db.query(Document.status).filter(Document.id == item.document_id).scalar() == "deleting"
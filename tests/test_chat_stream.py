@@ -0,0 +1,162 @@
+"""
+`POST /conversations/{id}/messages/stream` com um modelo de chat falso em
+streaming: ordem dos eventos SSE e o que é gravado em cada desfecho.
+"""
+import json
+import uuid
+import asyncio
+
+import pytest
+from langchain_core.documents import Document as LCDocument
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app.api.v1 import chat
+from app.core.database import async_engine
+from app.models.schemas import Conversation, Message, SenderType
+from app.services.ai import agent, context
+
+ANSWER = "O prazo de entrega é de 30 dias corridos."
+
+
+class _BrokenChatModel(GenericFakeChatModel):
+    """Para no meio do stream, depois de alguns tokens."""
+
+    def _stream(self, *args, **kwargs):
+        for i, chunk in enumerate(super()._stream(*args, **kwargs)):
+            if i == 4:
+                raise RuntimeError("modelo indisponível")
+            yield chunk
+
+
+class _FakeRequest:
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+        self.checks = 0
+
+    async def is_disconnected(self):
+        self.checks += 1
+        return self.disconnect_after is not None and self.checks > self.disconnect_after
+
+
+@pytest.fixture
+def conversation(db, user):
+    conv = Conversation(id=uuid.uuid4(), user_id=user.id, title="Nova Conversa")
+    db.add(conv)
+    db.commit()
+    return conv
+
+
+@pytest.fixture
+def use_model(monkeypatch):
+    docs = [
+        LCDocument(
+            page_content="Cláusula 4: a entrega ocorre em 30 dias corridos.",
+            metadata={"document_id": str(uuid.uuid4()), "source": "contrato.pdf", "chunk_index": 0},
+        )
+    ]
+
+    async def aretrieve(question, user_id, k=5, mode=None):
+        return docs
+
+    monkeypatch.setattr(agent.retrieval_cache, "aretrieve", aretrieve)
+    monkeypatch.setattr(agent.settings, "ANSWER_CACHE_ENABLED", False)
+    # O encoding do tiktoken é baixado da rede: uma palavra por token basta aqui
+    monkeypatch.setattr(context, "count_tokens", lambda text, model=None: len(text.split()))
+
+    def install(model_class=GenericFakeChatModel):
+        model = model_class(messages=iter([AIMessage(content=ANSWER)]))
+        monkeypatch.setattr(agent, "get_llm", lambda: model)
+
+    return install
+
+
+def _parse(chunks):
+    events = []
+    for chunk in chunks:
+        event, data = chunk.strip().split("\n", 1)
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def _stream(conversation, user, http_request, read=None):
+    """Roda o endpoint e consome o corpo (ou só `read` pedaços, fechando o stream em seguida)."""
+
+    async def run():
+        try:
+            response = await chat.send_message_stream(
+                str(conversation.id), chat.MessageRequest(content="Qual o prazo?"), http_request, user=user
+            )
+            body, chunks = response.body_iterator, []
+            async for chunk in body:
+                chunks.append(chunk)
+                if read is not None and len(chunks) >= read:
+                    # Como o Starlette faz quando o cliente some: fecha o generator
+                    await body.aclose()
+                    break
+            return _parse(chunks)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def _saved(db, conversation):
+    rows = (
+        db.query(Message.sender_type, Message.content)
+        .filter(Message.conversation_id == conversation.id)
+        .order_by(Message.created_at, Message.sender_type)
+        .all()
+    )
+    db.rollback()
+    return rows
+
+
+def test_stream_sends_sources_then_tokens_then_done(db, user, conversation, use_model):
+    use_model()
+
+    events = _stream(conversation, user, _FakeRequest())
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "sources"
+    assert kinds[-1] == "done"
+    assert set(kinds[1:-1]) == {"token"}
+    assert events[0][1][0]["source"] == "contrato.pdf"
+    assert "".join(data for kind, data in events if kind == "token") == ANSWER
+
+    done = events[-1][1]
+    assert done["content"] == ANSWER
+    assert _saved(db, conversation) == [(SenderType.USER, "Qual o prazo?"), (SenderType.ASSISTANT, ANSWER)]
+
+
+def test_disconnect_saves_the_partial_answer_without_done(db, user, conversation, use_model):
+    use_model()
+
+    events = _stream(conversation, user, _FakeRequest(disconnect_after=4))
+
+    assert [kind for kind, _ in events] == ["sources", "token", "token", "token"]
+    partial = "".join(data for kind, data in events if kind == "token")
+    assert _saved(db, conversation)[-1] == (SenderType.ASSISTANT, partial)
+
+
+def test_cancelled_stream_still_saves_the_partial_answer(db, user, conversation, use_model):
+    use_model()
+
+    events = _stream(conversation, user, _FakeRequest(), read=3)
+
+    partial = "".join(data for kind, data in events if kind == "token")
+    assert partial and partial != ANSWER
+    assert _saved(db, conversation)[-1] == (SenderType.ASSISTANT, partial)
+
+
+def test_error_mid_stream_saves_nothing(db, user, conversation, use_model):
+    use_model(_BrokenChatModel)
+
+    events = _stream(conversation, user, _FakeRequest())
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "sources"
+    assert "token" in kinds
+    assert kinds[-1] == "error"
+    assert "done" not in kinds
+    assert _saved(db, conversation) == []
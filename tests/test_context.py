@@ -0,0 +1,140 @@
+"""
+Montagem do prompt dentro do orçamento de tokens (`app.services.ai.context`),
+com uma palavra por token no lugar do tiktoken (cujo encoding vem da rede).
+"""
+import pytest
+from langchain_core.documents import Document as LCDocument
+
+from app.services.ai import context
+from app.services.ai.context import (
+    MIN_OVERLAP_CHARS,
+    _dedupe,
+    _merge_segments,
+    _overlap,
+    pack_context,
+    pack_history,
+)
+
+FOOTER = " Documento confidencial - uso interno apenas."
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(context, "count_tokens", lambda text, model=None: len(text.split()))
+
+
+def _chunk(text, document_id="d1", index=None, source="contrato.pdf"):
+    metadata = {"document_id": document_id, "source": source}
+    if index is not None:
+        metadata["chunk_index"] = index
+    return LCDocument(page_content=text, metadata=metadata)
+
+
+def _ranked(*docs):
+    return list(enumerate(docs))
+
+
+def test_overlap_finds_the_longest_suffix_prefix():
+    shared = "as partes elegem o foro da comarca"
+    assert _overlap("Cláusula 9: " + shared, shared + " de São Paulo.") == len(shared)
+
+
+def test_overlap_ignores_matches_shorter_than_the_minimum():
+    short = "x" * (MIN_OVERLAP_CHARS - 1)
+    assert _overlap("abc " + short, short + " def") == 0
+
+
+def test_adjacent_chunks_are_merged_without_the_repeated_overlap():
+    shared = "o prazo de entrega é de trinta dias"
+    segments = _merge_segments(
+        _ranked(_chunk("Cláusula 4: " + shared, index=3), _chunk(shared + " corridos.", index=4))
+    )
+
+    assert len(segments) == 1
+    assert segments[0].text == "Cláusula 4: " + shared + " corridos."
+    assert (segments[0].first_index, segments[0].last_index) == (3, 4)
+
+
+def test_adjacent_chunks_without_overlap_are_joined_by_a_newline():
+    segments = _merge_segments(_ranked(_chunk("primeiro trecho", index=0), _chunk("segundo trecho", index=1)))
+
+    assert [s.text for s in segments] == ["primeiro trecho\nsegundo trecho"]
+
+
+def test_distant_chunks_sharing_boilerplate_are_not_merged():
+    segments = _merge_segments(
+        _ranked(_chunk("Cláusula 1: objeto." + FOOTER, index=2), _chunk(FOOTER.strip() + " Cláusula 8: multa.", index=9))
+    )
+
+    assert len(segments) == 2
+
+
+def test_chunks_without_index_are_never_merged():
+    segments = _merge_segments(_ranked(_chunk("trecho antigo" + FOOTER), _chunk(FOOTER.strip() + " outro trecho")))
+
+    assert len(segments) == 2
+
+
+def test_chunks_of_different_documents_stay_apart():
+    segments = _merge_segments(_ranked(_chunk("a", "d1", 0), _chunk("b", "d2", 1)))
+
+    assert sorted(s.document_id for s in segments) == ["d1", "d2"]
+
+
+def test_near_duplicates_keep_the_best_ranked():
+    text = "o contrato pode ser rescindido por qualquer das partes mediante aviso prévio de trinta dias"
+    kept = _dedupe([_chunk(text, "d1"), _chunk(text + " corridos", "d2"), _chunk("cláusula sobre multa", "d3")], 0.8)
+
+    assert [rank for rank, _ in kept] == [0, 2]
+
+
+def test_pack_context_fills_the_budget_by_relevance():
+    docs = [
+        _chunk("um dois três", "d1", 0),
+        _chunk("quatro cinco seis sete oito nove", "d2", 0),
+        _chunk("dez onze", "d3", 0),
+    ]
+
+    text, tokens, used = pack_context(docs, budget=5)
+
+    # O segundo não cabe; o terceiro, menos relevante, ainda cabe
+    assert "quatro" not in text
+    assert "um dois três" in text and "dez onze" in text
+    assert used == 2
+    assert tokens == len(text.split())
+
+
+def test_pack_context_groups_by_document_in_position_order():
+    docs = [
+        _chunk("trecho B2", "b", 5, source="b.pdf"),
+        _chunk("trecho A7", "a", 7, source="a.pdf"),
+        _chunk("trecho B1", "b", 1, source="b.pdf"),
+    ]
+
+    text, _, used = pack_context(docs, budget=100)
+
+    assert text == "[b.pdf]\n\ntrecho B1\n\ntrecho B2\n\n[a.pdf]\n\ntrecho A7"
+    assert used == 3
+
+
+def test_pack_history_keeps_the_most_recent_messages_in_order():
+    history = [
+        {"role": "user", "content": "primeira pergunta longa demais"},
+        {"role": "assistant", "content": "resposta"},
+        {"role": "user", "content": "nova pergunta"},
+    ]
+
+    text, tokens, used = pack_history(history, budget=5)
+
+    assert text == "Assistente: resposta\nUsuário: nova pergunta\n"
+    assert (tokens, used) == (5, 2)
+
+
+def test_pack_history_counts_the_summary_against_the_budget():
+    history = [{"role": "user", "content": "pergunta"}]
+
+    text, tokens, used = pack_history(history, budget=8, summary="tratamos do prazo")
+
+    assert text.startswith("Resumo da conversa até aqui: tratamos do prazo\n")
+    assert used == 0
+    assert tokens == 8
@@ -0,0 +1,131 @@
+"""
+Diff de chunks da substituição incremental (puro) e `replace_document_content`
+de ponta a ponta no banco, com embeddings falsos.
+"""
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from app.models.schemas import Document
+from app.services.ai.ingestion import (
+    chunk_hash,
+    diff_chunks,
+    process_document,
+    replace_document_content,
+)
+
+
+def _existing(chunks, ids=None):
+    ids = ids or [f"v{i}" for i in range(len(chunks))]
+    return [(row_id, chunk_hash(chunk), i) for i, (row_id, chunk) in enumerate(zip(ids, chunks))]
+
+
+def test_diff_unchanged_keeps_everything():
+    diff = diff_chunks(["a", "b", "c"], _existing(["a", "b", "c"]))
+
+    assert (diff.new, diff.moved, diff.vanished, diff.kept) == ([], [], [], 3)
+
+
+def test_diff_added_chunk_is_new_and_shifts_the_rest():
+    diff = diff_chunks(["a", "x", "b"], _existing(["a", "b"]))
+
+    assert diff.new == [1]
+    assert diff.moved == [("v1", 2)]
+    assert diff.vanished == []
+    assert diff.kept == 2
+
+
+def test_diff_removed_chunk_vanishes():
+    diff = diff_chunks(["a", "c"], _existing(["a", "b", "c"]))
+
+    assert diff.new == []
+    assert diff.vanished == ["v1"]
+    assert diff.moved == [("v2", 1)]
+    assert diff.kept == 2
+
+
+def test_diff_reordered_chunks_are_moved_not_reembedded():
+    diff = diff_chunks(["c", "a", "b"], _existing(["a", "b", "c"]))
+
+    assert diff.new == []
+    assert diff.vanished == []
+    assert sorted(diff.moved) == [("v0", 1), ("v1", 2), ("v2", 0)]
+
+
+def test_diff_repeated_chunks_match_one_to_one_in_order():
+    diff = diff_chunks(["a", "a", "a"], _existing(["a", "a"]))
+
+    assert diff.new == [2]
+    assert diff.moved == []
+    assert diff.kept == 2
+
+
+def _page(label: str) -> str:
+    return " ".join(f"{label} cláusula {i} do contrato." for i in range(25))
+
+
+def _vectors(db, doc_id):
+    rows = db.execute(
+        text("""
+            SELECT id, document, (cmetadata->>'chunk_index')::int AS chunk_index
+            FROM langchain_pg_embedding WHERE cmetadata->>'document_id' = :doc_id
+            ORDER BY chunk_index
+        """),
+        {"doc_id": str(doc_id)},
+    ).all()
+    db.rollback()
+    return rows
+
+
+@pytest.fixture
+def ingested(db, user, fake_embeddings, make_pdf):
+    path = make_pdf("v1.pdf", [_page("alfa"), _page("beta"), _page("gama")])
+    doc = Document(id=uuid.uuid4(), filename="contrato.pdf", status="pending", uploaded_by=user.id, file_path=path)
+    db.add(doc)
+    db.commit()
+    assert process_document(doc.id, path, raise_on_error=True, embedder=fake_embeddings) > 0
+    return doc
+
+
+class _CountingEmbeddings:
+    def __init__(self, underlying):
+        self.underlying = underlying
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return self.underlying.embed_documents(texts)
+
+
+def test_replace_reembeds_only_changed_pages(db, user, fake_embeddings, make_pdf, ingested):
+    before = {row.document: row.id for row in _vectors(db, ingested.id)}
+    path = make_pdf("v2.pdf", [_page("alfa"), _page("delta"), _page("gama")])
+    counting = _CountingEmbeddings(fake_embeddings)
+
+    chunks = replace_document_content(ingested.id, path, raise_on_error=True, embedder=counting)
+
+    after = _vectors(db, ingested.id)
+    assert len(after) == chunks
+    assert [row.chunk_index for row in after] == list(range(chunks))
+    assert counting.texts and all("delta" in t for t in counting.texts)
+    assert not any("beta" in row.document for row in after)
+    # Páginas inalteradas mantêm os vetores (mesmos ids)
+    for row in after:
+        if "delta" not in row.document:
+            assert before[row.document] == row.id
+
+    db.refresh(ingested)
+    assert ingested.status == "active"
+    assert ingested.file_path == path
+    assert ingested.ingestion_stage == "done"
+
+
+def test_replace_discarded_when_document_is_deleting(db, fake_embeddings, make_pdf, ingested):
+    before = _vectors(db, ingested.id)
+    ingested.status = "deleting"
+    db.commit()
+
+    path = make_pdf("v2.pdf", [_page("delta")])
+    assert replace_document_content(ingested.id, path, raise_on_error=True, embedder=fake_embeddings) == 0
+    assert _vectors(db, ingested.id) == before
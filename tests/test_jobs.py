@@ -0,0 +1,187 @@
+"""
+Semântica da fila de ingestão (`app.ingestion_jobs`) no banco: reivindicação
+com SKIP LOCKED, retomada de lock expirado, backoff, desistência após
+`max_attempts` e a recuperação de documentos presos sob advisory lock.
+"""
+import uuid
+
+import pytest
+from sqlalchemy import func, text, update
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.schemas import Document, IngestionJob
+from app.services.backend.jobs import (
+    claim_job,
+    complete_job,
+    enqueue_ingestion,
+    fail_job,
+    recover_stuck_documents,
+)
+
+
+@pytest.fixture
+def queue(db):
+    # A fila é global: cada teste começa com ela vazia (banco de testes descartável)
+    db.query(IngestionJob).delete()
+    db.commit()
+    return db
+
+
+@pytest.fixture
+def new_document(queue, user):
+    def create(status="pending", enqueue=True, **job_fields):
+        doc = Document(
+            id=uuid.uuid4(), filename="contrato.pdf", status=status, uploaded_by=user.id, file_path="/tmp/contrato.pdf"
+        )
+        queue.add(doc)
+        if enqueue:
+            enqueue_ingestion(queue, doc, **job_fields)
+        queue.commit()
+        return doc.id
+
+    return create
+
+
+def _job(db, doc_id):
+    job = db.query(IngestionJob).filter(IngestionJob.document_id == doc_id).one()
+    db.rollback()
+    return job
+
+
+def _document(db, doc_id):
+    doc = db.query(Document).filter(Document.id == doc_id).one()
+    db.rollback()
+    return doc
+
+
+def _expire_lock(db, job_id):
+    db.execute(
+        update(IngestionJob).where(IngestionJob.id == job_id).values(locked_until=func.now() - text("interval '1 second'"))
+    )
+    db.commit()
+
+
+def _make_due(db, job_id):
+    db.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(run_after=func.now()))
+    db.commit()
+
+
+def _seconds_until_run(db, job_id) -> float:
+    seconds = db.query(func.extract("epoch", IngestionJob.run_after - func.now())).filter(IngestionJob.id == job_id).scalar()
+    db.rollback()
+    return float(seconds)
+
+
+def test_claim_marks_job_running_and_document_processing(queue, new_document):
+    doc_id = new_document()
+
+    claimed = claim_job("w1", visibility_timeout=60)
+
+    assert claimed.document_id == doc_id
+    assert claimed.attempts == 1
+    job = _job(queue, doc_id)
+    assert (job.status, job.locked_by) == ("running", "w1")
+    assert _document(queue, doc_id).status == "processing"
+    assert claim_job("w2") is None
+
+
+def test_claim_skips_jobs_locked_by_another_transaction(queue, new_document):
+    first, second = new_document(), new_document()
+    other = SessionLocal()
+    try:
+        other.query(IngestionJob).filter(IngestionJob.document_id == first).with_for_update().one()
+
+        claimed = claim_job("w1")
+    finally:
+        other.close()
+
+    assert claimed.document_id == second
+
+
+def test_expired_lock_is_reclaimed_by_another_worker(queue, new_document):
+    doc_id = new_document()
+    first = claim_job("w1", visibility_timeout=60)
+    _expire_lock(queue, first.id)
+
+    second = claim_job("w2", visibility_timeout=60)
+
+    assert second.id == first.id
+    assert second.attempts == 2
+    # O worker antigo não consegue mais concluir o job
+    complete_job(first.id, "w1")
+    job = _job(queue, doc_id)
+    assert (job.status, job.locked_by) == ("running", "w2")
+
+
+def test_expired_lock_on_last_attempt_gives_up(queue, new_document):
+    doc_id = new_document(max_attempts=1)
+    claimed = claim_job("w1", visibility_timeout=60)
+    _expire_lock(queue, claimed.id)
+
+    assert claim_job("w2") is None
+
+    assert _job(queue, doc_id).status == "failed"
+    doc = _document(queue, doc_id)
+    assert (doc.status, doc.ingestion_stage) == ("error", "failed")
+
+
+def test_failures_back_off_exponentially_then_fail(queue, new_document):
+    backoff = settings.INGESTION_RETRY_BACKOFF_SECONDS
+    doc_id = new_document(max_attempts=3)
+
+    claimed = claim_job("w1")
+    fail_job(claimed.id, "w1", "timeout no embedding")
+    job = _job(queue, doc_id)
+    assert (job.status, job.last_error) == ("queued", "timeout no embedding")
+    assert backoff - 5 < _seconds_until_run(queue, claimed.id) <= backoff
+    assert _document(queue, doc_id).status == "pending"
+    # Ainda no backoff: não pode ser reivindicado
+    assert claim_job("w1") is None
+
+    _make_due(queue, claimed.id)
+    claimed = claim_job("w1")
+    assert claimed.attempts == 2
+    fail_job(claimed.id, "w1", "timeout no embedding")
+    assert 2 * backoff - 5 < _seconds_until_run(queue, claimed.id) <= 2 * backoff
+
+    _make_due(queue, claimed.id)
+    claimed = claim_job("w1")
+    fail_job(claimed.id, "w1", "timeout no embedding")
+    assert _job(queue, doc_id).status == "failed"
+    assert _document(queue, doc_id).status == "error"
+
+
+def test_failed_replace_keeps_the_document_active(queue, new_document):
+    doc_id = new_document(status="active", kind="replace", max_attempts=1)
+
+    claimed = claim_job("w1")
+    fail_job(claimed.id, "w1", "PDF corrompido")
+
+    doc = _document(queue, doc_id)
+    assert (doc.status, doc.ingestion_stage, doc.ingestion_error) == ("active", "failed", "PDF corrompido")
+
+
+def test_recover_requeues_documents_without_an_active_job(queue, new_document):
+    stuck = new_document(status="processing", enqueue=False)
+    queued = new_document()
+
+    assert recover_stuck_documents(queue) >= 1
+
+    assert _job(queue, stuck).status == "queued"
+    assert _document(queue, stuck).status == "pending"
+    # Quem já tinha job na fila não ganha outro
+    assert queue.query(IngestionJob).filter(IngestionJob.document_id == queued).count() == 1
+
+
+def test_recover_skips_while_another_worker_holds_the_lock(queue, new_document):
+    stuck = new_document(status="processing", enqueue=False)
+    other = SessionLocal()
+    try:
+        other.execute(text("SELECT pg_advisory_xact_lock(hashtext('app.recover_stuck_documents'))"))
+
+        assert recover_stuck_documents(queue) == 0
+    finally:
+        other.close()
+
+    assert queue.query(IngestionJob).filter(IngestionJob.document_id == stuck).count() == 0
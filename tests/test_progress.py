@@ -0,0 +1,83 @@
+"""
+Cálculo de progresso/ETA e de "terminou" usados por `GET /documents/{id}/status`
+e pelo stream de eventos (funções puras).
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.backend.progress import estimate_progress, is_finished
+
+STARTED = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _at(seconds: float) -> datetime:
+    return STARTED + timedelta(seconds=seconds)
+
+
+def test_queued_document_without_page_count_has_no_estimate():
+    assert estimate_progress(None, 0, None, None) == (None, None)
+    assert estimate_progress(0, 0, STARTED, STARTED) == (None, None)
+
+
+def test_extraction_not_started_has_progress_but_no_eta():
+    assert estimate_progress(10, 0, STARTED, _at(5), now=_at(5)) == (0.0, None)
+
+
+def test_eta_extrapolates_the_average_pace():
+    # 25 de 100 páginas em 30 s: faltam 75 páginas, ~90 s
+    progress, eta = estimate_progress(100, 25, STARTED, _at(30), now=_at(30))
+
+    assert progress == 0.25
+    assert eta == pytest.approx(90.0)
+
+
+def test_eta_discounts_the_time_since_the_last_update():
+    _, eta = estimate_progress(100, 25, STARTED, _at(30), now=_at(50))
+
+    assert eta == pytest.approx(70.0)
+
+
+def test_eta_never_goes_negative_when_the_worker_is_late():
+    _, eta = estimate_progress(100, 25, STARTED, _at(30), now=_at(600))
+
+    assert eta == 0.0
+
+
+def test_progress_without_timestamps_has_no_eta():
+    assert estimate_progress(4, 1, None, None) == (0.25, None)
+
+
+def test_finished_extraction_is_capped_at_one():
+    # pages_total vem do arquivo; uma contagem maior não passa de 100%
+    assert estimate_progress(10, 12, STARTED, _at(20), now=_at(20)) == (1.0, 0.0)
+
+
+@pytest.mark.parametrize("stage", ["queued", "extracting", "embedding"])
+def test_running_stages_are_not_finished(stage):
+    assert not is_finished("processing", stage)
+    assert not is_finished("pending", stage)
+
+
+def test_done_and_failed_stages_are_finished():
+    assert is_finished("active", "done")
+    assert is_finished("error", "failed")
+    # Substituição que falhou mantém o documento ativo
+    assert is_finished("active", "failed")
+
+
+def test_replacement_in_progress_is_not_finished():
+    assert not is_finished("active", "embedding")
+
+
+def test_deleting_is_finished_whatever_the_stage():
+    assert is_finished("deleting", "embedding")
+    assert is_finished("deleting", None)
+
+
+@pytest.mark.parametrize(
+    "status, finished",
+    [("active", True), ("error", True), ("pending", False), ("processing", False), ("importing", False)],
+)
+def test_documents_without_a_stage_fall_back_to_the_status(status, finished):
+    assert is_finished(status, None) is finished
@@ -0,0 +1,146 @@
+"""
+Verificação local de JWT contra um JWKS servido por um HTTP local, com uma
+chave RSA gerada no teste (sem Keycloak).
+
+    uv run --group dev pytest tests/test_security.py
+"""
+import json
+import time
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from jose import jwt, JWTError
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.core import security
+from app.core.cache import TTLCache
+
+ISSUER = "http://keycloak.test/realms/DocVault"
+KID = "test-key"
+
+
+def _b64url_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    numbers = key.public_key().public_numbers()
+    jwk = {"kid": KID, "kty": "RSA", "alg": "RS256", "use": "sig", "n": _b64url_uint(numbers.n), "e": _b64url_uint(numbers.e)}
+    return pem, jwk
+
+
+class _JWKSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, jwk: dict):
+        self.jwk = jwk
+        self.requests = 0
+        self.available = True
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(handler):
+                self.requests += 1
+                if not self.available:
+                    handler.send_response(503)
+                    handler.end_headers()
+                    return
+                body = json.dumps({"keys": [self.jwk]}).encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "application/json")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/certs"
+
+
+@pytest.fixture
+def jwks_server(rsa_key):
+    server = _JWKSServer(rsa_key[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def verifier(jwks_server, monkeypatch):
+    """Aponta o módulo de segurança para o JWKS local, com caches novos."""
+    cache = security.JWKSCache(jwks_server.url, refresh_seconds=300, min_refetch_seconds=10, timeout=1)
+    monkeypatch.setattr(security, "jwks_cache", cache)
+    monkeypatch.setattr(security, "token_cache", TTLCache(60, 100))
+    monkeypatch.setattr(security.settings, "KEYCLOAK_ISSUER", ISSUER)
+    monkeypatch.setattr(security.settings, "KEYCLOAK_AUDIENCE", "")
+    return cache
+
+
+def _token(pem: bytes, sub: str = "00000000-0000-0000-0000-000000000001", **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        "sub": sub,
+        "preferred_username": "ana@example.com",
+        "iss": ISSUER,
+        "iat": now,
+        "exp": now + 300,
+        "realm_access": {"roles": ["admin"]},
+        **overrides,
+    }
+    return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": KID})
+
+
+def test_valid_token_is_verified_and_cached(rsa_key, jwks_server, verifier):
+    token = _token(rsa_key[0])
+
+    user = security.verify_token_locally(token)
+
+    assert user.username == "ana@example.com"
+    assert user.roles == ["admin"]
+    assert security.get_cached_token_user(token) == user
+    assert jwks_server.requests == 1
+
+
+def test_expired_token_is_rejected(rsa_key, verifier):
+    with pytest.raises(JWTError):
+        security.verify_token_locally(_token(rsa_key[0], exp=int(time.time()) - 10))
+
+
+def test_wrong_issuer_is_rejected(rsa_key, verifier):
+    with pytest.raises(JWTError):
+        security.verify_token_locally(_token(rsa_key[0], iss="http://outro/realms/x"))
+
+
+def test_algorithm_from_token_header_is_ignored(verifier):
+    # Assinado com HS256 e o kid certo: o algoritmo vem da allow-list, não do header
+    forged = jwt.encode(
+        {"sub": "x", "iss": ISSUER, "exp": int(time.time()) + 300}, "segredo", algorithm="HS256", headers={"kid": KID}
+    )
+    with pytest.raises(JWTError):
+        security.verify_token_locally(forged)
+
+
+def test_refresh_failure_keeps_cached_keys_and_backs_off(rsa_key, jwks_server, verifier):
+    security.verify_token_locally(_token(rsa_key[0], sub="00000000-0000-0000-0000-000000000001"))
+    assert jwks_server.requests == 1
+
+    # Keycloak fora e JWKS vencido: as chaves em cache continuam valendo
+    jwks_server.available = False
+    verifier.refresh_seconds = 0
+    for i in range(5):
+        user = security.verify_token_locally(_token(rsa_key[0], sub=f"00000000-0000-0000-0000-00000000001{i}"))
+        assert user.id.endswith(str(i))
+
+    # Só uma tentativa de refresh dentro da janela de backoff
+    assert jwks_server.requests == 2
@@ -0,0 +1,33 @@
+"""
+Importar `app.main` não pode carregar clientes pesados (OpenAI, Keycloak,
+PGVector, tiktoken, PyMuPDF): eles ficam para o primeiro uso. Roda num
+subprocesso limpo, com banco e rede inalcançáveis, como `benchmarks.bench_startup`.
+"""
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+from benchmarks.bench_startup import LAZY_MODULES, OFFLINE_ENV
+
+CHECK = f"""
+import sys, json
+import app.main
+lazy = {LAZY_MODULES!r}
+print(json.dumps(sorted({{name.split(".")[0] for name in sys.modules}} & set(lazy))))
+"""
+
+
+def test_importing_the_api_does_not_load_lazy_clients():
+    proc = subprocess.run(
+        [sys.executable, "-c", CHECK],
+        env={**os.environ, **OFFLINE_ENV},
+        cwd=Path(__file__).resolve().parent.parent,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    assert json.loads(proc.stdout.strip().splitlines()[-1]) == []